@@ -1,111 +1,101 @@
 import os
 import json
+import time
 import logging
-from statistical_functions import ForexStats
-from mt5_data import get_data
-from constants import WINDOW_LENGTH
+from rolling_stats import rolling_forex_stats
+from pnl_simulator import simulate_pair, TRADE_FIELDS
+from broker import timeframe_seconds
+from backtest_io import save_results
+from report import pair_figure, write_index
+from log_config import setup_logging
+from mt5_data import get_prices, get_spread, get_point
+from constants import (WINDOW_LENGTH, ENTRY_ZSCORE, EXIT_ZSCORE, STOP_ZSCORE, COMMISSION_RATE, RESULTS_FORMAT,
+                       REPORT_MAX_POINTS, HEDGE_MODEL)
 import pandas as pd
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import numpy as np
 
 # Initialize logger
 logger = logging.getLogger(__name__)
 
-# Define output subfolder
-output_folder = 'output_folder'
-os.makedirs(output_folder, exist_ok=True)
-
-# Load the pair list from the json file
-with open('pairs_corr.json', 'r') as file:
-    pairs = json.load(file)
-
-# Iterate over all pairs
-for pair in pairs:
-    logger.info(f'Processing pair: {pair}')
-
-    # Get the data for the current pair
-    data = get_data(pair, 5, 28800 + WINDOW_LENGTH, 'close', 'dataframe')
-
-    # Perform the analysis for every window of close prices
-    results_list = []
-    for i in range(WINDOW_LENGTH, len(data)):
-        # Get the close prices for the current window
-        window_data = data.iloc[i-WINDOW_LENGTH:i]
-
-        # Convert the close prices to numpy arrays
-        arr1 = np.array(window_data.iloc[:, 0])
-        arr2 = np.array(window_data.iloc[:, 1])
-
-        # Initialize the ForexStats class with the data
-        forex_stats = ForexStats(arr1, arr2)
-
-        # Calculate the spread and z-score
-        spread = forex_stats.calculate_spread()
-        z_score = forex_stats.calculate_zscore()
-        z_score_rolling = forex_stats.calculate_zscore_rolling()
-
-        # Calculate the other statistical values and append all to the results DataFrame
-        results_list.append([
-            window_data.index[-1],
-            arr1[-1],
-            arr2[-1],
-            forex_stats.calculate_correlation(),
-            forex_stats.check_cointegration(),
-            spread[-1],
-            z_score[-1],
-            z_score_rolling[-1],
-            forex_stats.calculate_half_life(),
-            forex_stats.calculate_hedge_ratio()
-        ])
-
-    # Convert results to DataFrame
-    results = pd.DataFrame(results_list, columns=[
-        'Date', f'{pair[0]} Close', f'{pair[1]} Close', 'Correlation', 'Is Cointegrated',
-        'Spread', 'Z-Score', 'Z-Score Rolling', 'Half-Life', 'Hedge Ratio']).set_index('Date')
-
-    # Save the current results to a CSV file
-    results.to_csv(os.path.join(
-        output_folder, f'{pair[0]}_{pair[1]}_backtest_results.csv'))
-    logger.info(f'Saved results to {output_folder}/{pair[0]}_{pair[1]}_backtest_results.csv')
-
-    # Create subplot layout
-    fig = make_subplots(
-        rows=9,
-        cols=1,
-        shared_xaxes=True,
-        subplot_titles=(f'{pair[0]} Close', f'{pair[1]} Close', 'Correlation',
-                        'Is Cointegrated', 'Spread', 'Z-Score', 'Z-Score Rolling',
-                        'Half-Life', 'Hedge Ratio'),
-        vertical_spacing=0.05)
-
-    # Add traces
-    for i, column in enumerate(results.columns):
-        fig.add_trace(go.Scatter(x=results.index,
-                      y=results[column], name=column), row=i+1, col=1)
-
-    # Add horizontal lines at z-score levels -2, 0, +2
-    fig.add_shape(
-        type="line", line=dict(dash='dash'),
-        xref="paper", yref="y6",
-        x0=0, y0=-2, x1=1, y1=-2,
-    )
-    fig.add_shape(
-        type="line", line=dict(dash='dash'),
-        xref="paper", yref="y6",
-        x0=0, y0=0, x1=1, y1=0,
-    )
-    fig.add_shape(
-        type="line", line=dict(dash='dash'),
-        xref="paper", yref="y6",
-        x0=0, y0=2, x1=1, y1=2,
-    )
-
-    # Update layout
-    fig.update_layout(
-        height=2500, title_text=f"{pair[0]} and {pair[1]} Backtest Results", showlegend=False)
-
-    # Save to HTML
-    fig.write_html(os.path.join(
-        output_folder, f'{pair[0]}_{pair[1]}_backtest_results.html'))
-    logger.info(f'Saved HTML to {output_folder}/{pair[0]}_{pair[1]}_backtest_results.html')
+
+def run_backtest(pairs_file='pairs_corr.json', output_root='output_folder', bars=28800, hedge_model=HEDGE_MODEL):
+    """
+    Backtest every pair of a pair list on its latest bars, and save the results, the simulated trades and a
+    report page in a new timestamped folder.
+
+    :param pairs_file: A string representing the path of the JSON pair list. Default is 'pairs_corr.json'.
+    :param output_root: A string representing the folder the run folder is created in. Default is 'output_folder'.
+    :param bars: An integer representing the number of bars backtested per pair. Default is 28800.
+    :param hedge_model: 'ols' or 'kalman', see rolling_forex_stats. Default is HEDGE_MODEL.
+    :return: A string representing the path of the run folder.
+    """
+    # Define output subfolder, one per run
+    output_folder = os.path.join(output_root, time.strftime('%Y%m%d-%H%M%S'))
+    os.makedirs(output_folder, exist_ok=True)
+
+    # Load the pair list from the json file
+    with open(pairs_file, 'r') as file:
+        pairs = json.load(file)
+
+    # Bars in a year of 252 trading days, for the Sharpe ratio and turnover
+    periods_per_year = 252 * 86400 / timeframe_seconds(5)
+    summaries = []
+    figures = []
+
+    # Iterate over all pairs
+    for pair in pairs:
+        logger.info(f'Processing pair: {pair}')
+
+        # Get the data for the current pair
+        times, close = get_prices(pair, 5, bars + WINDOW_LENGTH, 'close')
+
+        # Perform the analysis for every window of close prices in one vectorized pass. The window ending
+        # on the last bar is left out, as it has always been.
+        rolling = rolling_forex_stats(close[:-1, 0], close[:-1, 1], WINDOW_LENGTH, hedge_model=hedge_model)
+        window_end = slice(WINDOW_LENGTH - 1, len(times) - 1)
+
+        # Trade the spread on the z-score, entering only while the pair is cointegrated, and charge the
+        # current broker spread of each symbol plus commission
+        costs = [get_spread(symbol) * get_point(symbol) for symbol in pair]
+        simulation = simulate_pair(
+            times[window_end], close[window_end, 0], close[window_end, 1], rolling['zscore'], rolling['hedge_ratio'],
+            ENTRY_ZSCORE, EXIT_ZSCORE, STOP_ZSCORE, rolling['is_cointegrated'], costs[0], costs[1], COMMISSION_RATE,
+            periods_per_year)
+        summaries.append({'pair': f'{pair[0]}_{pair[1]}', **simulation['summary']})
+
+        # Convert results to DataFrame
+        results = pd.DataFrame({
+            'Date': pd.to_datetime(times[window_end], unit='s'),
+            f'{pair[0]} Close': close[window_end, 0],
+            f'{pair[1]} Close': close[window_end, 1],
+            'Correlation': rolling['correlation'],
+            'Is Cointegrated': rolling['is_cointegrated'],
+            'Spread': rolling['spread'],
+            'Z-Score': rolling['zscore'],
+            'Z-Score Rolling': rolling['zscore_rolling'],
+            'Half-Life': rolling['half_life'],
+            'Hedge Ratio': rolling['hedge_ratio'],
+            'Position': simulation['position'],
+            'Equity': simulation['equity']}).set_index('Date')
+
+        # Save the current results and the simulated trades in a columnar format
+        path = save_results(results, os.path.join(output_folder, f'{pair[0]}_{pair[1]}_backtest_results'),
+                            RESULTS_FORMAT)
+        logger.info(f'Saved results to {path}')
+        save_results(pd.DataFrame(simulation['trades'], columns=TRADE_FIELDS),
+                     os.path.join(output_folder, f'{pair[0]}_{pair[1]}_trades'), RESULTS_FORMAT)
+
+        # Plot a downsampled copy of every trace for the run's report
+        figures.append((f'{pair[0]}_{pair[1]}', pair_figure(results, pair, REPORT_MAX_POINTS)))
+
+    # Save the summary statistics of every pair, and the report page of the run
+    summary = pd.DataFrame(summaries)
+    summary.to_csv(os.path.join(output_folder, 'backtest_summary.csv'), index=False)
+    logger.info(f'Saved summary to {output_folder}/backtest_summary.csv')
+    write_index(output_folder, summary, figures)
+    return output_folder
+
+
+if __name__ == "__main__":
+    setup_logging(filename=None)
+    run_backtest()
@@ -0,0 +1,120 @@
+import os
+import logging
+import importlib.util
+import numpy as np
+import pandas as pd
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Formats save_results can write, the first two need pyarrow
+RESULTS_FORMATS = ('parquet', 'feather', 'npz')
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Pick the points of a series that best keep its shape with Largest-Triangle-Three-Buckets. The first and
+    last points are kept, and every bucket in between keeps the point forming the largest triangle with the
+    point kept in the previous bucket and the average of the next bucket.
+
+    :param x: A 1-D numpy array of increasing x values.
+    :param y: A 1-D numpy array of y values.
+    :param n_out: An integer representing the number of points to keep.
+    :return: A 1-D numpy array of the indices of the kept points, in increasing order.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # Bucket k covers [edges[k], edges[k + 1]), the last point forms a bucket of its own
+    edges = np.concatenate((np.floor(np.arange(n_out - 1) * (n - 2) / (n_out - 2)).astype(np.int64) + 1, [n]))
+    sum_x = np.concatenate(([0.0], np.cumsum(x)))
+    sum_y = np.concatenate(([0.0], np.cumsum(y)))
+    counts = edges[1:] - edges[:-1]
+    mean_x = (sum_x[edges[1:]] - sum_x[edges[:-1]]) / counts
+    mean_y = (sum_y[edges[1:]] - sum_y[edges[:-1]]) / counts
+
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for k in range(n_out - 2):
+        start, stop = edges[k], edges[k + 1]
+        area = np.abs((x[a] - mean_x[k + 1]) * (y[start:stop] - y[a])
+                      - (x[a] - x[start:stop]) * (mean_y[k + 1] - y[a]))
+        a = start + int(np.argmax(area))
+        kept[k + 1] = a
+    return kept
+
+
+def downsample(x: np.ndarray, y: np.ndarray, max_points: int) -> tuple:
+    """
+    Downsample a series for plotting with lttb, leaving out its missing values.
+
+    :return: A tuple (x, y) of 1-D numpy arrays of at most max_points points.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.flatnonzero(np.isfinite(y))
+    x_numeric = np.asarray(x).astype(np.int64) if np.issubdtype(np.asarray(x).dtype, np.datetime64) else np.asarray(x)
+    kept = finite[lttb(x_numeric[finite], y[finite], max_points)]
+    return np.asarray(x)[kept], y[kept]
+
+
+def results_format(fmt: str) -> str:
+    """
+    :return: A string representing the format save_results will actually use: the requested one, or 'npz'
+             when pyarrow is not installed.
+    """
+    if fmt not in RESULTS_FORMATS:
+        raise ValueError(f"fmt argument must be one of {RESULTS_FORMATS}")
+    if fmt != 'npz' and importlib.util.find_spec('pyarrow') is None:
+        logger.warning(f"pyarrow is not installed, saving results as npz instead of {fmt}")
+        return 'npz'
+    return fmt
+
+
+def save_results(frame: pd.DataFrame, path: str, fmt: str = 'parquet') -> str:
+    """
+    Save a DataFrame in a typed columnar format, keeping its index.
+
+    :param frame: The pandas DataFrame.
+    :param path: A string representing the file path without its extension.
+    :param fmt: A string, one of RESULTS_FORMATS. Default is 'parquet'.
+    :return: A string representing the path of the written file.
+    """
+    fmt = results_format(fmt)
+    path = f'{path}.{fmt}'
+    if fmt == 'parquet':
+        frame.to_parquet(path)
+    elif fmt == 'feather':
+        frame.reset_index().to_feather(path)
+    else:
+        # One array per column, with the column order and index name kept alongside
+        arrays = {f'column_{k}': frame[column].to_numpy() for k, column in enumerate(frame.columns)}
+        # Text columns as fixed-width strings, so they load back without pickle
+        arrays = {key: values.astype(str) if values.dtype == object else values for key, values in arrays.items()}
+        np.savez(path, columns=np.array(frame.columns, dtype=str), index=frame.index.to_numpy(),
+                 index_name=np.array(frame.index.name or ''), **arrays)
+    return path
+
+
+def load_results(path: str) -> pd.DataFrame:
+    """
+    Load a DataFrame written by save_results.
+
+    :param path: A string representing the path of the file, its extension telling the format.
+    :return: The pandas DataFrame.
+    """
+    fmt = os.path.splitext(path)[1][1:]
+    if fmt == 'parquet':
+        return pd.read_parquet(path)
+    if fmt == 'feather':
+        frame = pd.read_feather(path)
+        return frame.set_index(frame.columns[0])
+    with np.load(path, allow_pickle=False) as data:
+        columns = data['columns'].tolist()
+        frame = pd.DataFrame({column: data[f'column_{k}'] for k, column in enumerate(columns)},
+                             index=data['index'])
+        frame.index.name = str(data['index_name']) or None
+    return frame
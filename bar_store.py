@@ -0,0 +1,132 @@
+import os
+import logging
+import numpy as np
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Record layout of the arrays returned by MetaTrader5.copy_rates_from_pos
+RATES_DTYPE = np.dtype([
+    ('time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'),
+    ('tick_volume', '<u8'), ('spread', '<i4'), ('real_volume', '<u8')])
+
+
+class BarStore:
+    def __init__(self, directory: str, terminal, probe: int = 16, max_bars: int = None) -> None:
+        """
+        Initialize a persistent bar store. Bars are kept per symbol and timeframe in a flat binary file of
+        RATES_DTYPE records, read back through np.memmap, and only the bars newer than the last stored one
+        are downloaded from the terminal.
+
+        :param directory: A string representing the folder the bar files are kept in.
+        :param terminal: The MetaTrader5 module, or any object with the same copy_rates_from_pos function.
+        :param probe: An integer representing how many bars are requested first when topping up a file. The
+                      request doubles until it reaches back to the stored bars. Default is 16.
+        :param max_bars: An optional integer; files are trimmed to the newest max_bars bars once they grow to
+                         twice that size.
+        """
+        self.directory = directory
+        self.terminal = terminal
+        self.probe = probe
+        self.max_bars = max_bars
+        self.stats = {'hits': 0, 'misses': 0, 'bars_fetched': 0, 'bars_served': 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, symbol: str, timeframe: int) -> str:
+        return os.path.join(self.directory, f'{symbol}_{timeframe}.bin')
+
+    def stored_count(self, symbol: str, timeframe: int) -> int:
+        """
+        :return: An integer representing the number of bars stored for the symbol and timeframe.
+        """
+        path = self.path(symbol, timeframe)
+        return os.path.getsize(path) // RATES_DTYPE.itemsize if os.path.exists(path) else 0
+
+    def read(self, symbol: str, timeframe: int, count: int) -> np.ndarray:
+        """
+        Read the newest bars from the local file, without contacting the terminal. Only the pages holding
+        those bars are loaded, and the mapping is released before returning.
+
+        :return: A structured numpy array of at most `count` bars, oldest first.
+        """
+        stored = self.stored_count(symbol, timeframe)
+        if not stored or count <= 0:
+            return np.empty(0, dtype=RATES_DTYPE)
+        bars = np.memmap(self.path(symbol, timeframe), dtype=RATES_DTYPE, mode='r', shape=(stored,))
+        tail = np.array(bars[-count:])
+        del bars
+        return tail
+
+    def _write(self, symbol: str, timeframe: int, rates: np.ndarray, keep: int = 0) -> None:
+        # Keep the first `keep` stored bars and append `rates` after them
+        path = self.path(symbol, timeframe)
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as file:
+            file.truncate(keep * RATES_DTYPE.itemsize)
+            file.seek(0, os.SEEK_END)
+            file.write(np.ascontiguousarray(rates, dtype=RATES_DTYPE).tobytes())
+
+        if self.max_bars and keep + len(rates) >= 2 * self.max_bars:
+            newest = self.read(symbol, timeframe, self.max_bars)
+            self._write(symbol, timeframe, newest)
+
+    def _fetch(self, symbol: str, timeframe: int, count: int) -> np.ndarray:
+        rates = self.terminal.copy_rates_from_pos(symbol, timeframe, 0, count)
+        if rates is None:
+            return None
+        self.stats['bars_fetched'] += len(rates)
+        return np.asarray(rates).astype(RATES_DTYPE)
+
+    def sync(self, symbol: str, timeframe: int, count: int) -> bool:
+        """
+        Make sure the store holds the newest `count` bars of the symbol. When it already holds at least that
+        many, only the bars from the last stored one onwards are downloaded (the last stored bar may have been
+        the still-forming candle, so it is replaced). Otherwise the full history is downloaded again.
+
+        :return: A boolean value. False if the terminal did not return any rates.
+        """
+        stored = self.stored_count(symbol, timeframe)
+        if stored >= count:
+            last_time = self.read(symbol, timeframe, 1)['time'][0]
+            size = self.probe
+            while True:
+                rates = self._fetch(symbol, timeframe, min(size, count))
+                if rates is None:
+                    logger.error(f"Failed to update rates for {symbol} {timeframe}")
+                    return False
+                reaches_back = len(rates) and rates['time'][0] <= last_time
+                if reaches_back or len(rates) < min(size, count) or size >= count:
+                    break
+                size *= 2
+
+            # Bars older than the stored ones only, e.g. after switching servers: refetch everything
+            new = rates[rates['time'] >= last_time] if reaches_back else rates[:0]
+            if len(new):
+                self.stats['hits'] += 1
+                # Drop the stored bars the new ones replace, usually just the last one
+                times = self.read(symbol, timeframe, len(new) + 1)['time']
+                replaced = len(times) - np.searchsorted(times, new['time'][0])
+                self._write(symbol, timeframe, new, keep=stored - replaced)
+                return True
+
+        # Nothing usable in the store, or the gap is wider than the request: download everything
+        self.stats['misses'] += 1
+        rates = self._fetch(symbol, timeframe, count)
+        if rates is None or not len(rates):
+            logger.error(f"Failed to get rates for {symbol} {timeframe}")
+            return False
+        self._write(symbol, timeframe, rates)
+        return True
+
+    def copy_rates_from_pos(self, symbol: str, timeframe: int, start_pos: int, count: int) -> np.ndarray:
+        """
+        Drop-in replacement for MetaTrader5.copy_rates_from_pos served from the store.
+
+        :return: A structured numpy array of bars, oldest first, or None if the terminal could not be reached
+                 and nothing is stored.
+        """
+        if not self.sync(symbol, timeframe, start_pos + count) and not self.stored_count(symbol, timeframe):
+            return None
+        rates = self.read(symbol, timeframe, start_pos + count)
+        rates = rates[:len(rates) - start_pos]
+        self.stats['bars_served'] += len(rates)
+        return rates
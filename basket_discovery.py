@@ -0,0 +1,214 @@
+import logging
+import functools
+import itertools
+import numpy as np
+from constants import BASKET_SIZES, BASKET_K_AR_DIFF, BASKET_SIGNIFICANCE, MAX_HALF_LIFE
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Baskets tested per block, bounds the memory of the stacked moment matrices
+BLOCK_SIZE = 8192
+
+# Columns of the Johansen critical value tables
+SIGNIFICANCE_LEVELS = (0.1, 0.05, 0.01)
+
+
+@functools.lru_cache(maxsize=None)
+def _trace_critical_values(n_vars: int, significance: float) -> np.ndarray:
+    # Critical values of the trace statistic for ranks 0 to n_vars - 1 with a constant term, as
+    # statsmodels.coint_johansen with det_order=0; loaded on first use, as importing statsmodels is slow
+    from statsmodels.tsa.coint_tables import c_sjt
+
+    column = SIGNIFICANCE_LEVELS.index(significance)
+    return np.array([c_sjt(n_vars - rank, 0)[column] for rank in range(n_vars)])
+
+
+def candidate_baskets(symbols: list, sizes: tuple = BASKET_SIZES, shared_quote: bool = False) -> dict:
+    """
+    Enumerate the baskets of a symbol universe.
+
+    :param symbols: A list with the name of every symbol, in column order.
+    :param sizes: A tuple with the number of symbols of a basket. Default is BASKET_SIZES.
+    :param shared_quote: A boolean, True to only keep baskets whose symbols share their quote currency, such as
+                         EURJPY/GBPJPY/CHFJPY. Default is False.
+    :return: A dictionary mapping every size to a 2-D numpy array of column indices, one basket per row.
+    """
+    baskets = {}
+    for size in sizes:
+        if shared_quote:
+            groups = {}
+            for column, symbol in enumerate(symbols):
+                groups.setdefault(symbol[3:6], []).append(column)
+            combinations = [basket for columns in groups.values() for basket in itertools.combinations(columns, size)]
+        else:
+            combinations = list(itertools.combinations(range(len(symbols)), size))
+        baskets[size] = np.array(combinations, dtype=np.intp).reshape(-1, size)
+    return baskets
+
+
+def _inverse_factor(matrices: np.ndarray) -> np.ndarray:
+    """
+    Calculate, for a stack of symmetric positive definite matrices M, a factor F with F M F' = I and
+    F' F = M^-1: the inverse of the Cholesky factor. When a matrix of the stack is singular, the inverse
+    square root is used instead, which gives NaN for that matrix rather than failing its whole block.
+    """
+    try:
+        return np.linalg.inv(np.linalg.cholesky(matrices))
+    except np.linalg.LinAlgError:
+        # eigh fails the whole stack on a NaN too, so those matrices are swapped for the identity first
+        finite = np.isfinite(matrices).all(axis=(1, 2))
+        matrices = np.where(finite[:, None, None], matrices, np.eye(matrices.shape[-1]))
+        eigenvalues, eigenvectors = np.linalg.eigh(matrices)
+        tolerance = matrices.shape[-1] * np.finfo(np.float64).eps * np.abs(eigenvalues).max(axis=1, keepdims=True)
+        regular = (eigenvalues > tolerance).all(axis=1) & finite
+        scale = np.where(regular[:, None], 1 / np.sqrt(np.where(regular[:, None], eigenvalues, 1)), np.nan)
+        return (eigenvectors * scale[:, None, :]) @ np.swapaxes(eigenvectors, 1, 2)
+
+
+def _moments(prices: np.ndarray, k_ar_diff: int) -> tuple:
+    """
+    Calculate the covariance matrix of the differences, lagged levels and lagged differences of every symbol of
+    the universe at once, in the sample statsmodels.coint_johansen uses. The moments of a basket are then a
+    sub-block of it.
+
+    :return: A tuple (covariance, nobs) with covariance of shape (N * (2 + k_ar_diff), N * (2 + k_ar_diff)).
+    """
+    diff = np.diff(prices, axis=0)
+    nobs = len(diff) - k_ar_diff
+    columns = [diff[k_ar_diff:], prices[1:len(prices) - k_ar_diff]]
+    columns += [diff[k_ar_diff - lag:len(diff) - lag] for lag in range(1, k_ar_diff + 1)]
+    stacked = np.hstack(columns)
+    stacked -= stacked.mean(axis=0)
+    return stacked.T @ stacked / nobs, nobs
+
+
+def batched_johansen(prices: np.ndarray, baskets: np.ndarray, k_ar_diff: int = BASKET_K_AR_DIFF,
+                     significance: float = BASKET_SIGNIFICANCE, moments: tuple = None) -> dict:
+    """
+    Run the Johansen cointegration test with a constant term on many baskets of the same size at once. The
+    moment matrices of all baskets are gathered from the covariance of the universe and reduced with stacked
+    linear algebra, so the cost per basket is a handful of small matrix products. Equivalent to
+    statsmodels.coint_johansen(prices[:, basket], 0, k_ar_diff) for every basket.
+
+    :param prices: A 2-D numpy array of aligned prices, one row per bar and one column per symbol.
+    :param baskets: A 2-D numpy array of column indices of prices, one basket per row.
+    :param k_ar_diff: An integer representing the number of lagged differences in the model. Default is BASKET_K_AR_DIFF.
+    :param significance: A float, 0.1, 0.05 or 0.01, the significance of the trace test. Default is BASKET_SIGNIFICANCE.
+    :param moments: An optional tuple returned by _moments for prices, to share it between calls.
+    :return: A dictionary of numpy arrays, one row per basket:
+             - 'eigenvalues': the eigenvalues in decreasing order, shape (baskets, size);
+             - 'weights': the cointegrating vector of the largest eigenvalue, scaled so the first weight is 1;
+             - 'trace_stat': the trace statistics for ranks 0 to size - 1;
+             - 'critical_value': the critical values of the trace test for those ranks;
+             - 'rank': the number of cointegrating relations found.
+    """
+    baskets = np.asarray(baskets, dtype=np.intp)
+    n_baskets, size = baskets.shape
+    n_symbols = prices.shape[1]
+    covariance, nobs = moments if moments is not None else _moments(prices, k_ar_diff)
+
+    # Rows of the universe covariance that belong to every basket: differences, levels, then lagged differences
+    index = np.hstack([baskets + block * n_symbols for block in range(2 + k_ar_diff)])
+    gathered = covariance[index[:, :, None], index[:, None, :]]
+
+    # Partial the lagged differences out of the differences and levels
+    moment = gathered[:, :2 * size, :2 * size]
+    if k_ar_diff:
+        cross = gathered[:, 2 * size:, :2 * size]
+        reduced = _inverse_factor(gathered[:, 2 * size:, 2 * size:]) @ cross
+        moment = moment - np.swapaxes(reduced, 1, 2) @ reduced
+    s00, s01, s11 = moment[:, :size, :size], moment[:, :size, size:], moment[:, size:, size:]
+
+    # Eigenvalues of S11^-1 S10 S00^-1 S01, through the symmetric form F11 S10 S00^-1 S01 F11'
+    factor00, factor11 = _inverse_factor(s00), _inverse_factor(s11)
+    half = factor11 @ np.swapaxes(s01, 1, 2) @ np.swapaxes(factor00, 1, 2)
+    # Degenerate baskets, NaN from _inverse_factor, are zeroed for eigh and their results set to NaN after
+    degenerate = ~np.isfinite(half).all(axis=(1, 2))
+    half[degenerate] = 0
+    eigenvalues, eigenvectors = np.linalg.eigh(half @ np.swapaxes(half, 1, 2))
+    eigenvalues, eigenvectors = eigenvalues[:, ::-1], eigenvectors[:, :, ::-1]
+    eigenvalues[degenerate] = np.nan
+    vectors = np.swapaxes(factor11, 1, 2) @ eigenvectors
+    vectors[degenerate] = np.nan
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = vectors[:, :, 0] / vectors[:, :1, 0]
+        trace_stat = -nobs * np.cumsum(np.log1p(-eigenvalues)[:, ::-1], axis=1)[:, ::-1]
+    critical_value = np.broadcast_to(_trace_critical_values(size, significance), (n_baskets, size))
+    rank = np.cumprod(trace_stat > critical_value, axis=1).sum(axis=1)
+    return {
+        'eigenvalues': eigenvalues,
+        'weights': weights,
+        'trace_stat': trace_stat,
+        'critical_value': critical_value,
+        'rank': rank,
+    }
+
+
+def basket_half_life(prices: np.ndarray, baskets: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Calculate the half-life of the spread of many baskets at once, with the same regression of the spread change
+    on the lagged spread as ForexStats, without the wrap-around of its first bar. The regression only needs the
+    covariances of the universe, so no basket spread is ever built.
+
+    :param prices: A 2-D numpy array of aligned prices, one row per bar and one column per symbol.
+    :param baskets: A 2-D numpy array of column indices of prices, one basket per row.
+    :param weights: A 2-D numpy array with the weights of every basket, in the same order.
+    :return: A 1-D numpy array of half-lives, one per basket.
+    """
+    diff = np.diff(prices, axis=0)
+    lagged = prices[:-1] - prices[:-1].mean(axis=0)
+    cross = lagged.T @ diff
+    variance = lagged.T @ lagged
+
+    rows, columns = baskets[:, :, None], baskets[:, None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (np.einsum('bi,bij,bj->b', weights, cross[rows, columns], weights)
+                 / np.einsum('bi,bij,bj->b', weights, variance[rows, columns], weights))
+        return -np.log(2) / slope
+
+
+def discover_baskets(symbols: list, prices: np.ndarray, sizes: tuple = BASKET_SIZES, baskets: dict = None,
+                     k_ar_diff: int = BASKET_K_AR_DIFF, significance: float = BASKET_SIGNIFICANCE,
+                     max_half_life: float = MAX_HALF_LIFE) -> list:
+    """
+    Find the cointegrated baskets of a symbol universe: every basket goes through the batched Johansen trace
+    test, and those with at least one cointegrating relation and a spread half-life within max_half_life are
+    kept.
+
+    :param symbols: A list with the name of every symbol, in column order.
+    :param prices: A 2-D numpy array of aligned prices, one row per bar and one column per symbol.
+    :param sizes: A tuple with the number of symbols of a basket. Default is BASKET_SIZES.
+    :param baskets: An optional dictionary returned by candidate_baskets, to test only those baskets. Default
+                    is every combination of sizes symbols.
+    :param k_ar_diff: An integer representing the number of lagged differences in the model. Default is BASKET_K_AR_DIFF.
+    :param significance: A float, 0.1, 0.05 or 0.01, the significance of the trace test. Default is BASKET_SIGNIFICANCE.
+    :param max_half_life: A float representing the longest accepted half-life, in bars. Default is MAX_HALF_LIFE.
+    :return: A list of dictionaries with the basket, weights, trace statistic, critical value, rank and half-life
+             of every accepted basket, ranked by how far the trace statistic exceeds its critical value.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    if baskets is None:
+        baskets = candidate_baskets(symbols, sizes)
+    moments = _moments(prices, k_ar_diff)
+
+    accepted = []
+    for size, indices in baskets.items():
+        for start in range(0, len(indices), BLOCK_SIZE):
+            block = indices[start:start + BLOCK_SIZE]
+            result = batched_johansen(prices, block, k_ar_diff, significance, moments)
+            half_life = basket_half_life(prices, block, result['weights'])
+            keep = np.flatnonzero((result['rank'] > 0) & (half_life > 0) & (half_life <= max_half_life))
+            accepted += [{
+                'basket': [symbols[column] for column in block[k]],
+                'weights': result['weights'][k].tolist(),
+                'trace_stat': float(result['trace_stat'][k, 0]),
+                'critical_value': float(result['critical_value'][k, 0]),
+                'rank': int(result['rank'][k]),
+                'half_life': float(half_life[k]),
+            } for k in keep]
+    logger.info(f"{len(accepted)} of {sum(len(indices) for indices in baskets.values())} baskets are cointegrated")
+
+    accepted.sort(key=lambda basket: basket['trace_stat'] / basket['critical_value'], reverse=True)
+    return accepted
@@ -0,0 +1,637 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import subprocess
+import tempfile
+import contextlib
+import tracemalloc
+import numpy as np
+import pandas as pd
+from constants import (WINDOW_LENGTH, DISCOVERY_SYMBOLS, PAIRS_CORR_FILE, BENCHMARK_BASELINE_FILE,
+                       BENCHMARK_TOLERANCE, LOG_LEVELS)
+from synthetic_data import symbol_universe, cointegrated_pairs, rates_from_prices, ticks_from_prices
+from pair_discovery import discover_pairs
+from basket_discovery import discover_baskets, candidate_baskets
+from bar_store import BarStore
+from broker import SimulatedBroker, set_broker, create_broker, timeframe_seconds
+import fake_mt5
+import mt5_data
+import main_cointegration
+from rolling_stats import rolling_forex_stats, window_sums, stats_from_sums
+from kalman_filter import kalman_filter
+from tick_stream import TickStream, TickFeed
+from resample import Resampler, resample_rates
+from metrics import MetricsRegistry
+from log_config import setup_logging, stop_logging
+from mt5_data import process_data_frame, align_rates, get_time, get_data, get_prices
+from mt5_positions import place_market_order, close_order_by_ticket
+from main_cointegration import get_pair_stream, pair_streams
+from exit_manager import evaluate_exits
+from statistical_functions import ForexStats
+
+
+def timed(func, *args, repeat: int = 3, **kwargs) -> float:
+    """
+    Run a function several times and keep the best wall-clock time.
+
+    :return: A float representing the best run time, in seconds.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_discovery(sizes=(28, 100, 300)) -> list:
+    """
+    Time discover_pairs on synthetic universes of increasing size, one WINDOW_LENGTH of bars each.
+
+    :return: A list of result dictionaries, one per universe size.
+    """
+    results = []
+    for n_symbols in sizes:
+        prices = symbol_universe(n_symbols, WINDOW_LENGTH, seed=n_symbols)
+        symbols = [f'SYM{i:03d}' for i in range(n_symbols)]
+        found = discover_pairs(symbols, prices)
+        results.append({
+            'benchmark': 'discover_pairs',
+            'size': n_symbols,
+            'pairs': n_symbols * (n_symbols - 1) // 2,
+            'found': len(found),
+            'seconds': timed(discover_pairs, symbols, prices, repeat=1),
+        })
+    return results
+
+
+def bench_baskets(sizes=(10, 20, 30)) -> list:
+    """
+    Time discover_baskets over every 3- and 4-symbol basket of synthetic universes of increasing size, one
+    WINDOW_LENGTH of bars each.
+
+    :return: A list of result dictionaries, one per universe size.
+    """
+    results = []
+    for n_symbols in sizes:
+        prices = symbol_universe(n_symbols, WINDOW_LENGTH, seed=n_symbols)
+        symbols = [f'SYM{i:03d}' for i in range(n_symbols)]
+        found = discover_baskets(symbols, prices)
+        results.append({
+            'benchmark': 'discover_baskets',
+            'size': n_symbols,
+            'baskets': sum(len(baskets) for baskets in candidate_baskets(symbols).values()),
+            'found': len(found),
+            'seconds': timed(discover_baskets, symbols, prices),
+        })
+    return results
+
+
+def peak_memory(func, *args, **kwargs) -> int:
+    """
+    Run a function once under tracemalloc.
+
+    :return: An integer representing the peak of memory allocated during the call, in bytes.
+    """
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def synthetic_rates(n_symbols: int, n_bars: int, missing: float = 0.001, seed: int = 0) -> list:
+    """
+    Build MT5-like rate record arrays for several symbols, each missing a random fraction of the bars.
+
+    :return: A list of structured numpy arrays of RATES_DTYPE, one per symbol.
+    """
+    return rates_from_prices(symbol_universe(n_symbols, n_bars, seed=seed), missing, seed=seed)
+
+
+@contextlib.contextmanager
+def fake_terminal(rates: dict, spare_bars: int = 0):
+    """
+    Serve recorded bars through the fake MetaTrader5 package, so the MT5Broker backend, the session and a
+    bar store in a temporary folder are all on the timed path, like on a live terminal.
+
+    :param rates: A dictionary of structured numpy arrays of RATES_DTYPE, one per symbol.
+    :param spare_bars: An integer representing the number of bars left ahead of the clock for advance.
+    :return: The SimulatedBroker behind the fake package, for the duration of the context.
+    """
+    simulated = SimulatedBroker(rates)
+    simulated.advance(len(simulated.clock) - 1 - spare_bars)
+    fake_mt5.install(simulated)
+    previous = set_broker(create_broker('mt5'))
+    with tempfile.TemporaryDirectory() as directory:
+        mt5_data.bar_store = BarStore(directory, mt5_data.get_broker())
+        try:
+            yield simulated
+        finally:
+            mt5_data.bar_store = None
+            set_broker(previous)
+            fake_mt5.uninstall()
+
+
+def bench_fetch(sizes=(WINDOW_LENGTH, 28800 + WINDOW_LENGTH), n_symbols: int = 2) -> list:
+    """
+    Compare turning MT5 rate records into aligned close prices through the DataFrame path of get_data
+    and through the array path of get_prices. The terminal itself is left out.
+
+    :return: A list of result dictionaries, one per path and size.
+    """
+    def dataframe_path(rates):
+        data = pd.concat([process_data_frame(pd.DataFrame(r), f'SYM{k}', 'close') for k, r in enumerate(rates)], axis=1)
+        return data.dropna()
+
+    def array_path(rates):
+        return align_rates([r['time'] for r in rates], [r['close'] for r in rates])
+
+    results = []
+    for n_bars in sizes:
+        rates = synthetic_rates(n_symbols, n_bars)
+        for name, path in (('get_data', dataframe_path), ('get_prices', array_path)):
+            results.append({
+                'benchmark': name,
+                'size': n_bars,
+                'seconds': timed(path, rates, repeat=20),
+                'peak_bytes': peak_memory(path, rates),
+            })
+    return results
+
+
+def bench_replay(n_candles: int = 2000) -> list:
+    """
+    Replay synthetic bars of the discovery universe through SimulatedBroker and run the per-candle work of
+    main.py against it: the candle time check, the streaming update of every pair in PAIRS_CORR_FILE, and an
+    order opened and closed.
+
+    :return: A list with one result dictionary, including the simulated candles processed per second.
+    """
+    rates = synthetic_rates(len(DISCOVERY_SYMBOLS), WINDOW_LENGTH + n_candles)
+    broker = SimulatedBroker(dict(zip(DISCOVERY_SYMBOLS, rates)), spread=10)
+    broker.advance(WINDOW_LENGTH - 1)
+    with open(PAIRS_CORR_FILE, 'r') as file:
+        pairs = json.load(file)
+
+    previous = set_broker(broker)
+    pair_streams.clear()
+    try:
+        start = time.perf_counter()
+        candles = 0
+        while broker.advance():
+            get_time('EURUSD')
+            for pair in pairs:
+                get_pair_stream(pair).calculate_zscore()
+            close_order_by_ticket(place_market_order('EURUSD', 'buy', 0.1))
+            candles += 1
+        seconds = time.perf_counter() - start
+    finally:
+        set_broker(previous)
+        pair_streams.clear()
+
+    return [{
+        'benchmark': 'replay',
+        'size': candles,
+        'pairs': len(pairs),
+        'seconds': seconds,
+        'candles_per_second': candles / seconds,
+    }]
+
+
+def bench_ticks(n_candles: int = 12, ticks_per_bar: int = 300, n_pairs: int = 4, poll_ms: int = 1000) -> list:
+    """
+    Replay synthetic ticks of a few pairs through a TickFeed and poll them with a TickStream every poll_ms
+    simulated milliseconds, as run_tick_stream does. The tick-to-signal latency is the time from a poll
+    receiving new ticks to the z-score of every pair they move being up to date, over the last polls. The
+    memory of the stream is measured once every pair has its statistics and at the end, to show it does not
+    grow with the ticks.
+
+    :return: A list with one result dictionary.
+    """
+    prices, _ = cointegrated_pairs(n_pairs, WINDOW_LENGTH + n_candles, seed=n_candles)
+    symbols = [f'SYM{i:03d}' for i in range(prices.shape[1])]
+    pairs = [symbols[k:k + 2] for k in range(0, len(symbols), 2)]
+    start = 1_600_000_200
+    rates = dict(zip(symbols, rates_from_prices(prices, start=start)))
+    ticks = dict(zip(symbols, ticks_from_prices(prices, ticks_per_bar, start=start)))
+    first = (start + 300 * WINDOW_LENGTH) * 1000
+    feed = TickFeed({symbol: records[records['time_msc'] >= first] for symbol, records in ticks.items()}, rates,
+                    start_msc=first)
+
+    stream = TickStream(pairs, source=feed).seed()
+    for pair in stream.pairs:
+        stream.signal(pair)
+    nbytes = stream.nbytes
+    start = time.perf_counter()
+    while feed.advance(poll_ms):
+        stream.poll()
+    seconds = time.perf_counter() - start
+    latency = np.array(stream.stats['latency'])
+
+    return [{
+        'benchmark': 'tick_stream',
+        'size': stream.stats['ticks'],
+        'pairs': len(pairs),
+        'polls': stream.stats['polls'],
+        'seconds': seconds,
+        'latency_mean': float(latency.mean()),
+        'latency_p99': float(np.percentile(latency, 99)),
+        'nbytes_start': nbytes,
+        'nbytes_after': stream.nbytes,
+    }]
+
+
+def bench_resample(sizes=(2880, 28800), timeframes=(15, 16385, 16388), n_candles: int = 500) -> list:
+    """
+    Time resample_rates building M15, H1 and H4 bars (MT5 timeframes 15, 16385 and 16388) from M5 bars of
+    increasing length, then replay M5 candles through SimulatedBroker and keep WINDOW_LENGTH bars of every
+    timeframe up to date with a Resampler, which only fetches the base bars of the newest coarse bar on.
+
+    :return: A list of result dictionaries, one per timeframe and size, and one for the replay.
+    """
+    results = []
+    for n_bars in sizes:
+        rates = synthetic_rates(1, n_bars)[0]
+        for timeframe in timeframes:
+            results.append({'benchmark': f'resample_rates.{timeframe}', 'size': n_bars,
+                            'seconds': timed(resample_rates, rates, timeframe_seconds(timeframe))})
+
+    # Enough M5 history for WINDOW_LENGTH H4 bars before the replay starts
+    history = WINDOW_LENGTH * 48
+    rates = synthetic_rates(1, history + n_candles)[0]
+    broker = SimulatedBroker({'EURUSD': rates})
+    broker.advance(history)
+    resampler = Resampler(broker)
+    for timeframe in timeframes:
+        resampler.copy_rates_from_pos('EURUSD', timeframe, 0, WINDOW_LENGTH)
+    start = time.perf_counter()
+    candles = 0
+    while broker.advance():
+        for timeframe in timeframes:
+            resampler.copy_rates_from_pos('EURUSD', timeframe, 0, WINDOW_LENGTH)
+        candles += 1
+    seconds = time.perf_counter() - start
+    stats = resampler.stats
+    results.append({'benchmark': 'resample_replay', 'size': candles, 'seconds': seconds, 'misses': stats['misses'],
+                    'base_bars_per_update': stats['base_bars_fetched'] / (stats['hits'] + stats['misses'])})
+    return results
+
+
+def bench_exits(sizes=(10, 100, 1000), n_symbols: int = 28) -> list:
+    """
+    Time evaluate_exits against the number of open pair trades, on one window of a synthetic universe,
+    next to a loop running ForexStats on every trade.
+
+    :return: A list of result dictionaries, one per path and number of trades.
+    """
+    rng = np.random.default_rng(0)
+    prices = symbol_universe(n_symbols, WINDOW_LENGTH)
+    times = 1_600_000_000 + 300 * np.arange(WINDOW_LENGTH)
+    symbols = [f'SYM{i:03d}' for i in range(n_symbols)]
+
+    def loop_path(records):
+        column = {symbol: k for k, symbol in enumerate(symbols)}
+        for record in records:
+            ForexStats(prices[:, column[record['symbol_x']]], prices[:, column[record['symbol_y']]]).calculate_zscore()
+
+    results = []
+    for n_trades in sizes:
+        pairs = rng.choice(n_symbols, (n_trades, 2))
+        records = [{'symbol_x': symbols[x], 'symbol_y': symbols[y], 'ticket_x': 2 * k, 'ticket_y': 2 * k + 1,
+                    'hedge_ratio': rng.uniform(0.5, 1.5), 'entry_zscore': rng.choice([-2.0, 2.0]),
+                    'half_life': 20.0, 'entry_time': int(times[-50])} for k, (x, y) in enumerate(pairs)]
+        results.append({'benchmark': 'exits_vectorized', 'size': n_trades,
+                        'seconds': timed(evaluate_exits, records, symbols, times, prices, 300)})
+        results.append({'benchmark': 'exits_forexstats_loop', 'size': n_trades,
+                        'seconds': timed(loop_path, records, repeat=1)})
+    return results
+
+
+def bench_forexstats(sizes=(WINDOW_LENGTH, 2880, 28800)) -> list:
+    """
+    Time every ForexStats method on its own, on a fresh instance, for a synthetic pair with a known hedge
+    ratio and half-life. The estimates of both are reported next to the true values.
+
+    :return: A list of result dictionaries, one per method and size.
+    """
+    methods = ('calculate_correlation', 'check_cointegration', 'check_stationarity', 'calculate_hedge_ratio',
+               'calculate_spread', 'calculate_half_life', 'calculate_zscore', 'calculate_zscore_rolling', 'summary')
+    results = []
+    for n_bars in sizes:
+        prices, truth = cointegrated_pairs(1, n_bars, seed=n_bars)
+        x, y = prices[:, 0], prices[:, 1]
+        for method in methods:
+            results.append({
+                'benchmark': f'forexstats.{method}',
+                'size': n_bars,
+                'seconds': timed(lambda: getattr(ForexStats(x, y), method)(), repeat=5),
+            })
+        stats = ForexStats(x, y)
+        results[-1].update({'hedge_ratio': float(stats.calculate_hedge_ratio()), 'true_hedge_ratio': truth[0]['hedge_ratio'],
+                            'half_life': float(stats.calculate_half_life()), 'true_half_life': truth[0]['half_life']})
+    return results
+
+
+def bench_get_data(sizes=(WINDOW_LENGTH, 2880, 28800 + WINDOW_LENGTH), n_symbols: int = 2) -> list:
+    """
+    Time get_data and get_prices end to end through the fake MetaTrader5 package and a warm bar store.
+
+    :return: A list of result dictionaries, one per function and size.
+    """
+    rates = synthetic_rates(n_symbols, max(sizes))
+    symbols = [f'SYM{k:03d}' for k in range(n_symbols)]
+    results = []
+    with fake_terminal(dict(zip(symbols, rates))):
+        for n_bars in sizes:
+            for func in (get_data, get_prices):
+                func(symbols, 5, n_bars)
+                results.append({'benchmark': f'{func.__name__}.fake_mt5', 'size': n_bars,
+                                'seconds': timed(func, symbols, 5, n_bars, repeat=10)})
+    return results
+
+
+def bench_scan(sizes=(10, 50)) -> list:
+    """
+    Time find_cointegrated_pairs on synthetic cointegrated pairs served through the fake MetaTrader5
+    package: a cold scan seeding the statistics of every pair, and warm scans after one new bar.
+
+    :return: A list of result dictionaries, one per scan and number of pairs.
+    """
+    results = []
+    for n_pairs in sizes:
+        prices, _ = cointegrated_pairs(n_pairs, WINDOW_LENGTH + 10, seed=n_pairs)
+        symbols = [f'PAIR{k // 2:03d}{"AB"[k % 2]}' for k in range(2 * n_pairs)]
+        pairs = [symbols[k:k + 2] for k in range(0, len(symbols), 2)]
+
+        with fake_terminal(dict(zip(symbols, rates_from_prices(prices))), spare_bars=9) as simulated, \
+                tempfile.TemporaryDirectory() as directory:
+            files = (main_cointegration.PAIRS_CORR_FILE, main_cointegration.COINTEGRATED_PAIRS_FILE)
+            main_cointegration.PAIRS_CORR_FILE = os.path.join(directory, 'pairs.json')
+            main_cointegration.COINTEGRATED_PAIRS_FILE = os.path.join(directory, 'cointegrated.json')
+            with open(main_cointegration.PAIRS_CORR_FILE, 'w') as file:
+                json.dump(pairs, file)
+
+            def cold():
+                main_cointegration.pair_streams.clear()
+                return main_cointegration.find_cointegrated_pairs(1)
+
+            def warm():
+                simulated.advance()
+                main_cointegration.find_cointegrated_pairs(1)
+
+            try:
+                found = cold()
+                results.append({'benchmark': 'find_cointegrated_pairs_cold', 'size': n_pairs, 'found': len(found),
+                                'seconds': timed(cold, repeat=3)})
+                results.append({'benchmark': 'find_cointegrated_pairs_warm', 'size': n_pairs,
+                                'seconds': timed(warm, repeat=3)})
+            finally:
+                main_cointegration.PAIRS_CORR_FILE, main_cointegration.COINTEGRATED_PAIRS_FILE = files
+                main_cointegration.pair_streams.clear()
+    return results
+
+
+def bench_backtest(sizes=(2880, 14400, 28800)) -> list:
+    """
+    Time the window loop of Backtest.py, rolling_forex_stats over WINDOW_LENGTH windows, on a synthetic pair.
+
+    :return: A list of result dictionaries, one per number of windows.
+    """
+    results = []
+    for n_windows in sizes:
+        prices, _ = cointegrated_pairs(1, n_windows + WINDOW_LENGTH - 1, seed=n_windows)
+        results.append({'benchmark': 'backtest_windows', 'size': n_windows,
+                        'seconds': timed(rolling_forex_stats, prices[:, 0], prices[:, 1], WINDOW_LENGTH, repeat=1)})
+    return results
+
+
+def bench_kalman(sizes=(2880, 14400, 28800)) -> list:
+    """
+    Compare the ways of tracking a hedge ratio over a history, on a synthetic pair with a known hedge ratio:
+    one kalman_filter pass, the vectorized rolling OLS of rolling_stats, and a ForexStats refit on every
+    WINDOW_LENGTH window as a naive loop would. The mean absolute error of each hedge ratio series over the
+    bars all three cover is reported next to the time.
+
+    :return: A list of result dictionaries, one per method and size.
+    """
+    results = []
+    for n_bars in sizes:
+        prices, truth = cointegrated_pairs(1, n_bars + WINDOW_LENGTH - 1, seed=n_bars)
+        x, y = prices[:, 0], prices[:, 1]
+        true_hedge_ratio = truth[0]['hedge_ratio']
+
+        def refit():
+            return np.array([ForexStats(x[end - WINDOW_LENGTH:end], y[end - WINDOW_LENGTH:end], 'ols').hedge_ratio
+                             for end in range(WINDOW_LENGTH, len(x) + 1)])
+
+        methods = {
+            'kalman': lambda: kalman_filter(x, y)['hedge_ratio'][WINDOW_LENGTH - 1:],
+            'rolling_ols': lambda: stats_from_sums(window_sums(x, y, WINDOW_LENGTH))['hedge_ratio'],
+            'refit_ols': refit,
+        }
+        for method, func in methods.items():
+            hedge_ratio = func()
+            results.append({'benchmark': f'hedge_ratio.{method}', 'size': n_bars,
+                            'seconds': timed(func),
+                            'hedge_ratio_error': float(np.mean(np.abs(hedge_ratio - true_hedge_ratio)))})
+    return results
+
+
+def bench_metrics(calls: int = 100000) -> list:
+    """
+    Time the overhead of an instrumented function per call, with the metrics registry disabled and enabled,
+    against the bare function.
+
+    :return: A list of result dictionaries, one per variant, with the nanoseconds per call.
+    """
+    registry = MetricsRegistry(enabled=False)
+
+    def bare():
+        pass
+
+    variants = {'bare': bare, 'disabled': registry.instrument('noop')(bare), 'enabled': registry.instrument('noop')(bare)}
+    results = []
+    for name, func in variants.items():
+        registry.enable(name == 'enabled')
+
+        def loop():
+            for _ in range(calls):
+                func()
+        seconds = timed(loop)
+        results.append({'benchmark': f'metrics.{name}', 'size': calls, 'seconds': seconds,
+                        'ns_per_call': seconds / calls * 1e9})
+    return results
+
+
+def bench_logging(n_windows: int = 1000) -> list:
+    """
+    Time the per-window ForexStats loop the backtest used to run, where every statistic logs a line, under
+    three logging setups writing to a temporary file:
+    - 'import_time': what importing statistical_functions used to configure, every module at DEBUG with a
+      synchronous handler;
+    - 'configured': setup_logging with the module levels of LOG_LEVELS;
+    - 'info_rate_limited': setup_logging with statistical_functions at INFO, through the queue and the rate limit.
+
+    :return: A list of result dictionaries, one per setup, with the number of lines written.
+    """
+    prices, _ = cointegrated_pairs(1, n_windows + WINDOW_LENGTH - 1)
+
+    def window_loop():
+        for end in range(WINDOW_LENGTH, len(prices) + 1):
+            ForexStats(prices[end - WINDOW_LENGTH:end, 0], prices[end - WINDOW_LENGTH:end, 1]).summary()
+
+    root = logging.getLogger()
+    disabled = root.manager.disable
+    logging.disable(logging.NOTSET)
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for setup in ('import_time', 'configured', 'info_rate_limited'):
+                path = os.path.join(directory, f'{setup}.log')
+                if setup == 'import_time':
+                    stop_logging()
+                    handler = logging.FileHandler(path)
+                    root.handlers[:] = [handler]
+                    root.setLevel(logging.DEBUG)
+                    for name in LOG_LEVELS:
+                        logging.getLogger(name).setLevel(logging.NOTSET)
+                elif setup == 'configured':
+                    setup_logging(filename=path)
+                else:
+                    setup_logging(levels={**LOG_LEVELS, 'statistical_functions': 'INFO'}, filename=path)
+
+                seconds = timed(window_loop, repeat=1)
+                stop_logging()
+                for handler in root.handlers:
+                    handler.close()
+                with open(path) as file:
+                    lines = sum(1 for _ in file)
+                results.append({'benchmark': f'logging.{setup}', 'size': n_windows, 'seconds': seconds,
+                                'lines': lines})
+    finally:
+        root.handlers.clear()
+        root.setLevel(logging.WARNING)
+        for name in LOG_LEVELS:
+            logging.getLogger(name).setLevel(logging.NOTSET)
+        logging.disable(disabled)
+    return results
+
+
+def bench_startup(repeat: int = 3) -> list:
+    """
+    Time the cold start of every cli.py subcommand: a fresh interpreter importing what the subcommand runs,
+    next to a bare interpreter. Heavy modules still imported are listed with each result.
+
+    :return: A list of result dictionaries, one per subcommand and one for the bare interpreter.
+    """
+    heavy = ('pandas', 'scipy', 'statsmodels', 'plotly')
+    scripts = {'python': 'pass'}
+    for command in ('live', 'scan', 'backtest', 'entries'):
+        scripts[command] = (f'import sys, cli; cli.load({command!r}); '
+                            f'print([m for m in {heavy!r} if m in sys.modules])')
+
+    results = []
+    for name, script in scripts.items():
+        best, process = float('inf'), None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            process = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True,
+                                     cwd=os.path.dirname(os.path.abspath(__file__)))
+            best = min(best, time.perf_counter() - start)
+        result = {'benchmark': f'startup.{name}', 'size': 1, 'seconds': best}
+        if process.returncode:
+            result.update(seconds=float('nan'), error=process.stderr.strip().splitlines()[-1])
+        elif name != 'python':
+            result['heavy_modules'] = process.stdout.strip()
+        results.append(result)
+    return results
+
+
+# Benchmarks run by default, by name
+BENCHMARKS = {
+    'forexstats': bench_forexstats,
+    'get_data': bench_get_data,
+    'scan': bench_scan,
+    'backtest': bench_backtest,
+    'kalman': bench_kalman,
+    'discovery': bench_discovery,
+    'baskets': bench_baskets,
+    'fetch': bench_fetch,
+    'replay': bench_replay,
+    'exits': bench_exits,
+    'ticks': bench_ticks,
+    'resample': bench_resample,
+    'metrics': bench_metrics,
+    'logging': bench_logging,
+    'startup': bench_startup,
+}
+
+
+def save_baseline(results: list, path: str = BENCHMARK_BASELINE_FILE) -> None:
+    """
+    Save benchmark results as the baseline later runs are compared with.
+    """
+    with open(path, 'w') as file:
+        json.dump({'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': results}, file, indent=4, default=float)
+
+
+def compare_baseline(results: list, path: str = BENCHMARK_BASELINE_FILE, tolerance: float = BENCHMARK_TOLERANCE) -> list:
+    """
+    Compare benchmark results with a saved baseline, matching them on benchmark name and size.
+
+    :param results: A list of result dictionaries.
+    :param path: A string representing the path of the baseline file. Default is BENCHMARK_BASELINE_FILE.
+    :param tolerance: A float representing the slowdown ratio above which a result is a regression. Default
+                      is BENCHMARK_TOLERANCE.
+    :return: A list of dictionaries, one per result found in the baseline, with the baseline and current
+             seconds, their ratio and whether it is a regression.
+    """
+    with open(path, 'r') as file:
+        baseline = {(result['benchmark'], result['size']): result['seconds'] for result in json.load(file)['results']}
+    comparison = []
+    for result in results:
+        before = baseline.get((result['benchmark'], result['size']))
+        if before is None:
+            continue
+        ratio = result['seconds'] / before if before > 0 else float('inf')
+        comparison.append({'benchmark': result['benchmark'], 'size': result['size'], 'baseline': before,
+                           'seconds': result['seconds'], 'ratio': ratio, 'regression': ratio > tolerance})
+    return comparison
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the benchmarks and compare them with a baseline.')
+    parser.add_argument('benchmarks', nargs='*', help=f'Benchmarks to run among {list(BENCHMARKS)}, all by default.')
+    parser.add_argument('--baseline', default=BENCHMARK_BASELINE_FILE, help='Path of the baseline file.')
+    parser.add_argument('--save', action='store_true', help='Save the results as the new baseline.')
+    parser.add_argument('--tolerance', type=float, default=BENCHMARK_TOLERANCE,
+                        help='Slowdown ratio above which a benchmark is a regression.')
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f'unknown benchmarks: {sorted(unknown)}')
+
+    logging.disable(logging.INFO)
+    results = []
+    for name in args.benchmarks or BENCHMARKS:
+        for result in BENCHMARKS[name]():
+            print(result)
+            results.append(result)
+
+    regressions = []
+    if os.path.exists(args.baseline):
+        comparison = compare_baseline(results, args.baseline, args.tolerance)
+        print(pd.DataFrame(comparison).to_string(index=False, float_format='%.4g') if comparison else
+              'No result matches the baseline.')
+        regressions = [row for row in comparison if row['regression']]
+    if args.save:
+        save_baseline(results, args.baseline)
+        print(f'Saved baseline to {args.baseline}')
+    if regressions:
+        print(f'{len(regressions)} benchmark(s) slower than {args.tolerance}x the baseline.')
+        sys.exit(1)
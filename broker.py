@@ -0,0 +1,444 @@
+import os
+import glob
+import fnmatch
+import threading
+import logging
+import numpy as np
+from collections import namedtuple
+from bar_store import BarStore, RATES_DTYPE
+from constants import BROKER_BACKEND, SIM_DATA_DIR, SIM_SPREAD_POINTS, SIM_LATENCY, CONCURRENT_LEG_ORDERS
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# MetaTrader5 constants used by the bot, with the values the terminal uses
+TIMEFRAME_M5 = 5
+TRADE_ACTION_DEAL = 1
+ORDER_TYPE_BUY = 0
+ORDER_TYPE_SELL = 1
+ORDER_FILLING_IOC = 1
+ORDER_TIME_GTC = 0
+TRADE_RETCODE_DONE = 10009
+TRADE_RETCODE_INVALID = 10013
+TRADE_RETCODE_INVALID_VOLUME = 10014
+TRADE_RETCODE_MARKET_CLOSED = 10018
+TRADE_RETCODE_POSITION_CLOSED = 10036
+COPY_TICKS_ALL = -1
+
+# Length in seconds of the MT5 timeframes above M30, whose codes are not their length in minutes
+TIMEFRAME_SECONDS = {16385: 3600, 16386: 7200, 16387: 10800, 16388: 14400, 16390: 21600, 16392: 28800,
+                     16396: 43200, 16408: 86400}
+
+# Record layout of the arrays returned by MetaTrader5.copy_ticks_from
+TICKS_DTYPE = np.dtype([
+    ('time', '<i8'), ('bid', '<f8'), ('ask', '<f8'), ('last', '<f8'), ('volume', '<u8'), ('time_msc', '<i8'),
+    ('flags', '<u4'), ('volume_real', '<f8')])
+
+# Records returned by the simulated backend, with the fields of their MetaTrader5 counterparts the bot reads
+SymbolInfo = namedtuple('SymbolInfo', 'name spread point digits trade_contract_size bid ask')
+TerminalInfo = namedtuple('TerminalInfo', 'connected trade_allowed')
+Tick = namedtuple('Tick', 'time bid ask last time_msc')
+OrderCheckResult = namedtuple('OrderCheckResult', 'retcode comment request')
+OrderSendResult = namedtuple('OrderSendResult', 'retcode deal order volume price bid ask comment request')
+TradePosition = namedtuple('TradePosition',
+                           'ticket time type magic volume price_open price_current profit symbol comment')
+
+
+def timeframe_seconds(timeframe: int) -> int:
+    """
+    Returns:
+        int: The length of a candle of the MT5 timeframe, in seconds.
+    """
+    return TIMEFRAME_SECONDS.get(timeframe, timeframe * 60)
+
+
+class Broker:
+    """
+    Interface of a trading backend, with the names and signatures of the MetaTrader5 functions the bot uses so
+    that the MetaTrader5 module itself can stand in for it.
+    """
+    # False for backends that replay recorded data, whose bars must not go into the bar store
+    live = True
+    # True for backends whose order_send may be called from several threads at once
+    concurrent_orders = False
+
+    def initialize(self) -> bool:
+        raise NotImplementedError
+
+    def shutdown(self) -> None:
+        raise NotImplementedError
+
+    def terminal_info(self):
+        raise NotImplementedError
+
+    def copy_rates_from_pos(self, symbol: str, timeframe: int, start_pos: int, count: int) -> np.ndarray:
+        raise NotImplementedError
+
+    def copy_ticks_from(self, symbol: str, date_from, count: int, flags: int) -> np.ndarray:
+        raise NotImplementedError
+
+    def symbol_info(self, symbol: str):
+        raise NotImplementedError
+
+    def symbol_info_tick(self, symbol: str):
+        raise NotImplementedError
+
+    def order_check(self, request: dict):
+        raise NotImplementedError
+
+    def order_send(self, request: dict):
+        raise NotImplementedError
+
+    def positions_get(self, symbol: str = None, group: str = None, ticket: int = None) -> tuple:
+        raise NotImplementedError
+
+
+class MT5Broker(Broker):
+    concurrent_orders = CONCURRENT_LEG_ORDERS
+
+    def __init__(self) -> None:
+        """
+        Backend talking to a running MetaTrader5 terminal. The MetaTrader5 package is only imported here, so
+        the rest of the bot can be imported on systems where it is not available.
+        """
+        import MetaTrader5
+        self.mt5 = MetaTrader5
+
+    def initialize(self) -> bool:
+        return self.mt5.initialize()
+
+    def shutdown(self) -> None:
+        self.mt5.shutdown()
+
+    def terminal_info(self):
+        return self.mt5.terminal_info()
+
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        return self.mt5.copy_rates_from_pos(symbol, timeframe, start_pos, count)
+
+    def copy_ticks_from(self, symbol, date_from, count, flags):
+        return self.mt5.copy_ticks_from(symbol, date_from, count, flags)
+
+    def symbol_info(self, symbol):
+        return self.mt5.symbol_info(symbol)
+
+    def symbol_info_tick(self, symbol):
+        return self.mt5.symbol_info_tick(symbol)
+
+    def order_check(self, request):
+        return self.mt5.order_check(request)
+
+    def order_send(self, request):
+        return self.mt5.order_send(request)
+
+    def positions_get(self, symbol=None, group=None, ticket=None):
+        # The terminal rejects keyword arguments set to None
+        filters = {key: value for key, value in (('symbol', symbol), ('group', group), ('ticket', ticket))
+                   if value is not None}
+        return self.mt5.positions_get(**filters)
+
+
+class SimulatedBroker(Broker):
+    live = False
+    # order_send holds a lock
+    concurrent_orders = True
+
+    def __init__(self, rates: dict, timeframe: int = TIMEFRAME_M5, ticks: dict = None, spread=None,
+                 latency=0.0, start: int = None, contract_size: float = 100000) -> None:
+        """
+        Backend replaying recorded bars, and optionally ticks, on a simulated clock that only moves when
+        advance is called, so a recording can be replayed as fast as the bot consumes it. Market orders fill
+        at once at the simulated quote.
+
+        The bar opened at the current time is served as it looked when it opened: its open, high, low and
+        close are all the recorded open, so the bot never sees prices from the future.
+
+        Args:
+            rates (dict): Recorded bars of every symbol, structured arrays of RATES_DTYPE sorted by time.
+            timeframe (int): The MT5 timeframe of the recorded bars. Requests for other timeframes fail.
+            ticks (dict): Optional recorded ticks of some symbols, structured arrays with 'bid', 'ask' and
+                'time_msc' or 'time' fields. Quotes of those symbols come from the ticks instead of the bars.
+            spread: The spread model, in points. None uses the spread recorded with each bar, a number is a
+                fixed spread and a callable is called with the symbol and the time of the quote.
+            latency: The latency model, in seconds. A number is a fixed delay and a callable is called with the
+                order request. Orders fill at the quote of the time they would reach the server.
+            start (int): The first time of the clock, in seconds. Defaults to the first recorded bar.
+            contract_size (float): The units of the base currency in one lot.
+        """
+        self.rates = {symbol: np.asarray(bars).astype(RATES_DTYPE) for symbol, bars in rates.items()}
+        self.times = {symbol: bars['time'] for symbol, bars in self.rates.items()}
+        self.timeframe = timeframe
+        self.ticks = {}
+        for symbol, records in (ticks or {}).items():
+            names = records.dtype.names
+            time_msc = records['time_msc'] if 'time_msc' in names else records['time'] * 1000
+            self.ticks[symbol] = (np.ascontiguousarray(time_msc, dtype=np.int64), np.ascontiguousarray(records['bid']),
+                                  np.ascontiguousarray(records['ask']))
+        self.spread = spread
+        self.latency = latency
+        self.contract_size = contract_size
+
+        # Every time any symbol printed a bar, the steps of the simulated clock
+        self.clock = np.unique(np.concatenate(list(self.times.values()) or [np.empty(0, dtype=np.int64)]))
+        if start is None:
+            start = self.clock[0] if len(self.clock) else 0
+        self.step = int(np.searchsorted(self.clock, start))
+        self.positions = {}
+        self.deals = []
+        self.next_ticket = 1
+        self.stats = {'orders': 0, 'rejected': 0, 'latency': 0.0}
+        # The legs of a pair order are sent from two threads
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_bar_store(cls, directory: str, timeframe: int = TIMEFRAME_M5, symbols: list = None, **kwargs):
+        """
+        Create a simulated backend replaying the bars recorded by a BarStore.
+
+        Args:
+            directory (str): The folder of the bar store.
+            timeframe (int): The MT5 timeframe to replay.
+            symbols (list): The symbols to replay. Defaults to every symbol stored for the timeframe.
+
+        Returns:
+            SimulatedBroker: The backend, with the keyword arguments passed on to the constructor.
+        """
+        store = BarStore(directory, None)
+        if symbols is None:
+            suffix = f'_{timeframe}.bin'
+            symbols = [os.path.basename(path)[:-len(suffix)]
+                       for path in sorted(glob.glob(os.path.join(directory, f'*{suffix}')))]
+        rates = {symbol: store.read(symbol, timeframe, store.stored_count(symbol, timeframe)) for symbol in symbols}
+        return cls(rates, timeframe, **kwargs)
+
+    @property
+    def now(self) -> int:
+        """
+        Returns:
+            int: The current time of the simulated clock, in seconds.
+        """
+        return int(self.clock[min(self.step, len(self.clock) - 1)]) if len(self.clock) else 0
+
+    def advance(self, steps: int = 1) -> bool:
+        """
+        Move the simulated clock to a later bar.
+
+        Returns:
+            bool: False once the recording is exhausted.
+        """
+        self.step += steps
+        return self.step < len(self.clock)
+
+    def point(self, symbol: str) -> float:
+        return 0.001 if 'JPY' in symbol else 0.00001
+
+    def _spread_points(self, symbol: str, time: float, index: int) -> float:
+        if self.spread is None:
+            return float(self.rates[symbol]['spread'][index])
+        if callable(self.spread):
+            return self.spread(symbol, time)
+        return self.spread
+
+    def quote(self, symbol: str, time: float = None) -> tuple:
+        """
+        Get the simulated bid and ask of a symbol.
+
+        Args:
+            symbol (str): The symbol.
+            time (float): The time of the quote, in seconds. Defaults to the current time.
+
+        Returns:
+            tuple: The bid and ask, or None if the symbol has no data at that time.
+        """
+        time = self.now if time is None else time
+        if symbol in self.ticks:
+            time_msc, bid, ask = self.ticks[symbol]
+            index = np.searchsorted(time_msc, int(time * 1000), side='right') - 1
+            return (float(bid[index]), float(ask[index])) if index >= 0 else None
+        if symbol not in self.rates:
+            return None
+        index = np.searchsorted(self.times[symbol], time, side='right') - 1
+        if index < 0:
+            return None
+        bid = float(self.rates[symbol]['open'][index])
+        return bid, bid + self._spread_points(symbol, time, index) * self.point(symbol)
+
+    def initialize(self) -> bool:
+        return True
+
+    def shutdown(self) -> None:
+        pass
+
+    def terminal_info(self):
+        return TerminalInfo(True, True)
+
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        if symbol not in self.rates or timeframe != self.timeframe:
+            logger.error(f"No recorded rates for {symbol} {timeframe}")
+            return None
+        end = np.searchsorted(self.times[symbol], self.now, side='right') - start_pos
+        rates = self.rates[symbol][max(0, end - count):max(0, end)].copy()
+        if start_pos == 0 and len(rates) and rates['time'][-1] == self.now:
+            forming = rates[-1:]
+            forming['high'] = forming['low'] = forming['close'] = forming['open']
+            forming['tick_volume'] = forming['real_volume'] = 0
+        return rates
+
+    def copy_ticks_from(self, symbol, date_from, count, flags):
+        if symbol not in self.ticks:
+            logger.error(f"No recorded ticks for {symbol}")
+            return None
+        return ticks_between(*self.ticks[symbol], date_from, self.now * 1000, count)
+
+    def symbol_info(self, symbol):
+        quote = self.quote(symbol)
+        if quote is None:
+            return None
+        bid, ask = quote
+        point = self.point(symbol)
+        return SymbolInfo(symbol, int(round((ask - bid) / point)), point, 3 if 'JPY' in symbol else 5,
+                          self.contract_size, bid, ask)
+
+    def symbol_info_tick(self, symbol):
+        quote = self.quote(symbol)
+        if quote is None:
+            return None
+        return Tick(self.now, quote[0], quote[1], 0.0, self.now * 1000)
+
+    def _check(self, request: dict) -> tuple:
+        # Return code and comment of the checks a market order must pass
+        if request.get('action') != TRADE_ACTION_DEAL or request.get('type') not in (ORDER_TYPE_BUY, ORDER_TYPE_SELL):
+            return TRADE_RETCODE_INVALID, 'Invalid request'
+        if request.get('volume', 0) <= 0:
+            return TRADE_RETCODE_INVALID_VOLUME, 'Invalid volume'
+        if self.quote(request.get('symbol')) is None:
+            return TRADE_RETCODE_MARKET_CLOSED, 'Market closed'
+        ticket = request.get('position')
+        if ticket is not None:
+            position = self.positions.get(ticket)
+            if position is None:
+                return TRADE_RETCODE_POSITION_CLOSED, 'Position closed'
+            if position.type == request['type'] or request['volume'] > position.volume:
+                return TRADE_RETCODE_INVALID, 'Invalid close request'
+        return 0, 'Done'
+
+    def order_check(self, request):
+        retcode, comment = self._check(request)
+        return OrderCheckResult(retcode, comment, request)
+
+    def order_send(self, request):
+        with self.lock:
+            return self._order_send(request)
+
+    def _order_send(self, request):
+        self.stats['orders'] += 1
+        retcode, comment = self._check(request)
+        if retcode:
+            self.stats['rejected'] += 1
+            return OrderSendResult(retcode, 0, 0, 0.0, 0.0, 0.0, 0.0, comment, request)
+
+        delay = self.latency(request) if callable(self.latency) else self.latency
+        self.stats['latency'] += delay
+        symbol, volume = request['symbol'], request['volume']
+        bid, ask = self.quote(symbol, self.now + delay)
+        price = ask if request['type'] == ORDER_TYPE_BUY else bid
+
+        ticket = self.next_ticket
+        self.next_ticket += 1
+        self.deals.append({'ticket': ticket, 'time': self.now + delay, 'symbol': symbol, 'type': request['type'],
+                           'volume': volume, 'price': price, 'position': request.get('position', ticket)})
+
+        position = self.positions.get(request.get('position'))
+        if position is None:
+            self.positions[ticket] = TradePosition(ticket, self.now, request['type'], request.get('magic', 0), volume,
+                                                   price, price, 0.0, symbol, request.get('comment', ''))
+        elif volume < position.volume:
+            self.positions[position.ticket] = position._replace(volume=round(position.volume - volume, 8))
+        else:
+            del self.positions[position.ticket]
+
+        return OrderSendResult(TRADE_RETCODE_DONE, ticket, ticket, volume, price, bid, ask, comment, request)
+
+    def positions_get(self, symbol=None, group=None, ticket=None):
+        positions = []
+        for position in self.positions.values():
+            if ticket is not None and position.ticket != ticket:
+                continue
+            if symbol is not None and position.symbol != symbol:
+                continue
+            if group is not None and not any(fnmatch.fnmatch(position.symbol, pattern)
+                                             for pattern in group.split(',')):
+                continue
+            bid, ask = self.quote(position.symbol)
+            current = bid if position.type == ORDER_TYPE_BUY else ask
+            sign = 1 if position.type == ORDER_TYPE_BUY else -1
+            profit = sign * (current - position.price_open) * position.volume * self.contract_size
+            positions.append(position._replace(price_current=current, profit=profit))
+        return tuple(positions)
+
+
+def ticks_between(time_msc: np.ndarray, bid: np.ndarray, ask: np.ndarray, date_from, until_msc: int,
+                  count: int) -> np.ndarray:
+    """
+    Build the answer of copy_ticks_from from recorded ticks: the first `count` ticks from date_from on, up to
+    until_msc included.
+
+    Args:
+        time_msc (np.ndarray): The sorted times of the recorded ticks, in milliseconds.
+        bid (np.ndarray): Their bid prices.
+        ask (np.ndarray): Their ask prices.
+        date_from: The first time, in seconds or as a datetime, as MetaTrader5 takes it.
+        until_msc (int): The last time, in milliseconds.
+        count (int): The most ticks returned.
+
+    Returns:
+        np.ndarray: The ticks, a structured array of TICKS_DTYPE.
+    """
+    seconds = date_from.timestamp() if hasattr(date_from, 'timestamp') else date_from
+    start = np.searchsorted(time_msc, int(seconds * 1000))
+    end = max(start, min(np.searchsorted(time_msc, until_msc, side='right'), start + count))
+    ticks = np.zeros(end - start, dtype=TICKS_DTYPE)
+    ticks['time_msc'] = time_msc[start:end]
+    ticks['time'] = ticks['time_msc'] // 1000
+    ticks['bid'] = bid[start:end]
+    ticks['ask'] = ask[start:end]
+    return ticks
+
+
+# Backend used by mt5_data, mt5_positions and mt5_connector
+_broker = None
+
+
+def create_broker(backend: str = BROKER_BACKEND) -> Broker:
+    """
+    Create a backend from its name, 'mt5' or 'simulated'. The simulated one replays the bar store in
+    SIM_DATA_DIR with the SIM_SPREAD_POINTS and SIM_LATENCY models.
+    """
+    if backend == 'mt5':
+        return MT5Broker()
+    if backend == 'simulated':
+        return SimulatedBroker.from_bar_store(SIM_DATA_DIR, spread=SIM_SPREAD_POINTS, latency=SIM_LATENCY)
+    raise ValueError("backend argument must be one of ('mt5', 'simulated')")
+
+
+def get_broker() -> Broker:
+    """
+    Returns:
+        Broker: The backend in use, created from BROKER_BACKEND on first use.
+    """
+    global _broker
+    if _broker is None:
+        _broker = create_broker()
+    return _broker
+
+
+def set_broker(broker: Broker) -> Broker:
+    """
+    Replace the backend in use, e.g. with a SimulatedBroker to replay a recording.
+
+    Returns:
+        Broker: The previous backend, or None.
+    """
+    global _broker
+    previous, _broker = _broker, broker
+    return previous
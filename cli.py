@@ -0,0 +1,115 @@
+import sys
+import time
+import logging
+import argparse
+import importlib
+from constants import LOG_LEVEL, LOG_FILE, SCAN_WORKERS, HEDGE_MODEL, TICK_POLL_INTERVAL, BASKET_SIZES, BASKET_SHARED_QUOTE
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Module and function of every subcommand, imported only when the subcommand runs, so that e.g. the live bot
+# never loads statsmodels or plotly
+COMMANDS = {
+    'live': ('main', 'run_live'),
+    'discover': ('main_cointegration', 'find_candidate_pairs'),
+    'baskets': ('main_cointegration', 'find_candidate_baskets'),
+    'scan': ('main_cointegration', 'find_cointegrated_pairs'),
+    'backtest': ('Backtest', 'run_backtest'),
+    'entries': ('main_entries', 'run_entries'),
+    'ticks': ('tick_stream', 'run_tick_stream'),
+}
+
+# Subcommands logging to the terminal instead of LOG_FILE
+INTERACTIVE_COMMANDS = ('discover', 'baskets', 'scan', 'backtest')
+
+
+def load(command: str):
+    """
+    Import the module of a subcommand.
+
+    Args:
+        command (str): One of COMMANDS.
+
+    Returns:
+        callable: The function running the subcommand.
+    """
+    module, name = COMMANDS[command]
+    return getattr(importlib.import_module(module), name)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='cli.py', description='Forex pair trading bot.')
+    parser.add_argument('--backend', choices=('mt5', 'simulated'),
+                        help='Trading backend, overrides BROKER_BACKEND.')
+    parser.add_argument('--log-level', default=LOG_LEVEL, help='Level of the root logger.')
+    parser.add_argument('--log-file', help='File to log to. Defaults to LOG_FILE for live and entries, '
+                                           'the terminal otherwise.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    live = subparsers.add_parser('live', help='Run the trading loop on every candle.')
+    live.add_argument('--max-candles', type=int, help='Stop after this many candles.')
+
+    discover = subparsers.add_parser('discover', help='Rank the pairs of DISCOVERY_SYMBOLS into PAIRS_CORR_FILE.')
+    discover.add_argument('--max-pairs', type=int, help='Keep only this many of the best pairs.')
+
+    baskets = subparsers.add_parser('baskets', help='Find the cointegrated baskets of DISCOVERY_SYMBOLS.')
+    baskets.add_argument('--sizes', type=int, nargs='+', default=BASKET_SIZES, help='Numbers of symbols per basket.')
+    baskets.add_argument('--shared-quote', action=argparse.BooleanOptionalAction, default=BASKET_SHARED_QUOTE,
+                         help='Only test baskets whose symbols share their quote currency.')
+
+    scan = subparsers.add_parser('scan', help='Find the cointegrated pairs among PAIRS_CORR_FILE.')
+    scan.add_argument('--workers', type=int, default=SCAN_WORKERS, help='Processes testing the pairs.')
+
+    backtest = subparsers.add_parser('backtest', help='Backtest a pair list and write a report.')
+    backtest.add_argument('--pairs', default='pairs_corr.json', help='JSON pair list.')
+    backtest.add_argument('--output', default='output_folder', help='Folder of the run folders.')
+    backtest.add_argument('--bars', type=int, default=28800, help='Bars backtested per pair.')
+    backtest.add_argument('--hedge-model', choices=('ols', 'kalman'), default=HEDGE_MODEL,
+                          help='Hedge ratio model, overrides HEDGE_MODEL.')
+
+    subparsers.add_parser('entries', help='Go through the cointegrated pairs of the last scan.')
+
+    ticks = subparsers.add_parser('ticks', help='Follow the z-score of the cointegrated pairs tick by tick.')
+    ticks.add_argument('--interval', type=float, default=TICK_POLL_INTERVAL, help='Seconds between polls.')
+    ticks.add_argument('--max-polls', type=int, help='Stop after this many polls.')
+    return parser
+
+
+def main(argv: list = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    from log_config import setup_logging
+    log_file = args.log_file or (None if args.command in INTERACTIVE_COMMANDS else LOG_FILE)
+    setup_logging(level=args.log_level.upper(), filename=log_file)
+
+    if args.backend:
+        from broker import create_broker, set_broker
+        set_broker(create_broker(args.backend))
+
+    start = time.perf_counter()
+    run = load(args.command)
+    logger.info(f'Loaded {args.command} in {time.perf_counter() - start:.3f}s')
+
+    if args.command == 'live':
+        run(args.max_candles)
+    elif args.command == 'discover':
+        candidates = run(max_pairs=args.max_pairs)
+        print(f'{len(candidates)} candidate pairs')
+    elif args.command == 'baskets':
+        baskets = run(sizes=tuple(args.sizes), shared_quote=args.shared_quote)
+        print(f'{len(baskets)} cointegrated baskets')
+    elif args.command == 'scan':
+        pairs = run(args.workers)
+        print(f'{len(pairs)} cointegrated pairs')
+    elif args.command == 'backtest':
+        print(run(args.pairs, args.output, args.bars, args.hedge_model))
+    elif args.command == 'ticks':
+        run(interval=args.interval, max_polls=args.max_polls)
+    else:
+        run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+import logging
+import functools
+import numpy as np
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Number of rows handled per batch, bounds the size of the stacked design matrices
+CHUNK_SIZE = 1024
+
+# Rows whose first-stage R-squared reaches this are treated as perfectly colinear, as statsmodels.coint does
+COLINEAR_RSQUARED = 1 - 100 * np.sqrt(np.finfo(np.float64).eps)
+
+
+@functools.lru_cache(maxsize=None)
+def _mackinnon_table(regression: str) -> dict:
+    # MacKinnon (1994) response surface coefficients, loaded on first use: importing statsmodels.tsa and
+    # scipy.stats takes over a second, which callers that never run a test should not pay
+    from statsmodels.tsa import adfvalues
+
+    # statsmodels 0.12 names the no-constant case 'nc', later releases 'n'
+    keys = (regression, 'nc') if regression == 'n' else (regression,)
+    key = next(k for k in keys if k in adfvalues._tau_maxs)
+    return {
+        'max': np.asarray(adfvalues._tau_maxs[key], dtype=np.float64),
+        'min': np.asarray(adfvalues._tau_mins[key], dtype=np.float64),
+        'star': np.asarray(adfvalues._tau_stars[key], dtype=np.float64),
+        'small': np.asarray(adfvalues._tau_smallps[key], dtype=np.float64),
+        'large': np.asarray(adfvalues._tau_largeps[key], dtype=np.float64),
+    }
+
+
+def mackinnon_pvalue(stat: np.ndarray, regression: str = 'c', n_vars: int = 1) -> np.ndarray:
+    """
+    Map Dickey-Fuller statistics to MacKinnon's approximate p-values, element-wise. Equivalent to
+    statsmodels.tsa.adfvalues.mackinnonp applied to every element.
+
+    :param stat: A numpy array of test statistics.
+    :param regression: 'c' for a constant, 'n' for no constant. Default is 'c'.
+    :param n_vars: An integer representing the number of series believed to be I(1). 1 for ADF, 2 for a pair.
+    :return: A numpy array of p-values with the shape of stat.
+    """
+    from scipy.stats import norm
+
+    table = _mackinnon_table(regression)
+    stat = np.asarray(stat, dtype=np.float64)
+    i = n_vars - 1
+
+    small = np.polynomial.polynomial.polyval(stat, table['small'][i])
+    large = np.polynomial.polynomial.polyval(stat, table['large'][i])
+    with np.errstate(invalid='ignore'):
+        pvalue = norm.cdf(np.where(stat <= table['star'][i], small, large))
+    pvalue = np.where(stat > table['max'][i], 1.0, pvalue)
+    pvalue = np.where(stat < table['min'][i], 0.0, pvalue)
+    return pvalue
+
+
+def default_maxlag(nobs: int, regression: str = 'c') -> int:
+    """
+    Calculate the maximum ADF lag order statsmodels.adfuller uses when maxlag is None (Schwert, 1989).
+
+    :param nobs: An integer representing the length of the series.
+    :param regression: 'c' for a constant, 'n' for no constant. Default is 'c'.
+    :return: An integer representing the maximum lag order.
+    """
+    ntrend = 0 if regression == 'n' else len(regression)
+    maxlag = int(np.ceil(12.0 * np.power(nobs / 100.0, 1 / 4.0)))
+    maxlag = min(nobs // 2 - ntrend - 1, maxlag)
+    if maxlag < 0:
+        raise ValueError("sample size is too short to use selected regression component")
+    return maxlag
+
+
+def _adf_design(x: np.ndarray, lag: int, regression: str):
+    """
+    Build the stacked ADF regression for a given lag order, in the column order [const, level, lags...].
+
+    :return: A tuple (X, y) with X of shape (batch, nobs - 1 - lag, k) and y of shape (batch, nobs - 1 - lag).
+    """
+    xdiff = np.diff(x, axis=1)
+    m = xdiff.shape[1]
+    columns = [x[:, lag:-1]] + [xdiff[:, lag - j:m - j] for j in range(1, lag + 1)]
+    if regression == 'c':
+        columns.insert(0, np.ones_like(columns[0]))
+    return np.stack(columns, axis=2), xdiff[:, lag:]
+
+
+def _scaled_gram(X: np.ndarray, y: np.ndarray):
+    """
+    Form the normal equations with every column scaled to unit norm, which keeps them well conditioned.
+    """
+    scale = np.sqrt(np.einsum('bij,bij->bj', X, X))
+    scale[scale == 0] = 1.0
+    Xs = X / scale[:, None, :]
+    return np.einsum('bij,bik->bjk', Xs, Xs), np.einsum('bij,bi->bj', Xs, y), scale
+
+
+def _select_lag(x: np.ndarray, maxlag: int, regression: str) -> np.ndarray:
+    """
+    Pick the AIC-minimising lag order of every row, on the common sample of the maxlag regression, the
+    same way statsmodels.adfuller does with autolag='aic'.
+    """
+    X, y = _adf_design(x, maxlag, regression)
+    gram, xty, _ = _scaled_gram(X, y)
+    yty = np.einsum('bi,bi->b', y, y)
+    nobs = y.shape[1]
+    n_fixed = 2 if regression == 'c' else 1
+
+    aic = np.empty((x.shape[0], maxlag + 1))
+    for lag in range(maxlag + 1):
+        k = n_fixed + lag
+        coef = np.linalg.solve(gram[:, :k, :k], xty[:, :k, None])[..., 0]
+        ssr = np.maximum(yty - np.einsum('bj,bj->b', coef, xty[:, :k]), np.finfo(np.float64).tiny)
+        aic[:, lag] = nobs * (np.log(2 * np.pi) + np.log(ssr / nobs) + 1) + 2 * k
+    return np.argmin(aic, axis=1)
+
+
+def _adf_tstat(x: np.ndarray, lag: int, regression: str) -> np.ndarray:
+    """
+    t-statistic of the lagged level in the ADF regression with a fixed lag order, for every row.
+    """
+    X, y = _adf_design(x, lag, regression)
+    gram, xty, scale = _scaled_gram(X, y)
+    level = 1 if regression == 'c' else 0
+
+    coef = np.linalg.solve(gram, xty[..., None])[..., 0] / scale
+    resid = y - np.einsum('bij,bj->bi', X, coef)
+    dof = y.shape[1] - X.shape[2]
+    sigma2 = np.einsum('bi,bi->b', resid, resid) / dof
+    cov_level = np.linalg.inv(gram)[:, level, level] / scale[:, level] ** 2
+    return coef[:, level] / np.sqrt(sigma2 * cov_level)
+
+
+def _adf_stat(x: np.ndarray, maxlag: int, autolag: str, regression: str):
+    if autolag is None:
+        lags = np.full(x.shape[0], maxlag)
+    elif autolag == 'aic':
+        lags = _select_lag(x, maxlag, regression)
+    else:
+        raise ValueError("autolag must be 'aic' or None")
+
+    # Rows that selected the same lag order share one stacked regression
+    stat = np.empty(x.shape[0])
+    for lag in np.unique(lags):
+        rows = lags == lag
+        stat[rows] = _adf_tstat(x[rows], int(lag), regression)
+    return stat, lags
+
+
+def batched_adfuller(x: np.ndarray, maxlag: int = None, autolag: str = 'aic', regression: str = 'c'):
+    """
+    Run the Augmented Dickey-Fuller test on every row of a 2-D array as stacked least squares.
+
+    :param x: A 2-D numpy array with one series per row.
+    :param maxlag: An integer representing the maximum lag order (or the lag order when autolag is None).
+                   Default is the statsmodels default for the series length.
+    :param autolag: 'aic' to choose the lag order of every row as statsmodels does, or None to use maxlag for all rows.
+    :param regression: 'c' for a constant, 'n' for no constant. Default is 'c'.
+    :return: A tuple (statistics, p-values, used lag orders) of 1-D numpy arrays, one element per row.
+    """
+    x = np.atleast_2d(np.asarray(x, dtype=np.float64))
+    if maxlag is None:
+        maxlag = default_maxlag(x.shape[1], regression)
+
+    stats = np.empty(x.shape[0])
+    lags = np.empty(x.shape[0], dtype=int)
+    for start in range(0, x.shape[0], CHUNK_SIZE):
+        chunk = slice(start, start + CHUNK_SIZE)
+        stats[chunk], lags[chunk] = _adf_stat(x[chunk], maxlag, autolag, regression)
+
+    return stats, mackinnon_pvalue(stats, regression, 1), lags
+
+
+def batched_coint(y0: np.ndarray, y1: np.ndarray, maxlag: int = None, autolag: str = 'aic'):
+    """
+    Run the Engle-Granger two-step cointegration test (statsmodels.coint with trend='c') on every row of two
+    2-D arrays: y0 is regressed on y1 with a constant and the residuals go through a batched ADF test.
+
+    :param y0: A 2-D numpy array with one series per row (e.g. one window or one symbol per row).
+    :param y1: A 2-D numpy array of the same shape as y0.
+    :param maxlag: An integer representing the maximum lag order (or the lag order when autolag is None).
+                   Default is the statsmodels default for the series length.
+    :param autolag: 'aic' to choose the lag order of every row as statsmodels does, or None to use maxlag for all
+                    rows, which skips the lag search entirely.
+    :return: A tuple (statistics, p-values) of 1-D numpy arrays, one element per row.
+    """
+    y0 = np.atleast_2d(np.asarray(y0, dtype=np.float64))
+    y1 = np.atleast_2d(np.asarray(y1, dtype=np.float64))
+    if y0.shape != y1.shape:
+        raise ValueError("y0 and y1 must have the same shape")
+    if maxlag is None:
+        maxlag = default_maxlag(y0.shape[1], 'n')
+
+    stats = np.empty(y0.shape[0])
+    for start in range(0, y0.shape[0], CHUNK_SIZE):
+        chunk = slice(start, start + CHUNK_SIZE)
+        a, b = y0[chunk], y1[chunk]
+
+        # First step: OLS of y0 on y1 with a constant
+        da = a - a.mean(axis=1, keepdims=True)
+        db = b - b.mean(axis=1, keepdims=True)
+        sab = np.einsum('bi,bi->b', da, db)
+        sbb = np.einsum('bi,bi->b', db, db)
+        saa = np.einsum('bi,bi->b', da, da)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            beta = sab / sbb
+            resid = da - beta[:, None] * db
+            rsquared = 1 - np.einsum('bi,bi->b', resid, resid) / saa
+
+        # Second step: ADF without constant on the residuals
+        stat = np.full(len(a), -np.inf)
+        usable = rsquared < COLINEAR_RSQUARED
+        if usable.any():
+            stat[usable] = _adf_stat(resid[usable], maxlag, autolag, 'n')[0]
+        if not usable.all():
+            logger.warning(f"{int((~usable).sum())} rows are (almost) perfectly colinear")
+        stats[chunk] = stat
+
+    return stats, mackinnon_pvalue(stats, 'c', 2)
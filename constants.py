@@ -1,3 +1,9 @@
+# Discover Candidate Pairs among DISCOVERY_SYMBOLS, the pair list of the scan
+DISCOVER_PAIRS = True
+
+# Find Cointegrated Baskets among DISCOVERY_SYMBOLS, saved to COINTEGRATED_BASKETS_FILE
+FIND_BASKETS = True
+
 # Find Cointegrated Pairs
 FIND_COINTEGRATED = True
 
@@ -11,12 +17,143 @@ PLACE_TRADES = True
 TIMEFRAME = 5
 WINDOW_LENGTH = 288
 
+# Symbol whose bars confirm a new candle, and how often and how many times to ask for it
+CANDLE_SYMBOL = 'EURUSD'
+CANDLE_CONFIRM_RETRY = 0.25
+CANDLE_CONFIRM_ATTEMPTS = 20
+
+# Seconds after the candle close by which every stage of a candle must have finished
+STAGE_DEADLINES = {'discover': 30, 'baskets': 60, 'scan': 60, 'reconcile': 10, 'exits': 30, 'entries': 90}
+
+# Trading backend: 'mt5' for the terminal, 'simulated' to replay the bars recorded in SIM_DATA_DIR
+BROKER_BACKEND = 'mt5'
+SIM_DATA_DIR = 'bar_store'
+# Simulated spread in points, None uses the spread recorded with each bar; simulated order latency in seconds
+SIM_SPREAD_POINTS = None
+SIM_LATENCY = 0.0
+
+# Send the two legs of a pair order to the terminal from two threads at once. The MetaTrader5 package is not
+# documented as thread-safe, so the legs go one after the other unless this is enabled after checking it with the
+# terminal build in use; the simulated backend always sends them at once
+CONCURRENT_LEG_ORDERS = False
+# Attempts at closing the filled leg of a pair order whose other leg failed
+FLATTEN_ATTEMPTS = 3
+
+# Seconds between health checks of the terminal connection, and the backoff when it has to reconnect
+SESSION_HEALTH_INTERVAL = 30
+SESSION_RETRIES = 5
+SESSION_BACKOFF = 0.5
+SESSION_MAX_BACKOFF = 30
+
+# Pair filters of find_cointegrated_pairs and discover_pairs: correlation a pair must exceed and longest half-life
+MIN_CORRELATION = 0.7
+MAX_HALF_LIFE = 35
+
+# Parameter grid of sweep.py, the bars every cell is backtested on, and the processes evaluating the grid
+SWEEP_GRID = {
+    'window': [144, 288, 576],
+    'min_correlation': [0.6, 0.7, 0.8],
+    'max_half_life': [20, 35, 50],
+    'entry_zscore': [1.5, 2.0, 2.5],
+    'exit_zscore': [0.0, 0.5],
+}
+SWEEP_BARS = 28800
+SWEEP_WORKERS = 1
+
+# Backtest outputs: columnar format of the results ('parquet', 'feather' or 'npz') and points per plotted trace
+RESULTS_FORMAT = 'parquet'
+REPORT_MAX_POINTS = 2000
+
+# Results of benchmarks.py are compared with this file, a benchmark slower than TOLERANCE times its baseline fails
+BENCHMARK_BASELINE_FILE = 'benchmark_baseline.json'
+BENCHMARK_TOLERANCE = 1.5
+
+# Latency histograms and counters of the hot paths, exported in the Prometheus text format to METRICS_FILE
+# after every candle and, when METRICS_PORT is set, over HTTP on that port
+METRICS_ENABLED = False
+METRICS_PREFIX = 'pair_trading'
+METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+METRICS_FILE = 'metrics.prom'
+METRICS_PORT = None
+
+# Logging, configured by log_config.setup_logging from the entry points. LOG_LEVELS overrides the level of
+# single modules, and records below WARNING are limited to LOG_RATE_LIMIT per call site every LOG_RATE_INTERVAL
+# seconds
+LOG_LEVEL = 'INFO'
+LOG_LEVELS = {'statistical_functions': 'WARNING', 'streaming_stats': 'WARNING', 'rolling_stats': 'WARNING',
+              'mt5_data': 'WARNING', 'bar_store': 'WARNING'}
+LOG_FILE = 'app.log'
+LOG_FORMAT = '%(asctime)s - %(name)s - %(threadName)s - %(levelname)s - %(message)s'
+LOG_RATE_LIMIT = 10
+LOG_RATE_INTERVAL = 60
+
+# Hedge ratio model of ForexStats and the backtest: 'ols' over the window, or 'kalman' for a time-varying hedge
+# ratio. KALMAN_DELTA sets how fast it may drift: about the variance of its step per bar, so 1e-6 lets it move
+# some 0.02 a day on M5 bars. Much smaller keeps it all but static, much larger only chases the spread's noise.
+# The observation variance is estimated when None
+HEDGE_MODEL = 'ols'
+KALMAN_DELTA = 1e-6
+KALMAN_OBSERVATION_VARIANCE = None
+
+# Keep a local copy of the bars and only download the new ones
+USE_BAR_STORE = True
+BAR_STORE_DIR = 'bar_store'
+
+# Processes used to scan pairs for cointegration, 1 scans them one at a time
+SCAN_WORKERS = 1
+
+# Bars fetched per candle to update the streaming statistics of a pair
+STREAM_REFRESH_BARS = 5
+
 # Thresholds - Opening
 VOLUME = 0.1
 MAX_SPREAD_POINTS = 15
+ENTRY_ZSCORE = 2.0
+
+# Commission per side as a fraction of the traded notional, about 7 USD per round-trip lot on EURUSD
+COMMISSION_RATE = 3e-5
+
+# Thresholds - Closing: z-score of a reverted trade, z-score of a stopped one, and longest holding in half-lives
+EXIT_ZSCORE = 0.0
+STOP_ZSCORE = 4.0
+MAX_HOLDING_HALF_LIVES = 3
+
+
+# Timeframes longer than BASE_TIMEFRAME are built locally from its bars instead of being downloaded separately
+RESAMPLE_TIMEFRAMES = True
+BASE_TIMEFRAME = TIMEFRAME
+
+# Intra-candle signals of tick_stream.py: ticks kept per symbol, most ticks fetched per symbol and poll, and
+# seconds between polls
+TICK_BUFFER_SIZE = 4096
+TICK_POLL_COUNT = 1000
+TICK_POLL_INTERVAL = 0.1
+
+
+# Symbol universe searched by discover_pairs: the 28 majors and crosses of the 8 major currencies
+DISCOVERY_SYMBOLS = [
+    'EURUSD', 'GBPUSD', 'AUDUSD', 'NZDUSD', 'USDCAD', 'USDCHF', 'USDJPY',
+    'EURGBP', 'EURAUD', 'EURNZD', 'EURCAD', 'EURCHF', 'EURJPY',
+    'GBPAUD', 'GBPNZD', 'GBPCAD', 'GBPCHF', 'GBPJPY',
+    'AUDNZD', 'AUDCAD', 'AUDCHF', 'AUDJPY',
+    'NZDCAD', 'NZDCHF', 'NZDJPY',
+    'CADCHF', 'CADJPY', 'CHFJPY']
+
+# Bars missing from a few symbols of the universe are forward-filled for up to this many bars
+DISCOVERY_GAP = 'ffill'
+DISCOVERY_MAX_FILL = 2
+
+# Baskets searched by discover_baskets: their sizes, the lagged differences of the Johansen test, the significance
+# of its trace test (0.1, 0.05 or 0.01), and whether the symbols of a basket must share their quote currency
+BASKET_SIZES = (3, 4)
+BASKET_K_AR_DIFF = 1
+BASKET_SIGNIFICANCE = 0.05
+BASKET_SHARED_QUOTE = False
+COINTEGRATED_BASKETS_FILE = 'cointegrated_baskets.json'
 
 
 COINTEGRATED_PAIRS_FILE = 'cointegrated_pairs.json'
 PAIRS_CORR_FILE = 'pairs_corr.json'
-OPEN_TRADES_FILE = 'open_trades.json'
+# Append-only journal of the open pair trades, replayed by PositionBook at start-up
+OPEN_TRADES_FILE = 'open_trades.jsonl'
 COINTEGRATED_PAIRS_FILE = 'cointegrated_pairs.json'
@@ -0,0 +1,89 @@
+import logging
+import numpy as np
+from mt5_data import get_prices
+from broker import timeframe_seconds
+from constants import TIMEFRAME, WINDOW_LENGTH, EXIT_ZSCORE, STOP_ZSCORE, MAX_HOLDING_HALF_LIVES
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Fields a trade record of the PositionBook needs for its exits to be managed
+EXIT_FIELDS = ('hedge_ratio', 'entry_zscore', 'half_life', 'entry_time')
+
+
+def evaluate_exits(records: list, symbols: list, times: np.ndarray, prices: np.ndarray, period: int,
+                   exit_zscore: float = EXIT_ZSCORE, stop_zscore: float = STOP_ZSCORE,
+                   max_half_lives: float = MAX_HOLDING_HALF_LIVES) -> list:
+    """
+    Decide which open pair trades to close, all in one vectorized pass. The spread of every trade is rebuilt
+    from a shared price matrix with the hedge ratio it was entered with, and its z-score is taken over the
+    whole window, like ForexStats.calculate_zscore.
+
+    A trade entered with a negative z-score is long the spread, one entered with a positive z-score is short.
+    It is closed when:
+    - 'target': the z-score has come back to exit_zscore on the entry side of the mean, or crossed it;
+    - 'stop': the z-score has moved past stop_zscore away from the mean;
+    - 'time': it has been open for more than max_half_lives half-lives.
+
+    :param records: A list of trade records holding the EXIT_FIELDS, entry_time being a bar time in seconds.
+    :param symbols: A list with the name of every symbol, in column order of prices.
+    :param times: A 1-D numpy array of bar times in seconds, matching the rows of prices.
+    :param prices: A 2-D numpy array of aligned prices, one row per bar and one column per symbol.
+    :param period: An integer representing the length of a bar, in seconds.
+    :param exit_zscore: A float representing the z-score magnitude at which a trade has reverted. Default is EXIT_ZSCORE.
+    :param stop_zscore: A float representing the z-score magnitude at which a trade is stopped. Default is STOP_ZSCORE.
+    :param max_half_lives: A float representing the longest holding time, in half-lives. Default is MAX_HOLDING_HALF_LIVES.
+    :return: A list of close instructions, dictionaries with the symbols and tickets of the trade, the
+             reason and the current z-score.
+    """
+    if not records or not len(times):
+        return []
+
+    column = {symbol: k for k, symbol in enumerate(symbols)}
+    ix = np.array([column[record['symbol_x']] for record in records])
+    iy = np.array([column[record['symbol_y']] for record in records])
+    hedge_ratio = np.array([record['hedge_ratio'] for record in records], dtype=np.float64)
+    side = -np.sign([record['entry_zscore'] for record in records])
+    half_life = np.array([record['half_life'] for record in records], dtype=np.float64)
+    entry_time = np.array([record['entry_time'] for record in records], dtype=np.float64)
+
+    # One column per trade
+    spreads = prices[:, ix] - hedge_ratio * prices[:, iy]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        zscore = (spreads[-1] - spreads.mean(axis=0)) / spreads.std(axis=0)
+    bars_held = (times[-1] - entry_time) / period
+
+    # side * zscore rises towards 0 as a trade reverts
+    reason = np.full(len(records), '', dtype=object)
+    reason[bars_held > max_half_lives * half_life] = 'time'
+    reason[side * zscore <= -stop_zscore] = 'stop'
+    reason[side * zscore >= -exit_zscore] = 'target'
+
+    return [{
+        'symbol_x': records[k]['symbol_x'],
+        'symbol_y': records[k]['symbol_y'],
+        'ticket_x': records[k]['ticket_x'],
+        'ticket_y': records[k]['ticket_y'],
+        'reason': reason[k],
+        'zscore': float(zscore[k]),
+    } for k in np.flatnonzero(reason != '')]
+
+
+def find_exits(book, timeframe: int = TIMEFRAME, count: int = WINDOW_LENGTH) -> list:
+    """
+    Fetch one price matrix covering every symbol of the open trades of a PositionBook and evaluate their exits.
+
+    :return: A list of close instructions, see evaluate_exits.
+    """
+    records = []
+    for record in book:
+        if all(field in record for field in EXIT_FIELDS):
+            records.append(record)
+        else:
+            logger.warning(f"Trade {record['symbol_x']}-{record['symbol_y']} is missing exit fields, not managed")
+    if not records:
+        return []
+
+    symbols = sorted({record['symbol_x'] for record in records} | {record['symbol_y'] for record in records})
+    times, prices = get_prices(symbols, timeframe, count, 'close')
+    return evaluate_exits(records, symbols, times, prices, timeframe_seconds(timeframe))
@@ -0,0 +1,64 @@
+import sys
+import types
+import broker
+from broker import SimulatedBroker
+
+# Constants of the MetaTrader5 package the bot uses, with the values the terminal uses
+CONSTANTS = ('TIMEFRAME_M5', 'TRADE_ACTION_DEAL', 'ORDER_TYPE_BUY', 'ORDER_TYPE_SELL', 'ORDER_FILLING_IOC',
+             'ORDER_TIME_GTC', 'TRADE_RETCODE_DONE', 'TRADE_RETCODE_INVALID', 'TRADE_RETCODE_INVALID_VOLUME',
+             'TRADE_RETCODE_MARKET_CLOSED', 'TRADE_RETCODE_POSITION_CLOSED', 'COPY_TICKS_ALL')
+
+# Functions of the MetaTrader5 package the bot calls, served by the simulated backend
+FUNCTIONS = ('initialize', 'shutdown', 'terminal_info', 'copy_rates_from_pos', 'copy_ticks_from', 'symbol_info',
+             'symbol_info_tick', 'order_check', 'order_send')
+
+
+def make_module(simulated: SimulatedBroker) -> types.ModuleType:
+    """
+    Build a stand-in for the MetaTrader5 package whose functions are served by a SimulatedBroker, so the
+    MT5Broker path of the bot runs without a terminal.
+
+    Args:
+        simulated (SimulatedBroker): The backend answering the calls.
+
+    Returns:
+        ModuleType: The fake module, named 'MetaTrader5'.
+    """
+    module = types.ModuleType('MetaTrader5')
+    module.__doc__ = 'Fake MetaTrader5 package backed by a SimulatedBroker'
+    for name in CONSTANTS:
+        setattr(module, name, getattr(broker, name))
+    for name in FUNCTIONS:
+        setattr(module, name, getattr(simulated, name))
+
+    # The package takes the filters as keyword arguments only
+    def positions_get(**filters):
+        return simulated.positions_get(**filters)
+
+    module.positions_get = positions_get
+    module.last_error = lambda: (1, 'Success')
+    module.simulated = simulated
+    return module
+
+
+def install(simulated: SimulatedBroker) -> types.ModuleType:
+    """
+    Register a fake MetaTrader5 package in sys.modules, replacing the real one if it was imported.
+
+    Returns:
+        ModuleType: The fake module. Call uninstall to remove it.
+    """
+    module = make_module(simulated)
+    module.replaced = sys.modules.get('MetaTrader5')
+    sys.modules['MetaTrader5'] = module
+    return module
+
+
+def uninstall() -> None:
+    """
+    Remove the fake MetaTrader5 package from sys.modules, restoring the module it replaced.
+    """
+    module = sys.modules.pop('MetaTrader5', None)
+    replaced = getattr(module, 'replaced', None)
+    if replaced is not None:
+        sys.modules['MetaTrader5'] = replaced
@@ -0,0 +1,106 @@
+import logging
+import numpy as np
+from constants import KALMAN_DELTA, KALMAN_OBSERVATION_VARIANCE, WINDOW_LENGTH
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Keys of the series returned by kalman_filter
+KALMAN_STATS = ('hedge_ratio', 'intercept', 'spread', 'spread_variance', 'zscore')
+
+
+def observation_variance(arr1: np.ndarray, arr2: np.ndarray) -> float:
+    """
+    Estimate the variance of the observation noise as the residual variance of the OLS of arr1 on arr2 with a
+    constant.
+
+    :param arr1: A 1-D numpy array representing the first time-series data.
+    :param arr2: A 1-D numpy array representing the second time-series data.
+    :return: A float representing the variance, with a small floor for degenerate inputs.
+    """
+    d1, d2 = arr1 - arr1.mean(), arr2 - arr2.mean()
+    s22 = d2 @ d2
+    resid = d1 - (d1 @ d2 / s22) * d2 if s22 > 0 else d1
+    return max(float(resid @ resid / max(len(resid) - 2, 1)), 1e-12)
+
+
+def kalman_filter(arr1: np.ndarray, arr2: np.ndarray, delta: float = KALMAN_DELTA,
+                  obs_variance: float = KALMAN_OBSERVATION_VARIANCE, warmup: int = WINDOW_LENGTH,
+                  state: tuple = None) -> dict:
+    """
+    Estimate a time-varying hedge ratio with a Kalman filter, in one recursive pass at constant cost per bar.
+    The model is arr1[t] = hedge_ratio[t] * arr2[t] + intercept[t] + noise, the hedge ratio and intercept
+    following a random walk whose step covariance is delta / (1 - delta) times the identity.
+
+    Every output is causal: the values of bar t only use bars up to t.
+    - hedge_ratio and intercept are the estimates after bar t;
+    - spread is arr1 - hedge_ratio * arr2 - intercept, the residual of the model after bar t;
+    - spread_variance is the variance of the one-step forecast error of arr1;
+    - zscore is that forecast error over its standard deviation.
+
+    :param arr1: A 1-D numpy array representing the first time-series data.
+    :param arr2: A 1-D numpy array representing the second time-series data.
+    :param delta: A float setting how fast the hedge ratio may drift. Default is KALMAN_DELTA.
+    :param obs_variance: An optional float representing the variance of the observation noise. Default is
+                         KALMAN_OBSERVATION_VARIANCE; None estimates it on the first `warmup` bars.
+    :param warmup: An integer representing the number of bars obs_variance is estimated on. Default is WINDOW_LENGTH.
+    :param state: An optional tuple returned as 'state' by a previous call, to carry on from its last bar.
+    :return: A dictionary of 1-D numpy arrays keyed by the names in KALMAN_STATS, plus the 'state' tuple.
+    """
+    x = np.asarray(arr1, dtype=np.float64)
+    y = np.asarray(arr2, dtype=np.float64)
+    if len(x) != len(y):
+        raise ValueError("arr1 and arr2 must have the same length")
+    n = len(x)
+
+    if state is None:
+        if obs_variance is None:
+            obs_variance = observation_variance(x[:warmup], y[:warmup]) if n > 2 else 1e-8
+        # Start from the ratio of the first prices, with a covariance wide enough to settle within a few bars
+        beta = float(x[0] / y[0]) if n and y[0] else 0.0
+        alpha = 0.0
+        p11, p12, p22 = 1.0, 0.0, 1.0
+        r = obs_variance
+    else:
+        beta, alpha, p11, p12, p22, r = state
+    q = delta / (1 - delta)
+
+    hedge_ratio = np.empty(n)
+    intercept = np.empty(n)
+    variance = np.empty(n)
+    error = np.empty(n)
+    # Python floats are much faster than numpy scalars in a loop this tight
+    for t, (x_t, y_t) in enumerate(zip(x.tolist(), y.tolist())):
+        # Predict: the state is a random walk
+        p11 += q
+        p22 += q
+
+        # Forecast arr1 from arr2 with the predicted state, h = [y_t, 1]
+        e = x_t - beta * y_t - alpha
+        ph1 = p11 * y_t + p12
+        ph2 = p12 * y_t + p22
+        s = y_t * ph1 + ph2 + r
+
+        # Update with the Kalman gain
+        k1, k2 = ph1 / s, ph2 / s
+        beta += k1 * e
+        alpha += k2 * e
+        p11 -= k1 * ph1
+        p12 -= k1 * ph2
+        p22 -= k2 * ph2
+
+        hedge_ratio[t] = beta
+        intercept[t] = alpha
+        variance[t] = s
+        error[t] = e
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        zscore = error / np.sqrt(variance)
+    return {
+        'hedge_ratio': hedge_ratio,
+        'intercept': intercept,
+        'spread': x - hedge_ratio * y - intercept,
+        'spread_variance': variance,
+        'zscore': zscore,
+        'state': (beta, alpha, p11, p12, p22, r),
+    }
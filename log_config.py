@@ -0,0 +1,115 @@
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from constants import LOG_LEVEL, LOG_LEVELS, LOG_FILE, LOG_FORMAT, LOG_RATE_LIMIT, LOG_RATE_INTERVAL
+
+# Listener writing the queued records of the process, once setup_logging ran
+_listener = None
+
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, limit: int = LOG_RATE_LIMIT, interval: float = LOG_RATE_INTERVAL,
+                 level: int = logging.WARNING) -> None:
+        """
+        Let at most `limit` records of every call site through per `interval` seconds. Records at `level` or
+        above always pass. The first record let through after some were dropped says how many were.
+
+        Args:
+            limit (int): Records of a call site let through per interval.
+            interval (float): The length of an interval, in seconds.
+            level (int): The level from which records are never dropped.
+        """
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self.level = level
+        self.lock = threading.Lock()
+        self.sites = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.level:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            started, count, dropped = self.sites.get(key, (now, 0, 0))
+            if now - started >= self.interval:
+                started, count = now, 0
+            if count >= self.limit:
+                self.sites[key] = (started, count, dropped + 1)
+                return False
+            self.sites[key] = (started, count + 1, 0)
+        if dropped:
+            record.msg = f'{record.msg} (dropped {dropped} similar messages)'
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler leaving the formatting of a record to the listener thread. Only the message is rendered
+    in the calling thread, so arguments changed afterwards cannot alter it.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(level: str = LOG_LEVEL, levels: dict = LOG_LEVELS, filename: str = LOG_FILE,
+                  fmt: str = LOG_FORMAT, rate_limit: int = LOG_RATE_LIMIT,
+                  rate_interval: float = LOG_RATE_INTERVAL) -> logging.handlers.QueueListener:
+    """
+    Configure the logging of the process, once, from its entry point. Records below WARNING are rate-limited
+    per call site, then handed to a background thread through an unbounded queue, so writing them never
+    blocks the caller. Calling it again replaces the previous configuration.
+
+    Args:
+        level (str): The level of the root logger.
+        levels (dict): Levels of single modules by logger name, e.g. {'mt5_data': 'WARNING'}.
+        filename (str): The file records are appended to. None writes them to stderr.
+        fmt (str): The format of a record.
+        rate_limit (int): Records of a call site let through per rate_interval. None disables the limit.
+        rate_interval (float): The length of a rate-limiting interval, in seconds.
+
+    Returns:
+        QueueListener: The running listener, stopped at exit.
+    """
+    global _listener
+    stop_logging()
+
+    target = logging.FileHandler(filename) if filename else logging.StreamHandler()
+    target.setFormatter(logging.Formatter(fmt))
+    handler = DeferredQueueHandler(queue.SimpleQueue())
+    if rate_limit is not None:
+        handler.addFilter(RateLimitFilter(rate_limit, rate_interval))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+        existing.close()
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name, module_level in levels.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = logging.handlers.QueueListener(handler.queue, target, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging() -> None:
+    """
+    Write out the queued records and stop the listener thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -1,34 +1,86 @@
-import json
-import time
-import numpy as np
-import logging
+import asyncio
 from constants import *
-from mt5_connector import connect_to_mt5
-from main_cointegration import find_cointegrated_pairs
-from mt5_data import get_time
+from main_cointegration import find_cointegrated_pairs, find_candidate_pairs, find_candidate_baskets
+from mt5_positions import get_all_positions, close_order_by_ticket, close_pair_by_tickets
+from exit_manager import find_exits
+from position_book import PositionBook
+from scheduler import CandleScheduler
+from metrics import registry
+from log_config import setup_logging
+
+# Open pair trades, replayed from their journal on first use
+book = None
+
+
+def get_book():
+    global book
+    if book is None:
+        book = PositionBook(OPEN_TRADES_FILE)
+    return book
+
+
+def reconcile_positions():
+    # One snapshot of every open position instead of a query per ticket
+    positions = get_all_positions()
+    if positions is None:
+        return
+    book = get_book()
+
+    # Pair trades left with a single leg are flattened. A trade stays in the book until its open leg closed,
+    # so a failed flatten is reported as broken again and retried on the next candle
+    for record in book.reconcile(positions)['broken']:
+        flattened = [close_order_by_ticket(ticket, comment="flatten")
+                     for ticket in (record['ticket_x'], record['ticket_y']) if book.ticket_open(ticket)]
+        if all(flattened):
+            book.close_pair(record['symbol_x'], record['symbol_y'], reason='flattened')
+
+
+def manage_exits():
+    # Close every open pair trade whose exit rules fired, evaluated together on one price matrix
+    book = get_book()
+    for instruction in find_exits(book):
+        if close_pair_by_tickets(instruction['ticket_x'], instruction['ticket_y'], comment=instruction['reason']):
+            book.close_pair(instruction['symbol_x'], instruction['symbol_y'], reason=instruction['reason'])
+
+
+def place_entries():
+    # Manage New Positions
+    pass
+
+
+def export_metrics():
+    # Latency histograms and counters of the candle, for the Prometheus textfile collector
+    if registry.enabled and METRICS_FILE:
+        registry.write_textfile(METRICS_FILE)
+
+
+def run_live(max_candles=None):
+    # Run the stages on every candle, until stopped or max_candles candles ran
+    scheduler = CandleScheduler(TIMEFRAME, CANDLE_SYMBOL, CANDLE_CONFIRM_RETRY, CANDLE_CONFIRM_ATTEMPTS)
+
+    if DISCOVER_PAIRS:
+        scheduler.add_stage('discover', find_candidate_pairs, STAGE_DEADLINES['discover'])
+
+    if FIND_BASKETS:
+        scheduler.add_stage('baskets', find_candidate_baskets, STAGE_DEADLINES['baskets'])
+
+    if FIND_COINTEGRATED:
+        scheduler.add_stage('scan', find_cointegrated_pairs, STAGE_DEADLINES['scan'], after='discover')
+
+    scheduler.add_stage('reconcile', reconcile_positions, STAGE_DEADLINES['reconcile'])
+
+    if MANAGE_EXITS:
+        scheduler.add_stage('exits', manage_exits, STAGE_DEADLINES['exits'], after='reconcile')
+
+    if PLACE_TRADES:
+        scheduler.add_stage('entries', place_entries, STAGE_DEADLINES['entries'], after='scan')
+
+    if METRICS_ENABLED and METRICS_PORT:
+        registry.serve(METRICS_PORT)
+
+    asyncio.run(scheduler.run(max_candles, after_candle=export_metrics))
 
-logging.basicConfig(filename='app.log', filemode='a',
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
 if __name__ == "__main__":
-    last_candle_time = 0
-    while True:
-        if last_candle_time != get_time('EURUSD', TIMEFRAME):
-            try:
-                # Get the current time
-                last_candle_time = get_time('EURUSD', TIMEFRAME)
-
-                logging.info("Storing cointegrated pairs...")
-                cointegrated_pairs = find_cointegrated_pairs()
-
-            except Exception as e:
-                logging.error(f"Unexpected error occurred: {str(e)}")
-                time.sleep(5)  # wait for 5 seconds before next iteration
-
-        if MANAGE_EXITS:
-            # Manage Existing Positions
-            pass
-
-        if PLACE_TRADES:
-            # Manage New Positions
-            pass
+    setup_logging()
+    run_live()
@@ -1,16 +1,142 @@
 import json
 import numpy as np
 import os
+import time
 import logging
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 from statistical_functions import ForexStats
-from mt5_data import get_data
+from pair_discovery import discover_pairs
+from basket_discovery import discover_baskets, candidate_baskets
+from streaming_stats import StreamingForexStats
+from mt5_data import get_prices
+from metrics import instrument
 from constants import *
 
 # Initialize logger
 logger = logging.getLogger(__name__)
 
+# Streaming statistics of every pair, kept across candles
+pair_streams = {}
 
-def find_cointegrated_pairs():
+# Seconds spent fetching and computing during the last scan
+scan_timings = {}
+
+# Process pool of the parallel scan, kept across candles
+_executor = None
+_executor_workers = 0
+
+# Shared memory blocks attached in a worker process, by name
+_attached = {}
+
+
+def write_json(path, data):
+    # Write through a temporary file replaced in one step, so readers never see a partly written file
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(data, file, indent=4)
+    os.replace(temporary, path)
+
+
+def get_pair_stream(pair):
+    # Update the pair's window with the latest bars, or seed it from a full window on first use or after a gap
+    stream = pair_streams.get(tuple(pair))
+    if stream is not None:
+        times, prices = get_prices(pair, 5, STREAM_REFRESH_BARS, 'close')
+        if stream.update(times, prices[:, 0], prices[:, 1]):
+            return stream
+
+    times, prices = get_prices(pair, 5, WINDOW_LENGTH, 'close')
+    stream = StreamingForexStats(WINDOW_LENGTH).seed(prices[:, 0], prices[:, 1], times)
+    pair_streams[tuple(pair)] = stream
+    return stream
+
+
+def is_cointegrated_pair(forex_stats):
+    # If pair is highly correlated, cointegrated, and has a half-life less than or equal to MAX_HALF_LIFE
+    return (forex_stats.calculate_correlation() > MIN_CORRELATION and forex_stats.check_cointegration()
+            and forex_stats.calculate_half_life() <= MAX_HALF_LIFE)
+
+
+def get_executor(workers):
+    global _executor, _executor_workers
+    if _executor is None or _executor_workers != workers:
+        if _executor is not None:
+            _executor.shutdown()
+        _executor = ProcessPoolExecutor(max_workers=workers)
+        _executor_workers = workers
+    return _executor
+
+
+def _attach(spec):
+    # Map the shared memory blocks of the current scan into this worker without copying them
+    names = (spec['times'], spec['closes'])
+    for name in list(_attached):
+        if name not in names:
+            _attached.pop(name).close()
+    for name in names:
+        if name not in _attached:
+            _attached[name] = shared_memory.SharedMemory(name=name)
+    return (np.ndarray(spec['shape'], dtype=np.int64, buffer=_attached[names[0]].buf),
+            np.ndarray(spec['shape'], dtype=np.float64, buffer=_attached[names[1]].buf))
+
+
+def _scan_chunk(spec, chunk):
+    # Worker side: align each pair on the shared time matrix and run the statistical tests
+    times, closes = _attach(spec)
+    lengths = spec['lengths']
+    results = []
+    for i, j in chunk:
+        _, idx1, idx2 = np.intersect1d(times[i, :lengths[i]], times[j, :lengths[j]],
+                                       assume_unique=True, return_indices=True)
+        # The serial scan's StreamingForexStats is OLS only, so both scans accept the same pairs
+        results.append(is_cointegrated_pair(ForexStats(closes[i, idx1], closes[j, idx2], hedge_model='ols')))
+    return results
+
+
+def scan_pairs_parallel(pairs, workers):
+    # Fetch every symbol once
+    start = time.perf_counter()
+    symbols = sorted({symbol for pair in pairs for symbol in pair})
+    data = {symbol: get_prices([symbol], 5, WINDOW_LENGTH, 'close') for symbol in symbols}
+    scan_timings['fetch'] = time.perf_counter() - start
+
+    # Share the prices with the workers: one row per symbol, padded to WINDOW_LENGTH. The blocks belong
+    # to the parent, the workers only map them.
+    start = time.perf_counter()
+    shape = (len(symbols), WINDOW_LENGTH)
+    blocks = [shared_memory.SharedMemory(create=True, size=max(8 * shape[0] * shape[1], 1)) for _ in range(2)]
+    try:
+        times = np.ndarray(shape, dtype=np.int64, buffer=blocks[0].buf)
+        closes = np.ndarray(shape, dtype=np.float64, buffer=blocks[1].buf)
+        lengths = []
+        for row, symbol in enumerate(symbols):
+            symbol_times, symbol_closes = data[symbol]
+            n = min(len(symbol_times), WINDOW_LENGTH)
+            times[row, :n] = symbol_times[len(symbol_times) - n:]
+            closes[row, :n] = symbol_closes[len(symbol_times) - n:, 0]
+            lengths.append(n)
+
+        spec = {'times': blocks[0].name, 'closes': blocks[1].name, 'shape': shape, 'lengths': lengths}
+        index = {symbol: row for row, symbol in enumerate(symbols)}
+        tasks = [(index[pair[0]], index[pair[1]]) for pair in pairs]
+        chunk_size = max(1, -(-len(tasks) // (4 * workers)))
+        chunks = [tasks[k:k + chunk_size] for k in range(0, len(tasks), chunk_size)]
+
+        # Results come back in submission order, so the output order is deterministic
+        results = [flag for chunk_result in get_executor(workers).map(
+            _scan_chunk, [spec] * len(chunks), chunks) for flag in chunk_result]
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    scan_timings['compute'] = time.perf_counter() - start
+
+    return [pair for pair, flag in zip(pairs, results) if flag]
+
+
+@instrument()
+def find_cointegrated_pairs(workers=SCAN_WORKERS):
     # Attempt to load JSON file containing currency pairs to check
     try:
         with open(PAIRS_CORR_FILE, 'r') as file:
@@ -25,30 +151,84 @@ def find_cointegrated_pairs():
             f"Error: The file {PAIRS_CORR_FILE} does not contain valid JSON.")
         return []
 
-    # Initialize list to store cointegrated pairs
-    cointegrated_pairs = []
+    if workers > 1:
+        # Fetch all symbols up front and test the pairs across a process pool
+        cointegrated_pairs = scan_pairs_parallel(pairs, workers)
+    else:
+        # Initialize list to store cointegrated pairs
+        cointegrated_pairs = []
+        scan_timings['fetch'] = scan_timings['compute'] = 0.0
 
-    # Iterate over each pair
-    for pair in pairs:
-        logger.info(f'Processing pair: {pair}')
+        # Iterate over each pair
+        for pair in pairs:
+            logger.info(f'Processing pair: {pair}')
 
-        # Get data for the given pair
-        data = get_data(pair, 5, WINDOW_LENGTH, 'close', 'dataframe')
+            # Bring the pair's streaming statistics up to date with the latest bars
+            start = time.perf_counter()
+            forex_stats = get_pair_stream(pair)
+            scan_timings['fetch'] += time.perf_counter() - start
 
-        # Split data into two arrays for analysis
-        arr1 = np.array(data.iloc[:, 0])
-        arr2 = np.array(data.iloc[:, 1])
+            start = time.perf_counter()
+            if is_cointegrated_pair(forex_stats):
+                # Add to the list of cointegrated pairs
+                cointegrated_pairs.append(pair)
+            scan_timings['compute'] += time.perf_counter() - start
 
-        # Initialize ForexStats class with the two time series
-        forex_stats = ForexStats(arr1, arr2)
-
-        # If pair is highly correlated, cointegrated, and has a half-life less than or equal to 35
-        if forex_stats.calculate_correlation() > 0.7 and forex_stats.check_cointegration() and forex_stats.calculate_half_life() <= 35:
-            # Add to the list of cointegrated pairs
-            cointegrated_pairs.append(pair)
+    logger.info(f"Scanned {len(pairs)} pairs with {workers} worker(s): "
+                f"fetch {scan_timings['fetch']:.3f}s, compute {scan_timings['compute']:.3f}s")
 
     # Save cointegrated pairs to JSON file for later use
-    with open(COINTEGRATED_PAIRS_FILE, 'w') as file:
-        json.dump(cointegrated_pairs, file, indent=4)
+    write_json(COINTEGRATED_PAIRS_FILE, cointegrated_pairs)
 
     return cointegrated_pairs
+
+
+@instrument()
+def find_candidate_pairs(symbols=DISCOVERY_SYMBOLS, max_pairs=None):
+    # Fetch the whole universe aligned in one matrix
+    start = time.perf_counter()
+    times, prices = get_prices(list(symbols), 5, WINDOW_LENGTH, 'close', DISCOVERY_GAP, DISCOVERY_MAX_FILL)
+    if not len(times):
+        logger.error("Error: No data fetched for the discovery universe.")
+        return []
+    fetch_time = time.perf_counter() - start
+
+    # Rank the cointegrated pairs of the universe
+    start = time.perf_counter()
+    candidates = discover_pairs(list(symbols), prices)
+    if max_pairs is not None:
+        candidates = candidates[:max_pairs]
+    logger.info(f"Discovered {len(candidates)} pairs among {len(symbols)} symbols: "
+                f"fetch {fetch_time:.3f}s, compute {time.perf_counter() - start:.3f}s")
+
+    # Save the ranked candidates as the pair list for find_cointegrated_pairs, keeping the previous list when
+    # nothing was found so the next scan still has pairs to test
+    pairs = [candidate['pair'] for candidate in candidates]
+    if pairs:
+        write_json(PAIRS_CORR_FILE, pairs)
+    else:
+        logger.warning(f"No candidate pairs found, keeping the pair list in {PAIRS_CORR_FILE}")
+
+    return candidates
+
+
+@instrument()
+def find_candidate_baskets(symbols=DISCOVERY_SYMBOLS, sizes=BASKET_SIZES, shared_quote=BASKET_SHARED_QUOTE):
+    # Fetch the whole universe aligned in one matrix
+    start = time.perf_counter()
+    times, prices = get_prices(list(symbols), 5, WINDOW_LENGTH, 'close', DISCOVERY_GAP, DISCOVERY_MAX_FILL)
+    if not len(times):
+        logger.error("Error: No data fetched for the discovery universe.")
+        return []
+    fetch_time = time.perf_counter() - start
+
+    # Johansen test of every basket of the universe
+    start = time.perf_counter()
+    baskets = candidate_baskets(list(symbols), sizes, shared_quote)
+    cointegrated_baskets = discover_baskets(list(symbols), prices, baskets=baskets)
+    logger.info(f"Discovered {len(cointegrated_baskets)} baskets among {len(symbols)} symbols: "
+                f"fetch {fetch_time:.3f}s, compute {time.perf_counter() - start:.3f}s")
+
+    write_json(COINTEGRATED_BASKETS_FILE, cointegrated_baskets)
+
+    return cointegrated_baskets
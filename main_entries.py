@@ -2,6 +2,7 @@ from constants import *
 from mt5_connector import connect_to_mt5
 from statistical_functions import ForexStats
 from mt5_data import get_data, get_spread
+from log_config import setup_logging
 
 import json
 import logging
@@ -9,15 +10,23 @@ import logging
 # Initialize logger
 logger = logging.getLogger(__name__)
 
-try:
-    with open(COINTEGRATED_PAIRS_FILE, 'r') as file:
-        pairs = json.load(file)
-except FileNotFoundError:
-    logger.error(f"Error: The file {COINTEGRATED_PAIRS_FILE} does not exist.")
-    pairs = []
-except json.JSONDecodeError:
-    logger.error(f"Error: The file {COINTEGRATED_PAIRS_FILE} does not contain valid JSON.")
-    pairs = []
 
-for pair in pairs:
-    logger.info(f'Processing pair: {pair}')
+def run_entries():
+    # Go through the cointegrated pairs found by the last scan
+    try:
+        with open(COINTEGRATED_PAIRS_FILE, 'r') as file:
+            pairs = json.load(file)
+    except FileNotFoundError:
+        logger.error(f"Error: The file {COINTEGRATED_PAIRS_FILE} does not exist.")
+        pairs = []
+    except json.JSONDecodeError:
+        logger.error(f"Error: The file {COINTEGRATED_PAIRS_FILE} does not contain valid JSON.")
+        pairs = []
+
+    for pair in pairs:
+        logger.info(f'Processing pair: {pair}')
+
+
+if __name__ == "__main__":
+    setup_logging()
+    run_entries()
@@ -0,0 +1,180 @@
+import os
+import time
+import bisect
+import logging
+import functools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from constants import METRICS_ENABLED, METRICS_PREFIX, METRICS_BUCKETS
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple) -> None:
+        """
+        Latency histogram with fixed upper bounds, like a Prometheus histogram.
+
+        Args:
+            buckets (tuple): The increasing upper bounds of the buckets, in seconds.
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = METRICS_ENABLED, prefix: str = METRICS_PREFIX,
+                 buckets: tuple = METRICS_BUCKETS) -> None:
+        """
+        Collects the latency of named spans in histograms, and counters, and exports them in the Prometheus
+        text format. While disabled, an instrumented function costs one attribute check per call.
+
+        Args:
+            enabled (bool): Whether spans and counters are recorded.
+            prefix (str): The prefix of every exported metric name.
+            buckets (tuple): The upper bounds of the latency histograms, in seconds.
+        """
+        self.enabled = enabled
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.errors = {}
+        self.counters = {}
+        self.server = None
+
+    def enable(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+
+    def reset(self) -> None:
+        with self.lock:
+            self.histograms.clear()
+            self.errors.clear()
+            self.counters.clear()
+
+    def observe(self, span: str, seconds: float) -> None:
+        """
+        Record one duration of a span.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(span)
+            if histogram is None:
+                histogram = self.histograms[span] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def increment(self, counter: str, value: float = 1) -> None:
+        """
+        Add to a counter.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def instrument(self, span: str = None):
+        """
+        Decorator recording the duration of every call of a function in the histogram of a span, and the
+        exceptions it raises in an error counter.
+
+        Args:
+            span (str): The name of the span. Defaults to the module and qualified name of the function.
+        """
+        def decorator(func):
+            name = span or f'{func.__module__}.{func.__qualname__}'
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                except Exception:
+                    with self.lock:
+                        self.errors[name] = self.errors.get(name, 0) + 1
+                    raise
+                finally:
+                    self.observe(name, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def render(self) -> str:
+        """
+        Returns:
+            str: Every metric in the Prometheus text exposition format.
+        """
+        span_metric = f'{self.prefix}_span_seconds'
+        lines = [f'# HELP {span_metric} Duration of instrumented calls.', f'# TYPE {span_metric} histogram']
+        with self.lock:
+            for span, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{span_metric}_bucket{{span="{span}",le="{le}"}} {cumulative}')
+                lines.append(f'{span_metric}_sum{{span="{span}"}} {histogram.sum!r}')
+                lines.append(f'{span_metric}_count{{span="{span}"}} {histogram.count}')
+
+            error_metric = f'{self.prefix}_span_errors_total'
+            lines += [f'# HELP {error_metric} Exceptions raised by instrumented calls.', f'# TYPE {error_metric} counter']
+            lines += [f'{error_metric}{{span="{span}"}} {count}' for span, count in sorted(self.errors.items())]
+
+            for counter, value in sorted(self.counters.items()):
+                metric = f'{self.prefix}_{counter.replace(".", "_")}_total'
+                lines += [f'# TYPE {metric} counter', f'{metric} {value}']
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path: str) -> None:
+        """
+        Write the metrics to a file, replaced atomically so a collector never reads half of it, e.g. for the
+        textfile collector of the Prometheus node exporter.
+        """
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w') as file:
+            file.write(self.render())
+        os.replace(temp_path, path)
+
+    def serve(self, port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+        """
+        Serve the metrics over HTTP from a daemon thread, for a Prometheus server to scrape.
+
+        Args:
+            port (int): The port to listen on, 0 picks a free one.
+            host (str): The address to listen on. Defaults to the local host only.
+
+        Returns:
+            ThreadingHTTPServer: The running server.
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True).start()
+        logger.info(f'Serving metrics on http://{host}:{self.server.server_address[1]}/metrics')
+        return self.server
+
+
+# Registry shared by every instrumented module
+registry = MetricsRegistry()
+instrument = registry.instrument
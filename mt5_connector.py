@@ -1,17 +1,24 @@
-import MetaTrader5 as mt5
 import logging
 import time
+import functools
+import threading
+from broker import get_broker
+from metrics import instrument
+from constants import SESSION_HEALTH_INTERVAL, SESSION_RETRIES, SESSION_BACKOFF, SESSION_MAX_BACKOFF
 
-logging.basicConfig(level=logging.INFO)
+# Initialize logger
+logger = logging.getLogger(__name__)
 
 
-def connect_to_mt5(retries=3, delay=1):
+@instrument()
+def connect_to_mt5(retries=3, delay=1, max_delay=30):
     """
-    Connects to a MetaTrader5 account.
+    Connects to a MetaTrader5 account, or initializes the backend selected by BROKER_BACKEND.
 
     Args:
         retries (int): The number of times to retry the connection attempt.
-        delay (int): The time delay (in seconds) between connection attempts.
+        delay (int): The time delay (in seconds) before the second attempt, doubled after every failure.
+        max_delay (int): The longest delay (in seconds) between connection attempts.
 
     Returns:
         bool: True if the connection was successful, False otherwise.
@@ -20,20 +27,119 @@ def connect_to_mt5(retries=3, delay=1):
     # Attempt to connect to the MetaTrader5 account
     for i in range(retries):
         try:
-            if mt5.initialize():
-                logging.info('Connected to MetaTrader5 account.')
+            if get_broker().initialize():
+                logger.info('Connected to MetaTrader5 account.')
                 return True
             else:
-                logging.error('Failed to initialize MetaTrader5.')
+                logger.error('Failed to initialize MetaTrader5.')
         except Exception as e:
-            logging.error(f'Failed to connect to MetaTrader5: {e}')
+            logger.error(f'Failed to connect to MetaTrader5: {e}')
 
-        # Wait before the next attempt
-        time.sleep(delay)
+        # Back off before the next attempt
+        if i < retries - 1:
+            time.sleep(min(delay * 2 ** i, max_delay))
 
-    logging.error('Failed to connect to MetaTrader5 after retries.')
+    logger.error('Failed to connect to MetaTrader5 after retries.')
     return False
 
 
+class MT5Session:
+    def __init__(self, health_interval=SESSION_HEALTH_INTERVAL, retries=SESSION_RETRIES, backoff=SESSION_BACKOFF,
+                 max_backoff=SESSION_MAX_BACKOFF):
+        """
+        Keeps one connection to the terminal for every MT5 call of the bot. The terminal is initialized once,
+        a cheap terminal_info call checks the connection at most every health_interval seconds, and it is only
+        initialized again, with backoff, when that check fails. Calls are serialized with a lock, since the
+        MetaTrader5 package is not thread-safe, and the latency of every call is recorded.
+
+        Args:
+            health_interval (float): Seconds between health checks of the connection.
+            retries (int): Connection attempts before giving up on a call.
+            backoff (float): Seconds before the second connection attempt, doubled after every failure.
+            max_backoff (float): The longest wait between connection attempts, in seconds.
+        """
+        self.health_interval = health_interval
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lock = threading.RLock()
+        self.broker = None
+        self.connected = False
+        self.checked_at = 0.0
+        self.reconnects = 0
+        self.latency = {}
+
+    def is_healthy(self):
+        try:
+            info = get_broker().terminal_info()
+            return info is not None and info.connected
+        except Exception as e:
+            logger.error(f'MetaTrader5 health check failed: {e}')
+            return False
+
+    def ensure_connected(self):
+        """
+        Connect on first use, or when the backend changed or the health check fails.
+
+        Returns:
+            bool: True if the terminal is connected.
+        """
+        broker = get_broker()
+        if self.connected and self.broker is broker:
+            if time.monotonic() - self.checked_at < self.health_interval:
+                return True
+            if self.is_healthy():
+                self.checked_at = time.monotonic()
+                return True
+            logger.warning('Lost the connection to MetaTrader5, reconnecting.')
+            self.reconnects += 1
+
+        self.connected = connect_to_mt5(self.retries, self.backoff, self.max_backoff)
+        self.broker = broker
+        self.checked_at = time.monotonic()
+        return self.connected
+
+    def record(self, name, seconds):
+        stats = self.latency.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+        stats['count'] += 1
+        stats['total'] += seconds
+        stats['max'] = max(stats['max'], seconds)
+
+    def execute(self, func):
+        """
+        Decorator running a function that talks to the terminal inside the session.
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.lock:
+                self.ensure_connected()
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                except Exception:
+                    # Check the connection before the next call
+                    self.checked_at = 0.0
+                    raise
+                finally:
+                    self.record(func.__name__, time.perf_counter() - start)
+        return wrapper
+
+    def summary(self):
+        """
+        Returns:
+            dict: The number of calls and the mean and max latency in seconds of every function, and the
+                number of reconnections.
+        """
+        with self.lock:
+            summary = {name: {'count': stats['count'], 'mean': stats['total'] / stats['count'], 'max': stats['max']}
+                       for name, stats in self.latency.items()}
+            summary['reconnects'] = self.reconnects
+            return summary
+
+
+# Session shared by mt5_data and mt5_positions
+session = MT5Session()
+
+
 if __name__ == "__main__":
     connect_to_mt5()
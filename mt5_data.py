@@ -1,11 +1,21 @@
-import MetaTrader5 as mt5
-import pandas as pd
+import numpy as np
 import logging
+from mt5_connector import session
+from metrics import instrument
+from broker import get_broker, TIMEFRAME_M5, COPY_TICKS_ALL, TICKS_DTYPE
+from bar_store import BarStore, RATES_DTYPE
+from resample import Resampler
+from constants import USE_BAR_STORE, BAR_STORE_DIR, RESAMPLE_TIMEFRAMES, BASE_TIMEFRAME
 
-logging.basicConfig(level=logging.INFO)
+# Initialize logger
+logger = logging.getLogger(__name__)
 
 VALID_DATA_TYPES = ('close', 'open', 'high', 'low', 'volume')
 VALID_OUTPUT_FORMATS = ('dataframe', 'csv', 'json')
+VALID_GAP_MODES = ('drop', 'ffill')
+
+# Field of the MT5 rate records holding each data type
+RATE_FIELDS = {'close': 'close', 'open': 'open', 'high': 'high', 'low': 'low', 'volume': 'tick_volume'}
 
 COLUMN_MAP = {
     'close': ('open', 'high', 'low', 'tick_volume', 'spread', 'real_volume'),
@@ -15,30 +25,31 @@ COLUMN_MAP = {
     'volume': ('open', 'high', 'low', 'close', 'spread')
 }
 
+# Local copy of the bars, topped up incrementally from the terminal
+bar_store = None
 
-def connect_and_execute(func):
-    def wrapper(*args, **kwargs):
-        connect_to_mt5()
-        return func(*args, **kwargs)
-    return wrapper
+# Builds the longer timeframes from the bars of BASE_TIMEFRAME
+resampler = None
 
 
 def check_input_validity(symbols, data_type, output_format):
     if not isinstance(symbols, list):
-        logging.error("symbols argument must be a list")
+        logger.error("symbols argument must be a list")
         raise TypeError("symbols argument must be a list")
     if data_type not in VALID_DATA_TYPES:
-        logging.error(f"data_type argument must be one of {VALID_DATA_TYPES}")
+        logger.error(f"data_type argument must be one of {VALID_DATA_TYPES}")
         raise ValueError(
             f"data_type argument must be one of {VALID_DATA_TYPES}")
     if output_format not in VALID_OUTPUT_FORMATS:
-        logging.error(
+        logger.error(
             f"output_format argument must be one of {VALID_OUTPUT_FORMATS}")
         raise ValueError(
             f"output_format argument must be one of {VALID_OUTPUT_FORMATS}")
 
 
+@instrument()
 def process_data_frame(df, symbol, data_type):
+    import pandas as pd
     df['time'] = pd.to_datetime(df['time'], unit='s')
     df.set_index('time', inplace=True)
 
@@ -51,28 +62,141 @@ def process_data_frame(df, symbol, data_type):
     return df
 
 
+def get_rate_source():
+    # Serve bars from the bar store when the backend is a live terminal, replayed bars go straight through.
+    # Either way the longer timeframes are resampled from BASE_TIMEFRAME bars
+    global bar_store, resampler
+    broker = get_broker()
+    if not USE_BAR_STORE or not broker.live:
+        source = broker
+    else:
+        if bar_store is None or bar_store.terminal is not broker:
+            bar_store = BarStore(BAR_STORE_DIR, broker)
+        source = bar_store
+    if not RESAMPLE_TIMEFRAMES:
+        return source
+    if resampler is None or resampler.source is not source:
+        resampler = Resampler(source, BASE_TIMEFRAME)
+    return resampler
+
+
+@instrument()
+@session.execute
+def get_rates_for_symbol(symbol, timeframe, count):
+    source = get_rate_source()
+    rates = source.copy_rates_from_pos(symbol, timeframe, 0, count)
+
+    if rates is None:
+        logger.error(f"Failed to get rates for {symbol} {timeframe}")
+
+    return rates
+
+
 def get_data_for_symbol(symbol, timeframe, count, data_type):
-    rates = mt5.copy_rates_from_pos(symbol, timeframe, 0, count)
+    import pandas as pd
+    rates = get_rates_for_symbol(symbol, timeframe, count)
 
     if rates is None:
-        logging.error(f"Failed to get rates for {symbol} {timeframe}")
         return pd.DataFrame()
 
     return process_data_frame(pd.DataFrame(rates), symbol, data_type)
 
 
-@connect_and_execute
-def get_data(symbols, timeframe, count, data_type='close', output_format='dataframe') -> pd.DataFrame:
+def align_rates(times, values, gap='drop', max_fill=1):
+    """
+    Align several sorted time-series on their timestamps with a sorted merge.
+
+    Args:
+        times (list): One sorted 1-D array of bar times per series.
+        values (list): One 1-D array of values per series, matching times.
+        gap (str): 'drop' keeps only the times every series has. 'ffill' keeps every time and carries the
+            last value of a series forward for at most max_fill missing bars; times still missing a value
+            are dropped.
+        max_fill (int): The number of consecutive missing bars 'ffill' may fill.
+
+    Returns:
+        tuple: A 1-D array of aligned times and a 2-D array of values with one column per series.
+    """
+    if gap not in VALID_GAP_MODES:
+        raise ValueError(f"gap argument must be one of {VALID_GAP_MODES}")
+    if not times:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0))
+
+    if gap == 'drop':
+        merged = times[0]
+        for series_times in times[1:]:
+            # Both sides are sorted, so a binary search finds the common times without re-sorting
+            position = np.minimum(np.searchsorted(series_times, merged), max(len(series_times) - 1, 0))
+            merged = merged[series_times[position] == merged] if len(series_times) else merged[:0]
+    else:
+        merged = np.unique(np.concatenate(times))
+
+    prices = np.empty((len(merged), len(times)))
+    keep = np.ones(len(merged), dtype=bool)
+    for k, (series_times, series_values) in enumerate(zip(times, values)):
+        if not len(series_times):
+            keep[:] = False
+            continue
+        # Position of the last bar of the series at or before every merged time
+        last = np.searchsorted(series_times, merged, side='right') - 1
+        available = last >= 0
+        if gap == 'ffill':
+            # Merged bars elapsed since that bar was printed
+            printed_at = np.searchsorted(merged, series_times)
+            age = np.arange(len(merged)) - printed_at[np.maximum(last, 0)]
+            available &= age <= max_fill
+        keep &= available
+        prices[:, k] = series_values[np.maximum(last, 0)]
+
+    return merged[keep], prices[keep]
+
+
+@instrument()
+@session.execute
+def get_prices(symbols, timeframe, count, data_type='close', gap='drop', max_fill=1):
+    """
+    Fetch aligned prices straight from the MT5 rate records, without building DataFrames.
+
+    Args:
+        symbols (list): The symbols to fetch.
+        timeframe (int): The MT5 timeframe.
+        count (int): The number of bars to fetch per symbol.
+        data_type (str): One of VALID_DATA_TYPES.
+        gap (str): How to handle times missing from some symbols, see align_rates.
+        max_fill (int): The number of consecutive missing bars 'ffill' may fill.
+
+    Returns:
+        tuple: A 1-D int64 array of bar times in seconds and a 2-D float array with one column per symbol.
+    """
+    check_input_validity(symbols, data_type, 'dataframe')
+    field = RATE_FIELDS[data_type]
+
+    try:
+        rates = [get_rates_for_symbol(symbol, timeframe, count) for symbol in symbols]
+        rates = [np.empty(0, dtype=RATES_DTYPE) if r is None else r for r in rates]
+        times, prices = align_rates([r['time'] for r in rates], [r[field] for r in rates], gap, max_fill)
+        logger.info("Fetched prices for symbols: %s", symbols)
+        return times, prices
+    except Exception as e:
+        logger.error(f"Error fetching prices for symbols {symbols}: {str(e)}")
+        return np.empty(0, dtype=np.int64), np.empty((0, len(symbols)))
+
+
+@instrument()
+@session.execute
+def get_data(symbols, timeframe, count, data_type='close', output_format='dataframe') -> 'pd.DataFrame':
+    # pandas is only loaded by the DataFrame path, the live loop fetches arrays with get_prices
+    import pandas as pd
     check_input_validity(symbols, data_type, output_format)
 
     try:
         data = pd.concat(
             [get_data_for_symbol(symbol, timeframe, count, data_type) for symbol in symbols], axis=1)
         data.dropna(inplace=True)
-        logging.info(f"Fetched data for symbols: {symbols}")
+        logger.info("Fetched data for symbols: %s", symbols)
         return get_output(data, output_format)
     except Exception as e:
-        logging.error(f"Error fetching data for symbols {symbols}: {str(e)}")
+        logger.error(f"Error fetching data for symbols {symbols}: {str(e)}")
         return pd.DataFrame()
 
 
@@ -85,30 +209,73 @@ def get_output(data, output_format):
         return data.to_json()
 
 
-@connect_and_execute
+@instrument()
+@session.execute
 def get_spread(symbol: str) -> float:
     try:
-        symbol_info = mt5.symbol_info(symbol)
+        symbol_info = get_broker().symbol_info(symbol)
         if symbol_info is not None:
-            logging.info(f"Fetched spread for symbol: {symbol}")
+            logger.info("Fetched spread for symbol: %s", symbol)
             return symbol_info.spread
         else:
-            logging.error(f"Error getting spread of {symbol}, returning 0")
+            logger.error(f"Error getting spread of {symbol}, returning 0")
+            return 0
+    except Exception as e:
+        logger.error(f"Error fetching spread for symbol {symbol}: {str(e)}")
+        return 0
+
+
+@instrument()
+@session.execute
+def get_point(symbol: str) -> float:
+    try:
+        symbol_info = get_broker().symbol_info(symbol)
+        if symbol_info is not None:
+            return symbol_info.point
+        else:
+            logger.error(f"Error getting point of {symbol}, returning 0")
             return 0
     except Exception as e:
-        logging.error(f"Error fetching spread for symbol {symbol}: {str(e)}")
+        logger.error(f"Error fetching point for symbol {symbol}: {str(e)}")
         return 0
 
 
-@connect_and_execute
-def get_time(symbol: str, timeframe: int = mt5.TIMEFRAME_M5) -> int:
+@instrument()
+@session.execute
+def get_time(symbol: str, timeframe: int = TIMEFRAME_M5) -> int:
     try:
-        time = pd.DataFrame(mt5.copy_rates_from_pos(
-            symbol, timeframe, 0, 1)).loc[:, ['time']]
-        time = time['time'].iloc[0]
-        logging.info(f"Fetched time for symbol: {symbol}")
+        # The base timeframe is asked straight from the backend, a derived one from the resampled bars
+        derived = RESAMPLE_TIMEFRAMES and timeframe != BASE_TIMEFRAME
+        source = get_rate_source() if derived else get_broker()
+        time = int(source.copy_rates_from_pos(symbol, timeframe, 0, 1)['time'][-1])
+        logger.info("Fetched time for symbol: %s", symbol)
         return time
     except Exception as e:
-        logging.error(
+        logger.error(
             f"Failed to get time for {symbol} {timeframe}. Error: {str(e)}")
         return 0
+
+
+@instrument()
+@session.execute
+def get_ticks(symbol: str, date_from: int, count: int) -> np.ndarray:
+    """
+    Fetch the ticks of a symbol from a time on, for incremental polling.
+
+    Args:
+        symbol (str): The symbol.
+        date_from (int): The time of the first tick, in seconds.
+        count (int): The most ticks returned.
+
+    Returns:
+        np.ndarray: The ticks, a structured array of TICKS_DTYPE, empty on failure.
+    """
+    try:
+        ticks = get_broker().copy_ticks_from(symbol, date_from, count, COPY_TICKS_ALL)
+        if ticks is None:
+            logger.error(f"Failed to get ticks for {symbol} from {date_from}")
+            return np.empty(0, dtype=TICKS_DTYPE)
+        return ticks
+    except Exception as e:
+        logger.error(f"Error fetching ticks for symbol {symbol}: {str(e)}")
+        return np.empty(0, dtype=TICKS_DTYPE)
@@ -1,34 +1,37 @@
-import MetaTrader5 as mt5
-from mt5_connector import connect_to_mt5
+from mt5_connector import session
+from metrics import instrument, registry
+from broker import (get_broker, TRADE_ACTION_DEAL, ORDER_FILLING_IOC, ORDER_TIME_GTC, ORDER_TYPE_BUY,
+                    ORDER_TYPE_SELL, TRADE_RETCODE_DONE)
+from position_book import PositionBook
+from constants import FLATTEN_ATTEMPTS
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import time
 import logging
 
 # Initialize logger
 logger = logging.getLogger(__name__)
 
 # Define constants for the actions, fillings, and time order settings
-ACTION = mt5.TRADE_ACTION_DEAL
-FILLING = mt5.ORDER_FILLING_IOC
-TIME = mt5.ORDER_TIME_GTC
+ACTION = TRADE_ACTION_DEAL
+FILLING = ORDER_FILLING_IOC
+TIME = ORDER_TIME_GTC
 
-# This decorator function will ensure that you're connected to MetaTrader 5 before any trading operation
+# Threads sending the two legs of a pair order at the same time, on backends with concurrent_orders
+leg_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='leg')
 
+# Seconds between the two legs of a pair order being filled, and from sending the legs to both replies
+pair_order_stats = {'skew': deque(maxlen=1000), 'round_trip': deque(maxlen=1000), 'rejected': 0, 'flattened': 0,
+                    'flatten_failed': 0}
 
-def connect_and_execute(func):
-    def wrapper(*args, **kwargs):
-        connect_to_mt5()
-        return func(*args, **kwargs)
-    return wrapper
-
-# This function is used to place a market order
+# This function builds the request dict of a market order
 
 
-@connect_and_execute
-def place_market_order(symbol, type, volume: float, magic_number: int = 0, comment: str = "") -> int:
+def build_order_request(symbol, type, volume: float, magic_number: int = 0, comment: str = "") -> dict:
     # Determine order type based on the input
-    order_type = mt5.ORDER_TYPE_BUY if type == "buy" else mt5.ORDER_TYPE_SELL
+    order_type = ORDER_TYPE_BUY if type == "buy" else ORDER_TYPE_SELL
 
-    # Build the request dict
-    request = {
+    return {
         "action": ACTION,
         "symbol": symbol,
         "volume": volume,
@@ -39,42 +42,23 @@ def place_market_order(symbol, type, volume: float, magic_number: int = 0, comme
         "type_filling": FILLING
     }
 
-    # Check if the order request is valid
-    check = mt5.order_check(request)
-    if check is None or check.retcode != 0:
-        logger.error("Order check failed with error code: {}".format(
-            check.retcode if check is not None else 'None'))
-        return 0
+# This function builds the request dict closing a position, or returns None if the position does not exist
 
-    # Send the order request
-    result = mt5.order_send(request)
-    if result.retcode != mt5.TRADE_RETCODE_DONE:
-        logger.error("Order failed with error code: {}".format(result.retcode))
-        return 0
-
-    logger.info(f"Order placed successfully: {result.order}")
-    # Return the order number
-    return result.order
 
-# This function is used to close an order by its ticket number
-
-
-@connect_and_execute
-def close_order_by_ticket(ticket: int, comment: str = ""):
+def build_close_request(ticket: int, comment: str = ""):
     # Get the position details
-    position_info = mt5.positions_get(ticket=ticket)
-    if position_info == ():
+    position_info = get_broker().positions_get(ticket=ticket)
+    if position_info == () or position_info is None:
         logger.error(f"No positions with ticket {ticket}")
-        return False
+        return None
 
     # Extract the necessary details from the position
     symbol = position_info[0].symbol
     volume = position_info[0].volume
-    order_type = mt5.ORDER_TYPE_BUY if position_info[0].type == 1 else mt5.ORDER_TYPE_SELL
+    order_type = ORDER_TYPE_BUY if position_info[0].type == 1 else ORDER_TYPE_SELL
     magic_number = position_info[0].magic
 
-    # Build the request dict
-    request = {
+    return {
         "action": ACTION,
         "symbol": symbol,
         "volume": volume,
@@ -86,26 +70,213 @@ def close_order_by_ticket(ticket: int, comment: str = ""):
         "type_filling": FILLING
     }
 
+# This function is used to place a market order
+
+
+@instrument()
+@session.execute
+def place_market_order(symbol, type, volume: float, magic_number: int = 0, comment: str = "") -> int:
+    request = build_order_request(symbol, type, volume, magic_number, comment)
+
+    # Check if the order request is valid
+    check = get_broker().order_check(request)
+    if check is None or check.retcode != 0:
+        logger.error("Order check failed with error code: {}".format(
+            check.retcode if check is not None else 'None'))
+        return 0
+
+    # Send the order request
+    result = get_broker().order_send(request)
+    if result.retcode != TRADE_RETCODE_DONE:
+        logger.error("Order failed with error code: {}".format(result.retcode))
+        return 0
+
+    logger.info(f"Order placed successfully: {result.order}")
+    # Return the order number
+    return result.order
+
+# This function is used to close an order by its ticket number
+
+
+@instrument()
+@session.execute
+def close_order_by_ticket(ticket: int, comment: str = ""):
+    request = build_close_request(ticket, comment)
+    if request is None:
+        return False
+
     # Send the close order request
-    result = mt5.order_send(request)
-    if result.retcode != mt5.TRADE_RETCODE_DONE:
+    result = get_broker().order_send(request)
+    if result.retcode != TRADE_RETCODE_DONE:
         logger.error(
             "Position Close failed, retcode={} - {}".format(result.retcode, result.comment))
         return False
-    elif result.retcode == mt5.TRADE_RETCODE_DONE:
+    elif result.retcode == TRADE_RETCODE_DONE:
         logger.info("Position {} Closed on {}, comment = {}".format(
             result.order, request['symbol'], result.comment))
         return True
 
+# This function sends one leg of a pair order and times its reply
+
+
+@instrument()
+def send_leg(request: dict):
+    registry.increment('orders.sent')
+    result = get_broker().order_send(request)
+    if result is None or result.retcode != TRADE_RETCODE_DONE:
+        registry.increment('orders.failed')
+    return result, time.perf_counter()
+
+# This function waits for the reply of one leg. A leg whose order_send raised is reported as not filled, so
+# the other legs are still looked at and flattened
+
+
+def collect_leg(request: dict, reply):
+    try:
+        return reply()
+    except Exception:
+        logger.exception(f"Sending the {request['symbol']} leg failed, treating it as not filled")
+        registry.increment('orders.failed')
+        return None, time.perf_counter()
+
+# This function checks every leg, then sends them. It returns the results and whether each leg was filled, or
+# None if a check failed and nothing was sent. The caller holds the session, so the legs are the only terminal
+# calls in flight. They are sent at once from leg_executor when the backend allows concurrent orders, and one
+# after the other otherwise.
+
+
+@instrument()
+def send_legs(requests: list):
+    for request in requests:
+        check = get_broker().order_check(request)
+        if check is None or check.retcode != 0:
+            logger.error("Order check failed for {} with error code: {}".format(
+                request['symbol'], check.retcode if check is not None else 'None'))
+            pair_order_stats['rejected'] += 1
+            return None
+
+    start = time.perf_counter()
+    if get_broker().concurrent_orders:
+        futures = [leg_executor.submit(send_leg, request) for request in requests]
+        legs = [collect_leg(request, future.result) for request, future in zip(requests, futures)]
+    else:
+        legs = [collect_leg(request, lambda request=request: send_leg(request)) for request in requests]
+    round_trip = time.perf_counter() - start
+    pair_order_stats['round_trip'].append(round_trip)
+    registry.observe('orders.round_trip', round_trip)
+
+    results = [result for result, _ in legs]
+    filled = [result is not None and result.retcode == TRADE_RETCODE_DONE for result in results]
+    if all(filled):
+        replied = [replied_at for _, replied_at in legs]
+        skew = max(replied) - min(replied)
+        pair_order_stats['skew'].append(skew)
+        registry.observe('orders.leg_skew', skew)
+    return results, filled
+
+# This function closes the filled leg of a failed pair order, trying FLATTEN_ATTEMPTS times. It returns True
+# once the position is closed
+
+
+def flatten_leg(ticket: int, attempts: int = FLATTEN_ATTEMPTS) -> bool:
+    for attempt in range(1, attempts + 1):
+        if close_order_by_ticket(ticket, comment="flatten"):
+            return True
+        logger.error(f"Flattening order {ticket} failed, attempt {attempt} of {attempts}")
+    return False
+
+# This function opens both legs of a pair trade at once. If only one leg is filled, it is closed again so the
+# pair is never left half open. It returns the tickets of both legs, or (0, 0) on failure. If a filled leg
+# could not be flattened either, its ticket is returned in its place, with 0 for the other leg, so the caller
+# can record the open position and close it later.
+
+
+@instrument()
+@session.execute
+def place_pair_order(symbol_x, type_x, volume_x: float, symbol_y, type_y, volume_y: float,
+                     magic_number: int = 0, comment: str = "") -> tuple:
+    requests = [build_order_request(symbol_x, type_x, volume_x, magic_number, comment),
+                build_order_request(symbol_y, type_y, volume_y, magic_number, comment)]
+    sent = send_legs(requests)
+    if sent is None:
+        return 0, 0
+
+    results, filled = sent
+    if all(filled):
+        logger.info(f"Pair order placed successfully: {results[0].order}, {results[1].order}")
+        return results[0].order, results[1].order
+
+    tickets = [0, 0]
+    for leg, (request, result, leg_filled) in enumerate(zip(requests, results, filled)):
+        if not leg_filled:
+            logger.error("Order failed with error code: {}".format(result.retcode if result is not None else 'None'))
+        elif flatten_leg(result.order):
+            logger.error(f"The other leg failed, flattened {request['symbol']} order {result.order}")
+            pair_order_stats['flattened'] += 1
+        else:
+            logger.critical(f"The other leg failed and {request['symbol']} order {result.order} is still open")
+            pair_order_stats['flatten_failed'] += 1
+            tickets[leg] = result.order
+    return tuple(tickets)
+
+# This function closes both legs of a pair trade at once. A leg that fails to close is tried once more on
+# its own. It returns True if both positions are closed.
+
+
+@instrument()
+@session.execute
+def close_pair_by_tickets(ticket_x: int, ticket_y: int, comment: str = "") -> bool:
+    requests = [build_close_request(ticket_x, comment), build_close_request(ticket_y, comment)]
+    if None in requests:
+        return all(close_order_by_ticket(ticket, comment) for ticket, request in zip((ticket_x, ticket_y), requests)
+                   if request is not None)
+
+    sent = send_legs(requests)
+    if sent is None:
+        return False
+
+    closed = True
+    for ticket, request, result, leg_filled in zip((ticket_x, ticket_y), requests, *sent):
+        if leg_filled:
+            logger.info(f"Position {ticket} Closed on {request['symbol']}, comment = {result.comment}")
+        else:
+            closed = close_order_by_ticket(ticket, comment) and closed
+    return closed
+
+# This function summarises the leg skew and round trip of the pair orders, in seconds
+
+
+def pair_order_summary() -> dict:
+    summary = {name: pair_order_stats[name] for name in ('rejected', 'flattened', 'flatten_failed')}
+    for name in ('skew', 'round_trip'):
+        values = pair_order_stats[name]
+        if values:
+            summary[name] = {'mean': sum(values) / len(values), 'max': max(values), 'count': len(values)}
+    return summary
+
 # This function checks if there are any open orders for the given pair of symbols in the positions dictionary
 
 
 def check_open_orders(symbol_x, symbol_y, open_positions_dict):
+    if isinstance(open_positions_dict, PositionBook):
+        return open_positions_dict.has_pair(symbol_x, symbol_y)
     return any(position["symbol_x"] == symbol_x and position["symbol_y"] == symbol_y for position in open_positions_dict)
 
 # This function checks if a ticket is open or not
 
 
-@connect_and_execute
+@session.execute
 def check_open_ticket(ticket: int):
-    return mt5.positions_get(ticket=ticket) != ()
+    return get_broker().positions_get(ticket=ticket) != ()
+
+# This function gets every open position with a single call, for PositionBook.reconcile
+
+
+@instrument()
+@session.execute
+def get_all_positions() -> tuple:
+    positions = get_broker().positions_get()
+    if positions is None:
+        logger.error("Failed to get the open positions")
+        return None
+    return positions
@@ -0,0 +1,91 @@
+import logging
+import numpy as np
+from cointegration_tests import batched_coint
+from constants import MIN_CORRELATION, MAX_HALF_LIFE
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Pairs tested per block, bounds the memory of the stacked price arrays
+BLOCK_SIZE = 4096
+
+
+def correlation_matrix(prices: np.ndarray) -> np.ndarray:
+    """
+    Calculate the correlation matrix of every symbol against every other one with a single matrix product.
+
+    :param prices: A 2-D numpy array of aligned prices, one column per symbol.
+    :return: A square 2-D numpy array of correlation coefficients.
+    """
+    demeaned = prices - prices.mean(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normalized = demeaned / np.sqrt(np.einsum('ij,ij->j', demeaned, demeaned))
+    return normalized.T @ normalized
+
+
+def batched_half_life(arr1: np.ndarray, arr2: np.ndarray) -> tuple:
+    """
+    Calculate the hedge ratio and the half-life of the spread for many pairs at once, with the same
+    formulas as ForexStats.
+
+    :param arr1: A 2-D numpy array with the first time-series of every pair, one pair per row.
+    :param arr2: A 2-D numpy array with the second time-series of every pair, one pair per row.
+    :return: A tuple (hedge ratios, half-lives) of 1-D numpy arrays, one element per pair.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hedge_ratio = np.einsum('ij,ij->i', arr1, arr2) / np.einsum('ij,ij->i', arr2, arr2)
+        spread = arr1 - hedge_ratio[:, None] * arr2
+        spread_lag = np.roll(spread, 1, axis=1)
+        spread_ret = spread - spread_lag
+        lag_demeaned = spread_lag - spread_lag.mean(axis=1, keepdims=True)
+        slope = np.einsum('ij,ij->i', lag_demeaned, spread_ret) / np.einsum('ij,ij->i', lag_demeaned, lag_demeaned)
+        half_life = -np.log(2) / slope
+    return hedge_ratio, half_life
+
+
+def discover_pairs(symbols: list, prices: np.ndarray, min_correlation: float = MIN_CORRELATION,
+                   threshold: float = 0.05, max_half_life: float = MAX_HALF_LIFE) -> list:
+    """
+    Find the cointegrated pairs of a symbol universe. The correlation matrix prunes the candidates first,
+    then only the survivors go through the batched Engle-Granger test and the half-life check, the same
+    criteria as find_cointegrated_pairs.
+
+    :param symbols: A list with the name of every symbol, in column order.
+    :param prices: A 2-D numpy array of aligned prices, one row per bar and one column per symbol.
+    :param min_correlation: A float representing the correlation a pair must exceed. Default is MIN_CORRELATION.
+    :param threshold: A float representing the p-value cut-off for deciding cointegration. Default is 0.05.
+    :param max_half_life: A float representing the longest accepted half-life, in bars. Default is MAX_HALF_LIFE.
+    :return: A list of dictionaries with the pair, correlation, p-value, hedge ratio and half-life of every
+             accepted pair, ranked by p-value and then half-life.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    corr = correlation_matrix(prices)
+
+    # Candidate pairs from the upper triangle of the correlation matrix
+    rows, cols = np.triu_indices(len(symbols), k=1)
+    keep = corr[rows, cols] > min_correlation
+    rows, cols = rows[keep], cols[keep]
+    logger.info(f"{len(rows)} of {len(symbols) * (len(symbols) - 1) // 2} pairs passed the correlation filter")
+    if not len(rows):
+        return []
+
+    pvalues = np.empty(len(rows))
+    hedge_ratio = np.empty(len(rows))
+    half_life = np.empty(len(rows))
+    for start in range(0, len(rows), BLOCK_SIZE):
+        block = slice(start, start + BLOCK_SIZE)
+        arr1, arr2 = prices[:, rows[block]].T, prices[:, cols[block]].T
+        pvalues[block] = batched_coint(arr1, arr2)[1]
+        hedge_ratio[block], half_life[block] = batched_half_life(arr1, arr2)
+
+    accepted = np.flatnonzero((pvalues < threshold) & (half_life <= max_half_life))
+    accepted = accepted[np.lexsort((half_life[accepted], pvalues[accepted]))]
+    logger.info(f"{len(accepted)} pairs are cointegrated")
+
+    return [{
+        'pair': [symbols[rows[k]], symbols[cols[k]]],
+        'correlation': float(corr[rows[k], cols[k]]),
+        'pvalue': float(pvalues[k]),
+        'hedge_ratio': float(hedge_ratio[k]),
+        'half_life': float(half_life[k]),
+    } for k in accepted]
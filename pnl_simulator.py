@@ -0,0 +1,155 @@
+import logging
+import numpy as np
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Fields of the trade list returned by simulate_pair
+TRADE_FIELDS = ('entry_time', 'exit_time', 'side', 'hedge_ratio', 'entry_zscore', 'exit_zscore', 'bars', 'pnl')
+
+
+def hold_state(events: np.ndarray) -> np.ndarray:
+    """
+    Turn a series of state transitions into the state at every bar by carrying the last transition forward.
+
+    :param events: A 1-D numpy array holding the new state on the bars where it changes and NaN elsewhere.
+    :return: A 1-D numpy array of the state at every bar, 0 before the first transition.
+    """
+    index = np.where(np.isnan(events), -1, np.arange(len(events)))
+    index = np.maximum.accumulate(index) if len(index) else index
+    return np.where(index >= 0, events[np.maximum(index, 0)], 0.0)
+
+
+def positions_from_zscore(zscore: np.ndarray, entry: float = 2.0, exit: float = 0.0, stop: float = None,
+                          allowed: np.ndarray = None) -> np.ndarray:
+    """
+    Apply entry and exit thresholds to a z-score series with array operations. The spread is bought when the
+    z-score falls to -entry and sold back once it rises to -exit; it is sold when the z-score rises to entry
+    and bought back once it falls to exit. The long and short sides are separate state machines, so a
+    position on one side always exits before the other side can enter.
+
+    :param zscore: A 1-D numpy array of z-scores of the spread.
+    :param entry: A float representing the z-score magnitude to enter at. Default is 2.0.
+    :param exit: A float representing the z-score magnitude to exit at. Default is 0.0.
+    :param stop: An optional float representing the z-score magnitude beyond which a position is closed. Once
+                 the z-score has gone past the stop on one side, that side does not enter again until the
+                 z-score has come back to exit, as a stopped trade of exit_manager.
+    :param allowed: An optional boolean numpy array; entries only happen on bars where it is True.
+    :return: A 1-D numpy array of positions in the spread: 1 long, -1 short and 0 flat.
+    """
+    zscore = np.asarray(zscore, dtype=np.float64)
+    enter = np.ones(len(zscore), dtype=bool) if allowed is None else np.asarray(allowed, dtype=bool)
+    beyond_stop = np.zeros(len(zscore), dtype=bool) if stop is None else np.abs(zscore) >= stop
+
+    # A side is blocked from the bar the z-score passes its stop until the z-score reaches exit
+    long_blocked = np.full(len(zscore), np.nan)
+    long_blocked[zscore >= -exit] = 0.0
+    long_blocked[(zscore < 0) & beyond_stop] = 1.0
+    short_blocked = np.full(len(zscore), np.nan)
+    short_blocked[zscore <= exit] = 0.0
+    short_blocked[(zscore > 0) & beyond_stop] = 1.0
+
+    long_events = np.full(len(zscore), np.nan)
+    long_events[(zscore <= -entry) & enter & (hold_state(long_blocked) == 0)] = 1.0
+    long_events[(zscore >= -exit) | ((zscore < 0) & beyond_stop)] = 0.0
+
+    short_events = np.full(len(zscore), np.nan)
+    short_events[(zscore >= entry) & enter & (hold_state(short_blocked) == 0)] = -1.0
+    short_events[(zscore <= exit) | ((zscore > 0) & beyond_stop)] = 0.0
+
+    return hold_state(long_events) + hold_state(short_events)
+
+def summarize(pnl: np.ndarray, position: np.ndarray, notional: np.ndarray, n_trades: int,
+              periods_per_year: float) -> dict:
+    """
+    Calculate the summary statistics of a P&L series.
+
+    :return: A dictionary with the total P&L, the annualised Sharpe ratio, the maximum drawdown, the
+             annualised turnover (traded notional over mean invested notional), the number of trades and the
+             fraction of bars in the market.
+    """
+    equity = np.cumsum(pnl)
+    std = pnl.std()
+    traded = np.abs(np.diff(position, prepend=0.0)) * notional
+    invested = (np.abs(position) * notional)[position != 0]
+    return {
+        'total_pnl': float(equity[-1]) if len(equity) else 0.0,
+        'sharpe': float(pnl.mean() / std * np.sqrt(periods_per_year)) if std > 0 else 0.0,
+        'max_drawdown': float((np.maximum.accumulate(np.maximum(equity, 0.0)) - equity).max()) if len(equity) else 0.0,
+        'turnover': float(traded.sum() / invested.mean() * periods_per_year / len(pnl)) if len(invested) else 0.0,
+        'trades': n_trades,
+        'exposure': float(np.mean(position != 0)) if len(position) else 0.0,
+    }
+
+
+def simulate_pair(times: np.ndarray, arr1: np.ndarray, arr2: np.ndarray, zscore: np.ndarray,
+                  hedge_ratio: np.ndarray, entry: float = 2.0, exit: float = 0.0, stop: float = None,
+                  allowed: np.ndarray = None, cost1: float = 0.0, cost2: float = 0.0, commission: float = 0.0,
+                  periods_per_year: float = 252 * 288) -> dict:
+    """
+    Simulate trading the spread of a pair from its rolling z-score and hedge ratio, without a per-bar loop.
+    A position taken on the close of a bar earns the price changes from the next bar on, holds one unit of
+    the first symbol against hedge_ratio units of the second, and keeps the hedge ratio of the bar it was
+    entered on. P&L is in price units of one unit of the first symbol.
+
+    :param times: A 1-D numpy array of bar times.
+    :param arr1: A 1-D numpy array of prices of the first symbol.
+    :param arr2: A 1-D numpy array of prices of the second symbol.
+    :param zscore: A 1-D numpy array of z-scores of the spread.
+    :param hedge_ratio: A 1-D numpy array of hedge ratios.
+    :param entry: A float representing the z-score magnitude to enter at. Default is 2.0.
+    :param exit: A float representing the z-score magnitude to exit at. Default is 0.0.
+    :param stop: An optional float representing the z-score magnitude at which positions are stopped.
+    :param allowed: An optional boolean numpy array; entries only happen on bars where it is True.
+    :param cost1: A float representing the bid-ask spread of the first symbol, in price units. Half of it is
+                  paid on every buy or sell.
+    :param cost2: A float representing the bid-ask spread of the second symbol, in price units.
+    :param commission: A float representing the commission per side, as a fraction of the traded notional.
+    :param periods_per_year: A float representing the number of bars in a year, for the Sharpe ratio and the
+                             turnover. Default is 252 days of M5 bars.
+    :return: A dictionary with the 'position', 'pnl' and 'equity' arrays, the 'trades' list and the 'summary'
+             statistics.
+    """
+    x = np.asarray(arr1, dtype=np.float64)
+    y = np.asarray(arr2, dtype=np.float64)
+    position = positions_from_zscore(zscore, entry, exit, stop, allowed)
+
+    # Hedge ratio of the bar every position was entered on, carried while it is held
+    change = np.diff(position, prepend=0.0) != 0
+    held_hedge = hold_state(np.where(change & (position != 0), hedge_ratio, np.nan))
+
+    # Position of the previous bar earns this bar's price changes
+    held = np.concatenate(([0.0], position[:-1]))
+    prior_hedge = np.concatenate(([0.0], held_hedge[:-1]))
+    dx = np.diff(x, prepend=x[:1])
+    dy = np.diff(y, prepend=y[:1])
+    gross = held * (dx - prior_hedge * dy)
+
+    # Costs of closing the previous position and opening the new one on every change
+    def side_cost(units, hedge):
+        return np.abs(units) * (cost1 / 2 + np.abs(hedge) * cost2 / 2 + commission * (x + np.abs(hedge) * y))
+    exit_cost = np.where(change, side_cost(held, prior_hedge), 0.0)
+    entry_cost = np.where(change, side_cost(position, held_hedge), 0.0)
+    pnl = gross - exit_cost - entry_cost
+
+    # Trades run from a bar opening a position to the next change
+    starts = np.flatnonzero(change & (position != 0))
+    changes = np.flatnonzero(change)
+    following = np.searchsorted(changes, starts, side='right')
+    open_trade = following >= len(changes)
+    ends = np.where(open_trade, len(position) - 1, changes[np.minimum(following, len(changes) - 1)])
+    cum_gross = np.cumsum(gross)
+    trade_pnl = cum_gross[ends] - cum_gross[starts] - entry_cost[starts] - np.where(open_trade, 0.0, exit_cost[ends])
+    trades = [dict(zip(TRADE_FIELDS, values)) for values in zip(
+        times[starts].tolist(), times[ends].tolist(), position[starts].astype(int).tolist(),
+        held_hedge[starts].tolist(), np.asarray(zscore)[starts].tolist(), np.asarray(zscore)[ends].tolist(),
+        (ends - starts).tolist(), trade_pnl.tolist())]
+
+    notional = x + np.abs(held_hedge) * y
+    return {
+        'position': position,
+        'pnl': pnl,
+        'equity': np.cumsum(pnl),
+        'trades': trades,
+        'summary': summarize(pnl, position, notional, len(trades), periods_per_year),
+    }
@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import logging
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+
+class PositionBook:
+    def __init__(self, path: str = None) -> None:
+        """
+        Initialize a book of the open pair trades, indexed by pair and by ticket. Every change is appended to
+        a journal of JSON lines, which is replayed when the book is created, so the book survives restarts
+        without rewriting a whole file on every trade.
+
+        :param path: An optional string representing the journal file. Without it the book is only kept in memory.
+        """
+        self.path = path
+        self.by_pair = {}
+        self.by_ticket = {}
+        # Tickets open at the broker in the last reconciled snapshot, None before the first one
+        self.broker_tickets = None
+        if path is not None:
+            self.replay()
+
+    def __len__(self) -> int:
+        return len(self.by_pair)
+
+    def __iter__(self):
+        return iter(list(self.by_pair.values()))
+
+    def _apply(self, event: dict) -> None:
+        pair = (event['symbol_x'], event['symbol_y'])
+        if event['op'] == 'open':
+            record = {key: value for key, value in event.items() if key != 'op'}
+            self.by_pair[pair] = record
+            self.by_ticket[record['ticket_x']] = record
+            self.by_ticket[record['ticket_y']] = record
+        elif event['op'] == 'close':
+            record = self.by_pair.pop(pair, None)
+            if record is not None:
+                self.by_ticket.pop(record['ticket_x'], None)
+                self.by_ticket.pop(record['ticket_y'], None)
+
+    def _append(self, event: dict) -> None:
+        self._apply(event)
+        if self.path is not None:
+            with open(self.path, 'a') as file:
+                file.write(json.dumps(event) + '\n')
+
+    def replay(self) -> int:
+        """
+        Rebuild the book from its journal, then compact the journal down to the trades still open.
+
+        :return: An integer representing the number of journal lines replayed.
+        """
+        if not os.path.exists(self.path):
+            return 0
+        lines = 0
+        with open(self.path, 'r') as file:
+            for line in file:
+                try:
+                    self._apply(json.loads(line))
+                    lines += 1
+                except (json.JSONDecodeError, KeyError):
+                    # A line cut short by a crash while it was written
+                    logger.warning(f"Skipping a malformed line of {self.path}")
+        if lines > len(self.by_pair):
+            self.compact()
+        logger.info(f"Replayed {lines} journal lines, {len(self.by_pair)} pair trades open")
+        return lines
+
+    def compact(self) -> None:
+        """
+        Rewrite the journal with one line per open trade, replacing the file atomically.
+        """
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as file:
+            for record in self.by_pair.values():
+                file.write(json.dumps({'op': 'open', **record}) + '\n')
+        os.replace(temporary, self.path)
+
+    def open_pair(self, symbol_x: str, symbol_y: str, ticket_x: int, ticket_y: int, **details) -> dict:
+        """
+        Record a new pair trade.
+
+        :param details: Any other JSON-serializable fields to keep with the trade, e.g. the hedge ratio.
+        :return: A dictionary representing the trade record.
+        """
+        self._append({'op': 'open', 'symbol_x': symbol_x, 'symbol_y': symbol_y, 'ticket_x': int(ticket_x),
+                      'ticket_y': int(ticket_y), 'opened_at': time.time(), **details})
+        return self.by_pair[(symbol_x, symbol_y)]
+
+    def close_pair(self, symbol_x: str, symbol_y: str, reason: str = '') -> dict:
+        """
+        Remove a pair trade from the book.
+
+        :return: A dictionary representing the removed trade record, or None if the pair was not open.
+        """
+        record = self.by_pair.get((symbol_x, symbol_y))
+        if record is not None:
+            self._append({'op': 'close', 'symbol_x': symbol_x, 'symbol_y': symbol_y, 'reason': reason,
+                          'closed_at': time.time()})
+        return record
+
+    def has_pair(self, symbol_x: str, symbol_y: str) -> bool:
+        return (symbol_x, symbol_y) in self.by_pair
+
+    def get_pair(self, symbol_x: str, symbol_y: str) -> dict:
+        return self.by_pair.get((symbol_x, symbol_y))
+
+    def get_ticket(self, ticket: int) -> dict:
+        return self.by_ticket.get(ticket)
+
+    def ticket_open(self, ticket: int) -> bool:
+        """
+        :return: A boolean value. True if the ticket was open at the broker in the last reconciled snapshot, or
+                 is in the book when there has been no snapshot yet.
+        """
+        if self.broker_tickets is None:
+            return ticket in self.by_ticket
+        return ticket in self.broker_tickets
+
+    def reconcile(self, positions, magic: int = None) -> dict:
+        """
+        Reconcile the book with one snapshot of every open position at the broker. Trades whose two legs are
+        both gone, e.g. after a stop-loss or a manual close, are closed in the book. Trades with a single leg
+        left are reported so the remaining leg can be flattened.
+
+        :param positions: The tuple returned by a single positions_get() call.
+        :param magic: An optional integer; only positions opened with this magic number are reconciled.
+        :return: A dictionary with the 'closed' and 'broken' trade records, and the 'unknown' tickets open at the
+                 broker but missing from the book.
+        """
+        self.broker_tickets = {position.ticket for position in positions if magic is None or position.magic == magic}
+        closed, broken = [], []
+        for record in list(self.by_pair.values()):
+            legs_open = (record['ticket_x'] in self.broker_tickets) + (record['ticket_y'] in self.broker_tickets)
+            if legs_open == 0:
+                self.close_pair(record['symbol_x'], record['symbol_y'], reason='reconciled')
+                closed.append(record)
+            elif legs_open == 1:
+                broken.append(record)
+        unknown = sorted(self.broker_tickets - self.by_ticket.keys())
+        if closed or broken or unknown:
+            logger.warning(f"Reconciled positions: {len(closed)} closed, {len(broken)} with one leg, "
+                           f"{len(unknown)} not in the book")
+        return {'closed': closed, 'broken': broken, 'unknown': unknown}
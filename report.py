@@ -0,0 +1,69 @@
+import os
+import logging
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+from backtest_io import downsample
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+
+def pair_figure(results: pd.DataFrame, pair: list, max_points: int) -> go.Figure:
+    """
+    Plot every column of a pair's backtest results in its own row, each trace downsampled with LTTB.
+
+    :param results: A pandas DataFrame indexed by date, one column per trace.
+    :param pair: A list of the two symbols of the pair.
+    :param max_points: An integer representing the largest number of points of a trace.
+    :return: The plotly Figure.
+    """
+    fig = make_subplots(
+        rows=len(results.columns),
+        cols=1,
+        shared_xaxes=True,
+        subplot_titles=list(results.columns),
+        vertical_spacing=0.02)
+
+    # Add traces
+    for i, column in enumerate(results.columns):
+        x, y = downsample(results.index.to_numpy(), results[column].to_numpy(dtype=float), max_points)
+        fig.add_trace(go.Scattergl(x=x, y=y, name=column), row=i + 1, col=1)
+
+    # Add horizontal lines at z-score levels -2, 0, +2
+    if 'Z-Score' in results.columns:
+        yref = f'y{list(results.columns).index("Z-Score") + 1}'
+        for level in (-2, 0, 2):
+            fig.add_shape(
+                type="line", line=dict(dash='dash'),
+                xref="paper", yref=yref,
+                x0=0, y0=level, x1=1, y1=level,
+            )
+
+    # Update layout
+    fig.update_layout(
+        height=250 * len(results.columns), title_text=f"{pair[0]} and {pair[1]} Backtest Results", showlegend=False)
+    return fig
+
+
+def write_index(folder: str, summary: pd.DataFrame, figures: list) -> str:
+    """
+    Write the single report page of a backtest run: the summary table of every pair followed by their
+    figures. plotly.js is embedded once for the whole page.
+
+    :param folder: A string representing the folder of the run.
+    :param summary: A pandas DataFrame with one row of summary statistics per pair.
+    :param figures: A list of (pair name, plotly Figure) tuples.
+    :return: A string representing the path of the page.
+    """
+    sections = [f'<h2 id="{name}">{name}</h2>' + fig.to_html(full_html=False, include_plotlyjs=(k == 0))
+                for k, (name, fig) in enumerate(figures)]
+    links = ' | '.join(f'<a href="#{name}">{name}</a>' for name, _ in figures)
+    page = (f'<html><head><meta charset="utf-8"><title>Backtest Results</title></head><body>'
+            f'<h1>Backtest Results</h1><p>{links}</p>{summary.to_html(index=False, float_format="%.4g")}'
+            f'{"".join(sections)}</body></html>')
+    path = os.path.join(folder, 'index.html')
+    with open(path, 'w') as file:
+        file.write(page)
+    logger.info(f'Saved report to {path}')
+    return path
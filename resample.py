@@ -0,0 +1,144 @@
+import logging
+import numpy as np
+from bar_store import RATES_DTYPE
+from broker import TIMEFRAME_M5, TIMEFRAME_SECONDS, timeframe_seconds
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+
+def bucket_starts(times: np.ndarray, period: int) -> tuple:
+    """
+    Group bar times into the buckets of a coarser timeframe, aligned on multiples of its period as the terminal
+    aligns its bars.
+
+    :param times: A sorted 1-D int64 array of bar times, in seconds.
+    :param period: An integer representing the length of a coarser bar, in seconds.
+    :return: A tuple (bucket times, starts): the open time of every bucket and the index of its first bar.
+    """
+    buckets = times // period * period
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]]) if len(times) else np.empty(0, dtype=np.intp)
+    return buckets[starts], starts
+
+
+def resample_rates(rates: np.ndarray, period: int) -> np.ndarray:
+    """
+    Aggregate bars into the bars of a coarser timeframe, with one reduction per field over the bucket indices.
+
+    :param rates: A structured numpy array of RATES_DTYPE, oldest first.
+    :param period: An integer representing the length of a coarser bar, in seconds.
+    :return: A structured numpy array of RATES_DTYPE, one bar per bucket holding at least one bar. The spread
+             is the one of the last bar of the bucket.
+    """
+    times, starts = bucket_starts(rates['time'], period)
+    resampled = np.zeros(len(starts), dtype=RATES_DTYPE)
+    if not len(starts):
+        return resampled
+    ends = np.r_[starts[1:], len(rates)] - 1
+    resampled['time'] = times
+    resampled['open'] = rates['open'][starts]
+    resampled['high'] = np.maximum.reduceat(rates['high'], starts)
+    resampled['low'] = np.minimum.reduceat(rates['low'], starts)
+    resampled['close'] = rates['close'][ends]
+    resampled['tick_volume'] = np.add.reduceat(rates['tick_volume'], starts)
+    resampled['spread'] = rates['spread'][ends]
+    resampled['real_volume'] = np.add.reduceat(rates['real_volume'], starts)
+    return resampled
+
+
+class Resampler:
+    def __init__(self, source, base_timeframe: int = TIMEFRAME_M5, probe: int = 2) -> None:
+        """
+        Serve every timeframe from the bars of a single base timeframe. The bars of a coarser timeframe are
+        aggregated locally from base bars instead of being downloaded again, and kept: later requests only
+        fetch the base bars of the newest coarse bar and the ones after it, and rebuild those.
+
+        :param source: The MetaTrader5 module, or any object with the same copy_rates_from_pos function, e.g. a
+                       BarStore or a Broker.
+        :param base_timeframe: An integer representing the MT5 timeframe fetched from the source. Default is M5.
+        :param probe: An integer representing how many coarse bars' worth of base bars an update asks for first.
+                      The request doubles until it reaches back to the kept bars. Default is 2.
+        """
+        self.source = source
+        self.base_timeframe = base_timeframe
+        self.base_period = timeframe_seconds(base_timeframe)
+        self.probe = probe
+        self.bars = {}
+        self.stats = {'hits': 0, 'misses': 0, 'base_bars_fetched': 0}
+
+    def derives(self, timeframe: int) -> bool:
+        """
+        :return: True if bars of the timeframe are built from the base timeframe: it is longer, at most a day,
+                 and a whole number of base bars. Other timeframes go straight to the source.
+        """
+        if timeframe == self.base_timeframe or (timeframe >= 16385 and timeframe not in TIMEFRAME_SECONDS):
+            return False
+        period = timeframe_seconds(timeframe)
+        return period > self.base_period and period % self.base_period == 0
+
+    def _fetch(self, symbol: str, count: int) -> np.ndarray:
+        rates = self.source.copy_rates_from_pos(symbol, self.base_timeframe, 0, count)
+        if rates is not None:
+            self.stats['base_bars_fetched'] += len(rates)
+        return rates
+
+    def _update(self, symbol: str, timeframe: int, count: int) -> np.ndarray:
+        """
+        Bring the kept bars of a derived timeframe up to date, with at least `count` bars when the history
+        allows it.
+        """
+        period = timeframe_seconds(timeframe)
+        ratio = period // self.base_period
+        kept = self.bars.get((symbol, timeframe))
+
+        if kept is not None and len(kept) >= count:
+            # Base bars from the newest kept bucket on, whose last bar may have been forming
+            request = self.probe * ratio
+            while True:
+                rates = self._fetch(symbol, request)
+                if rates is None:
+                    return kept
+                if not len(rates) or rates['time'][0] <= kept['time'][-1] or len(rates) < request:
+                    break
+                if request > count * ratio:
+                    rates = None
+                    break
+                request *= 2
+            recent = rates[rates['time'] >= kept['time'][-1]] if rates is not None else rates
+            if recent is not None and len(recent):
+                self.stats['hits'] += 1
+                bars = np.concatenate([kept[:-1], resample_rates(recent, period)])
+                bars = bars[-max(count, len(kept)):]
+                self.bars[(symbol, timeframe)] = bars
+                return bars
+
+        # Nothing kept, too few bars, or a gap wider than the request: aggregate a full history
+        self.stats['misses'] += 1
+        request = (count + 1) * ratio
+        while True:
+            rates = self._fetch(symbol, request)
+            if rates is None:
+                logger.error(f"Failed to get {self.base_timeframe} rates of {symbol} to build {timeframe}")
+                return None
+            bars = resample_rates(rates, period)
+            # Gaps such as weekends leave fewer buckets than asked for, ask further back while history lasts
+            if len(bars) >= count or len(rates) < request:
+                break
+            request *= 2
+        bars = bars[-count:]
+        self.bars[(symbol, timeframe)] = bars
+        return bars
+
+    def copy_rates_from_pos(self, symbol: str, timeframe: int, start_pos: int, count: int) -> np.ndarray:
+        """
+        Drop-in replacement for MetaTrader5.copy_rates_from_pos, building the bars of derived timeframes.
+
+        :return: A structured numpy array of bars, oldest first, or None if the base bars could not be fetched.
+        """
+        if not self.derives(timeframe):
+            return self.source.copy_rates_from_pos(symbol, timeframe, start_pos, count)
+        bars = self._update(symbol, timeframe, start_pos + count)
+        if bars is None:
+            return None
+        end = len(bars) - start_pos
+        return bars[max(0, end - count):max(0, end)].copy()
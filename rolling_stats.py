@@ -0,0 +1,208 @@
+import logging
+import numpy as np
+from cointegration_tests import batched_coint
+from kalman_filter import kalman_filter
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Keys of the dictionary returned by rolling_forex_stats, in Backtest.py column order
+ROLLING_STATS = ('correlation', 'is_cointegrated', 'spread', 'zscore',
+                 'zscore_rolling', 'half_life', 'hedge_ratio')
+
+
+def rolling_sum(arr: np.ndarray, window: int) -> np.ndarray:
+    """
+    Sum every full window of a 1-D array using a single cumulative sum.
+
+    :param arr: A 1-D numpy array.
+    :param window: An integer representing the window size.
+    :return: A 1-D numpy array of length len(arr) - window + 1 where element j is the sum of arr[j:j+window].
+    """
+    csum = np.concatenate(([0.0], np.cumsum(arr, dtype=np.float64)))
+    return csum[window:] - csum[:-window]
+
+
+def window_sums(arr1: np.ndarray, arr2: np.ndarray, window: int, zscore_window: int = 21) -> dict:
+    """
+    Calculate the rolling sums every ForexStats statistic can be derived from. The series are centred on
+    their overall mean before summing so that the sums of squares keep their precision.
+
+    :param arr1: A 1-D numpy array representing the first time-series data.
+    :param arr2: A 1-D numpy array representing the second time-series data.
+    :param window: An integer representing the window size (WINDOW_LENGTH).
+    :param zscore_window: An integer representing the window size of the rolling z-score. Default is 21.
+    :return: A dictionary of 1-D numpy arrays, one element per full window of the input.
+    """
+    x = np.asarray(arr1, dtype=np.float64)
+    y = np.asarray(arr2, dtype=np.float64)
+    c1, c2 = x.mean(), y.mean()
+    x = x - c1
+    y = y - c2
+    n_windows = len(x) - window + 1
+
+    sums = {
+        'n': window, 'c1': c1, 'c2': c2,
+        'sx': rolling_sum(x, window), 'sy': rolling_sum(y, window),
+        'sxx': rolling_sum(x * x, window), 'syy': rolling_sum(y * y, window),
+        'sxy': rolling_sum(x * y, window),
+        # Products of adjacent bars inside the window, used by the half-life regression
+        'pxx': rolling_sum(x[1:] * x[:-1], window - 1), 'pxy': rolling_sum(x[1:] * y[:-1], window - 1),
+        'pyx': rolling_sum(y[1:] * x[:-1], window - 1), 'pyy': rolling_sum(y[1:] * y[:-1], window - 1),
+        # First and last bar of every window, np.roll wraps them around in calculate_half_life
+        'x_first': x[:n_windows], 'y_first': y[:n_windows],
+        'x_last': x[window - 1:], 'y_last': y[window - 1:],
+        'zn': zscore_window,
+    }
+
+    if zscore_window <= window:
+        tail = slice(window - zscore_window, None)
+        sums['zsx'] = rolling_sum(x, zscore_window)[tail]
+        sums['zsy'] = rolling_sum(y, zscore_window)[tail]
+        sums['zsxx'] = rolling_sum(x * x, zscore_window)[tail]
+        sums['zsyy'] = rolling_sum(y * y, zscore_window)[tail]
+        sums['zsxy'] = rolling_sum(x * y, zscore_window)[tail]
+
+    return sums
+
+
+def stats_from_sums(sums: dict) -> dict:
+    """
+    Derive correlation, hedge ratio, spread, z-score, rolling z-score and half-life from window sums. The
+    formulas reproduce ForexStats exactly: the hedge ratio is the slope of an OLS without constant, the
+    z-score uses the population standard deviation, the rolling z-score the sample one, and the half-life
+    regresses the spread returns on the np.roll lagged spread with a constant.
+
+    :param sums: A dictionary as returned by window_sums (scalars or arrays).
+    :return: A dictionary with the statistics named in ROLLING_STATS, except is_cointegrated.
+    """
+    n, c1, c2 = sums['n'], sums['c1'], sums['c2']
+    sx, sy, sxx, syy, sxy = sums['sx'], sums['sy'], sums['sxx'], sums['syy'], sums['sxy']
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Centred moments of the window
+        mx, my = sx / n, sy / n
+        vxx = sxx / n - mx * mx
+        vyy = syy / n - my * my
+        vxy = sxy / n - mx * my
+        correlation = vxy / np.sqrt(vxx * vyy)
+
+        # OLS of arr1 on arr2 without constant, on the un-centred prices
+        raw_xy = sxy + c2 * sx + c1 * sy + n * c1 * c2
+        raw_yy = syy + 2 * c2 * sy + n * c2 * c2
+        hedge_ratio = raw_xy / raw_yy
+
+        # Spread of the last bar and its z-score against the whole window
+        spread = (sums['x_last'] + c1) - hedge_ratio * (sums['y_last'] + c2)
+        spread_mean = (mx + c1) - hedge_ratio * (my + c2)
+        spread_var = vxx - 2 * hedge_ratio * vxy + hedge_ratio ** 2 * vyy
+        zscore = (spread - spread_mean) / np.sqrt(spread_var)
+
+        # Rolling z-score of the last bar over the trailing zscore_window bars
+        if 'zsx' in sums:
+            zn = sums['zn']
+            zmx, zmy = sums['zsx'] / zn, sums['zsy'] / zn
+            zvxx = sums['zsxx'] / zn - zmx * zmx
+            zvyy = sums['zsyy'] / zn - zmy * zmy
+            zvxy = sums['zsxy'] / zn - zmx * zmy
+            zvar = (zvxx - 2 * hedge_ratio * zvxy + hedge_ratio ** 2 * zvyy) * zn / (zn - 1)
+            zmean = (zmx + c1) - hedge_ratio * (zmy + c2)
+            zscore_rolling = (spread - zmean) / np.sqrt(zvar)
+        else:
+            zscore_rolling = np.full_like(np.asarray(spread, dtype=np.float64), np.nan)
+
+        # Half-life: the constant part of the spread cancels out of a regression with intercept,
+        # so it is enough to work with u = x - hedge_ratio * y
+        su = sx - hedge_ratio * sy
+        suu = sxx - 2 * hedge_ratio * sxy + hedge_ratio ** 2 * syy
+        u_first = sums['x_first'] - hedge_ratio * sums['y_first']
+        u_last = sums['x_last'] - hedge_ratio * sums['y_last']
+        lag_product = (sums['pxx'] - hedge_ratio * (sums['pxy'] + sums['pyx'])
+                       + hedge_ratio ** 2 * sums['pyy'] + u_first * u_last)
+        slope = (lag_product - suu) / (suu - su * su / n)
+        half_life = -np.log(2) / slope
+
+    return {
+        'correlation': correlation,
+        'spread': spread,
+        'zscore': zscore,
+        'zscore_rolling': zscore_rolling,
+        'half_life': half_life,
+        'hedge_ratio': hedge_ratio,
+    }
+
+
+def rolling_cointegration(arr1: np.ndarray, arr2: np.ndarray, window: int, threshold: float = 0.05) -> np.ndarray:
+    """
+    Run the Engle-Granger test of ForexStats.check_cointegration on every full window. The windows are
+    strided views of the input and go through the batched test together.
+
+    :param arr1: A 1-D numpy array representing the first time-series data.
+    :param arr2: A 1-D numpy array representing the second time-series data.
+    :param window: An integer representing the window size.
+    :param threshold: A float representing the p-value cut-off for deciding cointegration. Default is 0.05.
+    :return: A 1-D boolean numpy array, one element per full window.
+    """
+    windows1 = np.lib.stride_tricks.sliding_window_view(arr1, window)
+    windows2 = np.lib.stride_tricks.sliding_window_view(arr2, window)
+    try:
+        return batched_coint(windows1, windows2)[1] < threshold
+    except Exception as e:
+        logger.error(f"Error checking cointegration: {str(e)}")
+        return np.zeros(len(windows1), dtype=bool)
+
+
+def rolling_zscore(spread: np.ndarray, window: int) -> np.ndarray:
+    """
+    Calculate the z-score of every bar of a spread against the trailing window, with the sample standard
+    deviation, as ForexStats.calculate_zscore_rolling.
+
+    :param spread: A 1-D numpy array.
+    :param window: An integer representing the window size.
+    :return: A 1-D numpy array of the length of spread, NaN until the first full window.
+    """
+    zscore = np.full(len(spread), np.nan)
+    if len(spread) >= window:
+        windows = np.lib.stride_tricks.sliding_window_view(spread, window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            zscore[window - 1:] = (spread[window - 1:] - windows.mean(axis=1)) / windows.std(axis=1, ddof=1)
+    return zscore
+
+
+def rolling_forex_stats(arr1: np.ndarray, arr2: np.ndarray, window: int, zscore_window: int = 21,
+                        threshold: float = 0.05, hedge_model: str = 'ols') -> dict:
+    """
+    Calculate the ForexStats values of the last bar of every full window in one vectorized pass. Element j
+    of every output array equals what ForexStats(arr1[j:j+window], arr2[j:j+window]) reports for the
+    last bar of that window.
+
+    :param arr1: A 1-D numpy array representing the first time-series data (e.g. close prices of a forex symbol).
+    :param arr2: A 1-D numpy array representing the second time-series data (e.g. close prices of another forex symbol).
+    :param window: An integer representing the window size (WINDOW_LENGTH).
+    :param zscore_window: An integer representing the window size of the rolling z-score. Default is 21.
+    :param threshold: A float representing the p-value cut-off for deciding cointegration. Default is 0.05.
+    :param hedge_model: 'ols' for the windowed statistics of ForexStats, or 'kalman' to take the hedge ratio,
+                        spread, z-score and rolling z-score from one kalman_filter pass over the whole history
+                        instead. The correlation, half-life and cointegration test stay windowed. Default is 'ols'.
+    :return: A dictionary of 1-D numpy arrays keyed by the names in ROLLING_STATS.
+    """
+    arr1 = np.asarray(arr1, dtype=np.float64)
+    arr2 = np.asarray(arr2, dtype=np.float64)
+    if len(arr1) != len(arr2):
+        raise ValueError("arr1 and arr2 must have the same length")
+    if len(arr1) < window:
+        return {name: np.array([]) for name in ROLLING_STATS}
+
+    results = stats_from_sums(window_sums(arr1, arr2, window, zscore_window))
+    results['is_cointegrated'] = rolling_cointegration(arr1, arr2, window, threshold)
+    if hedge_model == 'kalman':
+        kalman = kalman_filter(arr1, arr2, warmup=window)
+        window_end = slice(window - 1, None)
+        results['hedge_ratio'] = kalman['hedge_ratio'][window_end]
+        results['spread'] = kalman['spread'][window_end]
+        results['zscore'] = kalman['zscore'][window_end]
+        results['zscore_rolling'] = rolling_zscore(kalman['spread'], zscore_window)[window_end]
+    elif hedge_model != 'ols':
+        raise ValueError("hedge_model argument must be one of ('ols', 'kalman')")
+    logger.info("Calculated rolling statistics for %d windows", len(results['spread']))
+    return {name: results[name] for name in ROLLING_STATS}
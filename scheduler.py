@@ -0,0 +1,203 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from broker import get_broker, timeframe_seconds
+from mt5_data import get_time
+from metrics import registry
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Candles the metrics are summarised over
+METRICS_HISTORY = 288
+
+
+class CandleScheduler:
+    def __init__(self, timeframe: int, symbol: str, confirm_retry: float = 0.25, confirm_attempts: int = 20) -> None:
+        """
+        Run a set of stages once per candle. The scheduler sleeps until the next candle boundary, confirms
+        the new bar with a single get_time call, then runs every stage as its own task with a deadline counted
+        from the candle close. With a simulated backend it advances the replay clock instead of sleeping.
+
+        A stage that misses its deadline keeps running in its thread. Until it ends, the stage and the stages
+        chained to it with `after` are skipped on later candles, since they share state without a lock, and
+        the stages after it do not run on its candle.
+
+        Args:
+            timeframe (int): The MT5 timeframe of the candles.
+            symbol (str): The symbol whose bars confirm a new candle.
+            confirm_retry (float): Seconds to wait before asking again when the new bar is not there yet.
+            confirm_attempts (int): Times to ask before skipping the candle, e.g. while the market is closed.
+        """
+        self.timeframe = timeframe
+        self.period = timeframe_seconds(timeframe)
+        self.symbol = symbol
+        self.confirm_retry = confirm_retry
+        self.confirm_attempts = confirm_attempts
+        self.stages = {}
+        self.last_candle_time = 0
+        self.metrics = {'jitter': deque(maxlen=METRICS_HISTORY), 'confirm': deque(maxlen=METRICS_HISTORY)}
+        self.missed = {}
+        self.skipped = {}
+        # Latest run of every stage in the executor, which may outlive its candle
+        self.in_flight = {}
+        # Stages run side by side, their terminal calls are serialized by the MT5 session
+        self.executor = ThreadPoolExecutor(thread_name_prefix='stage')
+
+    def add_stage(self, name: str, func, deadline: float, after: str = None) -> None:
+        """
+        Register a blocking function to run on every candle.
+
+        Args:
+            name (str): The name of the stage in the metrics.
+            func (callable): The function, called without arguments.
+            deadline (float): Seconds after the candle close by which the stage must have finished.
+            after (str): The name of a stage that must finish first, e.g. entries after the scan.
+        """
+        self.stages[name] = (func, deadline, after)
+        self.metrics[name] = deque(maxlen=METRICS_HISTORY)
+        self.missed[name] = 0
+        self.skipped[name] = 0
+
+    def chained(self, name: str) -> set:
+        """
+        Returns:
+            set: The names of the stages linked to a stage by `after`, in either direction, and the stage itself.
+        """
+        chained, pending = set(), [name]
+        while pending:
+            stage = pending.pop()
+            if stage in chained:
+                continue
+            chained.add(stage)
+            after = self.stages[stage][2]
+            if after in self.stages:
+                pending.append(after)
+            pending += [other for other, (_, _, after) in self.stages.items() if after == stage]
+        return chained
+
+    async def wait_for_candle(self) -> float:
+        """
+        Sleep until the next candle boundary and confirm the new bar.
+
+        Returns:
+            float: The wall-clock time of the candle close, or None if no new bar showed up.
+        """
+        loop = asyncio.get_running_loop()
+        live = get_broker().live
+        if not live or not self.last_candle_time:
+            # Replayed bars are there at once, and the first candle runs on start-up
+            boundary = time.time()
+        else:
+            boundary = (time.time() // self.period + 1) * self.period
+            await asyncio.sleep(max(0.0, boundary - time.time()))
+            self.metrics['jitter'].append(time.time() - boundary)
+
+        attempts = self.confirm_attempts if live else 1
+        for _ in range(attempts):
+            candle_time = await loop.run_in_executor(self.executor, get_time, self.symbol, self.timeframe)
+            if candle_time and candle_time != self.last_candle_time:
+                self.last_candle_time = candle_time
+                self.metrics['confirm'].append(time.time() - boundary)
+                return boundary
+            await asyncio.sleep(self.confirm_retry)
+
+        logger.warning(f"No new {self.symbol} bar after {attempts} attempts, skipping the candle")
+        return None
+
+    def skip(self, name: str, reason: str) -> bool:
+        self.skipped[name] += 1
+        registry.increment(f'skipped_stages.{name}')
+        logger.warning(f"Skipping stage {name}: {reason}")
+        return False
+
+    async def run_stage(self, name: str, boundary: float, tasks: dict) -> bool:
+        """
+        Run one stage of a candle, once the stage it comes after finished.
+
+        Returns:
+            bool: True if the stage ran and finished by its deadline without raising.
+        """
+        func, deadline, after = self.stages[name]
+        loop = asyncio.get_running_loop()
+        if after in tasks and not await asyncio.shield(tasks[after]):
+            return self.skip(name, f"{after} did not finish")
+        running = [stage for stage in self.chained(name) if stage in self.in_flight and not self.in_flight[stage].done()]
+        if running:
+            return self.skip(name, f"{', '.join(sorted(running))} of an earlier candle still running")
+
+        start = time.perf_counter()
+        try:
+            remaining = max(0.0, boundary + deadline - time.time())
+            self.in_flight[name] = loop.run_in_executor(self.executor, func)
+            await asyncio.wait_for(asyncio.shield(self.in_flight[name]), remaining)
+            registry.observe(f'stage.{name}', time.perf_counter() - start)
+            return True
+        except asyncio.TimeoutError:
+            self.missed[name] += 1
+            registry.increment(f'missed_deadlines.{name}')
+            logger.error(f"Stage {name} missed its deadline of {deadline}s after the candle close")
+        except Exception as e:
+            logger.error(f"Stage {name} failed: {str(e)}")
+        finally:
+            # Seconds from the candle close to the end of the stage
+            self.metrics[name].append(time.time() - boundary)
+        return False
+
+    async def run_candle(self, boundary: float) -> None:
+        tasks = {}
+        for name in self.stages:
+            tasks[name] = asyncio.create_task(self.run_stage(name, boundary, tasks))
+        await asyncio.gather(*tasks.values())
+
+    async def run(self, max_candles: int = None, after_candle=None) -> None:
+        """
+        Run the stages on every candle, until max_candles candles ran or a replayed recording ends.
+
+        Args:
+            max_candles (int): The number of candles to run. Runs until stopped by default.
+            after_candle (callable): Optional function called without arguments once every stage of a candle ended.
+        """
+        broker = get_broker()
+        candles = 0
+        try:
+            while max_candles is None or candles < max_candles:
+                # A replayed recording moves on to its next bar instead of waiting for it
+                if not broker.live and self.last_candle_time and not broker.advance():
+                    logger.info("Replay finished")
+                    break
+                boundary = await self.wait_for_candle()
+                if boundary is None:
+                    continue
+                await self.run_candle(boundary)
+                candles += 1
+                logger.info(f"Candle {self.last_candle_time}: {self.summary(last=True)}")
+                if after_candle is not None:
+                    after_candle()
+        finally:
+            self.executor.shutdown(wait=False)
+
+    def summary(self, last: bool = False) -> dict:
+        """
+        Summarise the wake-up jitter, the time to confirm the new bar and the time every stage finished after
+        the candle close, all in seconds.
+
+        Args:
+            last (bool): Only report the latest candle instead of the mean and max over METRICS_HISTORY candles.
+
+        Returns:
+            dict: The metrics by name, with the missed deadlines and skipped runs of every stage.
+        """
+        summary = {}
+        for name, values in self.metrics.items():
+            if not values:
+                continue
+            if last:
+                summary[name] = round(values[-1], 4)
+            else:
+                summary[name] = {'mean': sum(values) / len(values), 'max': max(values), 'count': len(values)}
+        summary['missed'] = dict(self.missed)
+        summary['skipped'] = dict(self.skipped)
+        return summary
@@ -1,43 +1,153 @@
 import logging
+from functools import cached_property
 import numpy as np
-import pandas as pd
-from scipy import stats
-from statsmodels.tsa.stattools import coint, adfuller
-import statsmodels.api as sm
+from cointegration_tests import batched_coint, batched_adfuller
+from kalman_filter import kalman_filter
+from metrics import instrument
+from constants import HEDGE_MODEL
 
-
-logging.basicConfig(level=logging.DEBUG)
+# Initialize logger
 logger = logging.getLogger(__name__)
 
+# Models the hedge ratio of ForexStats can be estimated with
+HEDGE_MODELS = ('ols', 'kalman')
+
 
 class ForexStats:
-    def __init__(self, arr1: np.ndarray, arr2: np.ndarray) -> None:
+    def __init__(self, arr1: np.ndarray, arr2: np.ndarray, hedge_model: str = HEDGE_MODEL) -> None:
         """
-        Initialize ForexStats with two time-series data.
+        Initialize ForexStats with two time-series data. Nothing is computed here: every statistic is a
+        cached property, calculated the first time it is requested and reused afterwards, so cheap checks
+        such as the correlation can reject a pair before any regression runs.
 
         :param arr1: A 1-D numpy array representing the first time-series data (e.g. close prices of a forex symbol).
         :param arr2: A 1-D numpy array representing the second time-series data (e.g. close prices of another forex symbol).
+        :param hedge_model: 'ols' for one hedge ratio fitted over the whole window, or 'kalman' for a hedge ratio
+                            tracked bar by bar with kalman_filter. The spread, z-score and everything derived from
+                            them follow the model. Default is HEDGE_MODEL.
         """
+        if hedge_model not in HEDGE_MODELS:
+            raise ValueError(f"hedge_model argument must be one of {HEDGE_MODELS}")
         self.arr1 = arr1
         self.arr2 = arr2
-        self.model = sm.OLS(self.arr1, self.arr2).fit()
-        self.hedge_ratio = self.calculate_hedge_ratio()
-        self.spread = self.calculate_spread()
+        self.hedge_model = hedge_model
+        self._zscore_rolling = {}
+
+    @cached_property
+    def demeaned(self) -> tuple:
+        """
+        The two time-series minus their means, shared by the correlation, z-score and half-life.
+        """
+        arr1 = np.asarray(self.arr1, dtype=np.float64)
+        arr2 = np.asarray(self.arr2, dtype=np.float64)
+        return arr1 - arr1.mean(), arr2 - arr2.mean()
+
+    @cached_property
+    def sums_of_squares(self) -> tuple:
+        """
+        The sums of squares and cross-products (s11, s22, s12) of the demeaned time-series.
+        """
+        d1, d2 = self.demeaned
+        return d1 @ d1, d2 @ d2, d1 @ d2
+
+    @cached_property
+    def model(self):
+        """
+        The statsmodels OLS fit of arr1 on arr2, only built when asked for. statsmodels is imported here, as
+        loading it takes over a second.
+        """
+        import statsmodels.api as sm
+        return sm.OLS(self.arr1, self.arr2).fit()
+
+    @cached_property
+    def correlation(self) -> float:
+        s11, s22, s12 = self.sums_of_squares
+        return s12 / np.sqrt(s11 * s22)
+
+    @cached_property
+    def kalman(self) -> dict:
+        """
+        The hedge ratio, spread, spread variance and z-score series of the Kalman filter over the window.
+        """
+        return kalman_filter(self.arr1, self.arr2)
+
+    @cached_property
+    def ols_hedge_ratio(self) -> float:
+        # Slope of the OLS of arr1 on arr2 without constant
+        arr2 = np.asarray(self.arr2, dtype=np.float64)
+        return (np.asarray(self.arr1, dtype=np.float64) @ arr2) / (arr2 @ arr2)
+
+    @cached_property
+    def ols_spread(self) -> np.ndarray:
+        return self.arr1 - self.ols_hedge_ratio * self.arr2
+
+    @cached_property
+    def hedge_ratio(self) -> float:
+        if self.hedge_model == 'kalman':
+            # Latest estimate of the time-varying hedge ratio
+            return float(self.kalman['hedge_ratio'][-1])
+        return self.ols_hedge_ratio
+
+    @cached_property
+    def spread(self) -> np.ndarray:
+        if self.hedge_model == 'kalman':
+            return self.kalman['spread']
+        return self.ols_spread
+
+    @cached_property
+    def cointegration_pvalue(self) -> float:
+        return batched_coint(self.arr1, self.arr2)[1][0]
+
+    @cached_property
+    def adf_pvalue(self) -> float:
+        return batched_adfuller(self.spread)[1][0]
 
+    @cached_property
+    def half_life(self) -> float:
+        # Always measured on the spread of the fixed OLS hedge ratio, as rolling_forex_stats does: the Kalman
+        # spread is updated with every bar, so it is close to white noise and would always revert within a bar
+        spread = self.ols_spread
+        if np.any(np.isnan(spread)):
+            import pandas as pd
+            logger.warning(
+                'NaN values found. Replacing with backward fill method.')
+            spread_lag = pd.Series(spread).shift(1).bfill().values
+        else:
+            spread_lag = np.roll(spread, 1)  # equivalent to shift
+        spread_ret = spread - spread_lag
+
+        # Slope of the OLS of spread_ret on spread_lag with a constant
+        lag_demeaned = spread_lag - spread_lag.mean()
+        slope = (lag_demeaned @ spread_ret) / (lag_demeaned @ lag_demeaned)
+        return -np.log(2) / slope
+
+    @cached_property
+    def zscore(self) -> np.ndarray:
+        if self.hedge_model == 'kalman':
+            # Forecast error of the filter over its standard deviation
+            return self.kalman['zscore']
+        # The demeaned spread follows from the demeaned time-series, with the population standard deviation
+        d1, d2 = self.demeaned
+        s11, s22, s12 = self.sums_of_squares
+        variance = (s11 - 2 * self.hedge_ratio * s12 + self.hedge_ratio ** 2 * s22) / len(d1)
+        return (d1 - self.hedge_ratio * d2) / np.sqrt(variance)
+
+    @instrument()
     def calculate_correlation(self) -> float:
         """
         Calculate the correlation between the two input time-series.
 
-        :return: A float representing the correlation coefficient ranging from -1 to 1. 
+        :return: A float representing the correlation coefficient ranging from -1 to 1.
         """
         try:
-            correlation = np.corrcoef(self.arr1, self.arr2)[0, 1]
-            logger.info(f"Calculated correlation: {correlation}")
+            correlation = self.correlation
+            logger.info("Calculated correlation: %s", correlation)
             return correlation
         except Exception as e:
             logger.error(f"Error calculating correlation: {str(e)}")
             return 0.0
 
+    @instrument()
     def check_cointegration(self, threshold: float = 0.05) -> bool:
         """
         Check if the two time-series are cointegrated using the Engle-Granger two-step method.
@@ -46,14 +156,15 @@ class ForexStats:
         :return: A boolean value. True if p-value is less than threshold (indicating cointegration), False otherwise.
         """
         try:
-            _, pvalue, _ = coint(self.arr1, self.arr2)
+            pvalue = self.cointegration_pvalue
             cointegrated = pvalue < threshold
-            logger.info(f"Cointegration test p-value: {pvalue}, cointegrated: {cointegrated}")
+            logger.info("Cointegration test p-value: %s, cointegrated: %s", pvalue, cointegrated)
             return cointegrated
         except Exception as e:
             logger.error(f"Error checking cointegration: {str(e)}")
             return False
 
+    @instrument()
     def check_stationarity(self, threshold: float = 0.05) -> bool:
         """
         Check if the spread of the two time-series is stationary using the Augmented Dickey-Fuller test.
@@ -62,100 +173,118 @@ class ForexStats:
         :return: A boolean value. True if p-value is less than threshold (indicating stationarity), False otherwise.
         """
         try:
-            adf_result = adfuller(self.spread)
-            stationary = adf_result[1] < threshold
-            logger.info(f"ADF test p-value: {adf_result[1]}, stationary: {stationary}")
+            pvalue = self.adf_pvalue
+            stationary = pvalue < threshold
+            logger.info("ADF test p-value: %s, stationary: %s", pvalue, stationary)
             return stationary
         except Exception as e:
             logger.error(f"Error checking stationarity: {str(e)}")
             return False
 
+    @instrument()
     def calculate_hedge_ratio(self) -> float:
         """
-        Calculate the hedge ratio between the two time-series. The hedge ratio is the slope coefficient from 
+        Calculate the hedge ratio between the two time-series. The hedge ratio is the slope coefficient from
         regressing arr1 on arr2, which can be used to form a stationary pair for pair trading.
 
         :return: A float representing the hedge ratio.
         """
         try:
-            hedge_ratio = self.model.params[0]
-            logger.info(f"Calculated hedge ratio: {hedge_ratio}")
+            hedge_ratio = self.hedge_ratio
+            logger.info("Calculated hedge ratio: %s", hedge_ratio)
             return hedge_ratio
         except Exception as e:
             logger.error(f"Error calculating hedge ratio: {str(e)}")
             return 0.0
 
+    @instrument()
     def calculate_spread(self) -> np.ndarray:
         """
-        Calculate the spread between the two time-series by regressing arr1 on arr2 and then subtracting 
+        Calculate the spread between the two time-series by regressing arr1 on arr2 and then subtracting
         arr2 times the regression coefficient from arr1.
 
         :return: A 1-D numpy array representing the spread of the two time-series.
         """
         try:
-            spread = self.arr1 - self.hedge_ratio * self.arr2
+            spread = self.spread
             logger.info("Calculated spread")
             return spread
         except Exception as e:
             logger.error(f"Error calculating spread: {str(e)}")
             return np.array([])
 
+    @instrument()
     def calculate_half_life(self) -> float:
         """
-        Calculate the half-life of the spread. Half-life is the time it takes for the spread to revert to 
-        half of its initial value, assuming a mean-reverting process.
+        Calculate the half-life of the spread. Half-life is the time it takes for the spread to revert to
+        half of its initial value, assuming a mean-reverting process. It uses the OLS spread whatever the
+        hedge model.
 
         :return: A float representing the half-life of the spread.
         """
         try:
-            if np.any(pd.isnull(self.spread)):
-                logging.warning(
-                    'NaN values found. Replacing with backward fill method.')
-                spread_lag = pd.Series(self.spread).shift(
-                    1).fillna(method='bfill').values
-            else:
-                spread_lag = np.roll(self.spread, 1)  # equivalent to shift
-            spread_ret = self.spread - spread_lag
-            spread_lag2 = sm.add_constant(spread_lag)
-            model = sm.OLS(spread_ret, spread_lag2)
-            res = model.fit()
-            half_life = -np.log(2) / res.params[1]
-            logger.info(f"Calculated half-life: {half_life}")
+            half_life = self.half_life
+            logger.info("Calculated half-life: %s", half_life)
             return half_life
         except Exception as e:
             logger.error(f"Error calculating half-life: {str(e)}")
             return 0.0
 
+    @instrument()
     def calculate_zscore(self) -> np.ndarray:
         """
-        Calculate the z-score of the spread. The z-score indicates how many standard deviations an element is 
+        Calculate the z-score of the spread. The z-score indicates how many standard deviations an element is
         from the mean.
 
         :return: A 1-D numpy array representing the z-score of the spread.
         """
         try:
-            zscore = stats.zscore(self.spread)
+            zscore = self.zscore
             logger.info("Calculated z-score")
             return zscore
         except Exception as e:
             logger.error(f"Error calculating z-score: {str(e)}")
             return np.array([])
 
+    @instrument()
     def calculate_zscore_rolling(self, window: int = 21) -> np.ndarray:
         """
-        Calculate the rolling z-score of the spread. The z-score indicates how many standard deviations an element is 
+        Calculate the rolling z-score of the spread. The z-score indicates how many standard deviations an element is
         from the mean.
 
         :param window: An integer representing the window size for the rolling z-score calculation. Default is 21.
         :return: A 1-D numpy array representing the rolling z-score of the spread.
         """
         try:
-            spread_series = pd.Series(self.spread)
-            mean = spread_series.rolling(window=window).mean()
-            std = spread_series.rolling(window=window).std()
-            zscore_rolling = (spread_series - mean) / std
+            if window not in self._zscore_rolling:
+                zscore_rolling = np.full(len(self.spread), np.nan)
+                if len(self.spread) >= window:
+                    windows = np.lib.stride_tricks.sliding_window_view(self.spread, window)
+                    zscore_rolling[window - 1:] = (self.spread[window - 1:] - windows.mean(axis=1)) / windows.std(axis=1, ddof=1)
+                self._zscore_rolling[window] = zscore_rolling
             logger.info("Calculated rolling z-score")
-            return zscore_rolling.values  # Convert the result back to np.ndarray
+            return self._zscore_rolling[window]
         except Exception as e:
             logger.error(f"Error calculating rolling z-score: {str(e)}")
             return np.array([])
+
+    def summary(self, threshold: float = 0.05, zscore_window: int = 21) -> dict:
+        """
+        Calculate every statistic at once. They share the demeaned arrays and sums of squares, so each
+        intermediate is computed a single time.
+
+        :param threshold: A float representing the p-value cut-off for deciding cointegration and stationarity. Default is 0.05.
+        :param zscore_window: An integer representing the window size for the rolling z-score calculation. Default is 21.
+        :return: A dictionary with the correlation, hedge ratio, spread, half-life, z-score, rolling z-score,
+                 cointegration and stationarity results.
+        """
+        return {
+            'correlation': self.calculate_correlation(),
+            'hedge_ratio': self.calculate_hedge_ratio(),
+            'spread': self.calculate_spread(),
+            'half_life': self.calculate_half_life(),
+            'zscore': self.calculate_zscore(),
+            'zscore_rolling': self.calculate_zscore_rolling(zscore_window),
+            'is_cointegrated': self.check_cointegration(threshold),
+            'is_stationary': self.check_stationarity(threshold),
+        }
@@ -0,0 +1,284 @@
+import logging
+import numpy as np
+from statistical_functions import ForexStats
+from rolling_stats import stats_from_sums
+from cointegration_tests import batched_coint
+from metrics import instrument
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Names of the running sums, see rolling_stats.window_sums
+WINDOW_SUMS = ('sx', 'sy', 'sxx', 'syy', 'sxy')
+LAG_SUMS = ('pxx', 'pxy', 'pyx', 'pyy')
+ZSCORE_SUMS = ('zsx', 'zsy', 'zsxx', 'zsyy', 'zsxy')
+
+
+class StreamingForexStats:
+    def __init__(self, window: int, zscore_window: int = 21, resync_every: int = None) -> None:
+        """
+        Initialize a streaming counterpart of ForexStats over the last `window` bars of two time-series. Bars
+        are kept in a ring buffer and every statistic is maintained through running sums, so adding a bar
+        costs O(1) whatever the window length.
+
+        :param window: An integer representing the window size (e.g. WINDOW_LENGTH).
+        :param zscore_window: An integer representing the window size of the rolling z-score. Default is 21.
+        :param resync_every: An integer representing how many pushes go by before the running sums are
+                             recomputed from the buffer to bound numerical drift. Default is the window size.
+        """
+        self.window = window
+        self.zscore_window = zscore_window
+        self.resync_every = resync_every or window
+
+        # Centred prices, oldest bar at self.head
+        self.buffer1 = np.zeros(window)
+        self.buffer2 = np.zeros(window)
+        self.head = 0
+        self.count = 0
+        self.last_time = None
+        self.pushes_since_resync = 0
+
+        # Reference prices the buffer is centred on
+        self.c1 = 0.0
+        self.c2 = 0.0
+        self.sums = dict.fromkeys(WINDOW_SUMS + LAG_SUMS + ZSCORE_SUMS, 0.0)
+
+    @property
+    def is_ready(self) -> bool:
+        """
+        True once the window holds `window` bars.
+        """
+        return self.count == self.window
+
+    def _bar(self, i: int) -> tuple:
+        # i-th oldest bar of the window
+        j = (self.head + i) % self.window
+        return self.buffer1[j], self.buffer2[j]
+
+    def _add(self, prefix: str, x: float, y: float, sign: float) -> None:
+        s = self.sums
+        s[prefix + 'sx'] += sign * x
+        s[prefix + 'sy'] += sign * y
+        s[prefix + 'sxx'] += sign * x * x
+        s[prefix + 'syy'] += sign * y * y
+        s[prefix + 'sxy'] += sign * x * y
+
+    def _add_lag(self, x: float, y: float, x_prev: float, y_prev: float, sign: float) -> None:
+        s = self.sums
+        s['pxx'] += sign * x * x_prev
+        s['pxy'] += sign * x * y_prev
+        s['pyx'] += sign * y * x_prev
+        s['pyy'] += sign * y * y_prev
+
+    @instrument()
+    def seed(self, arr1: np.ndarray, arr2: np.ndarray, times: np.ndarray = None) -> 'StreamingForexStats':
+        """
+        Fill the window from history, keeping the last `window` bars.
+
+        :param arr1: A 1-D numpy array representing the first time-series data (e.g. close prices of a forex symbol).
+        :param arr2: A 1-D numpy array representing the second time-series data (e.g. close prices of another forex symbol).
+        :param times: An optional 1-D array of bar times, used by update to tell new bars from the current one.
+        :return: The StreamingForexStats instance.
+        """
+        arr1 = np.asarray(arr1, dtype=np.float64)[-self.window:]
+        arr2 = np.asarray(arr2, dtype=np.float64)[-self.window:]
+        self.count = len(arr1)
+        self.head = 0
+        self.c1 = arr1.mean() if self.count else 0.0
+        self.c2 = arr2.mean() if self.count else 0.0
+        self.buffer1[:self.count] = arr1 - self.c1
+        self.buffer2[:self.count] = arr2 - self.c2
+        self.last_time = times[-1] if times is not None and len(times) else None
+        self.pushes_since_resync = 0
+        self.resync()
+        return self
+
+    def push(self, price1: float, price2: float) -> None:
+        """
+        Append a new bar, evicting the oldest one once the window is full.
+
+        :param price1: A float representing the new price of the first time-series.
+        :param price2: A float representing the new price of the second time-series.
+        """
+        x, y = price1 - self.c1, price2 - self.c2
+        zn = self.zscore_window
+
+        # The bar that drops out of the rolling z-score window
+        if self.count >= zn:
+            self._add('z', *self._bar(self.count - zn), -1.0)
+
+        # Link the new bar to the current newest one
+        if self.count:
+            self._add_lag(x, y, *self._bar(self.count - 1), 1.0)
+
+        if self.count == self.window:
+            # Evict the oldest bar and its link to the next one
+            oldest = self._bar(0)
+            self._add('', *oldest, -1.0)
+            self._add_lag(*self._bar(1), *oldest, -1.0)
+            self.buffer1[self.head], self.buffer2[self.head] = x, y
+            self.head = (self.head + 1) % self.window
+        else:
+            j = (self.head + self.count) % self.window
+            self.buffer1[j], self.buffer2[j] = x, y
+            self.count += 1
+
+        self._add('', x, y, 1.0)
+        self._add('z', x, y, 1.0)
+
+        self.pushes_since_resync += 1
+        if self.pushes_since_resync >= self.resync_every:
+            self.resync()
+
+    def amend(self, price1: float, price2: float) -> None:
+        """
+        Replace the newest bar, e.g. when the still-forming candle has a new close.
+
+        :param price1: A float representing the new price of the first time-series.
+        :param price2: A float representing the new price of the second time-series.
+        """
+        if not self.count:
+            self.push(price1, price2)
+            return
+
+        x, y = self._bar(self.count - 1)
+        self._add('', x, y, -1.0)
+        self._add('z', x, y, -1.0)
+        if self.count > 1:
+            self._add_lag(x, y, *self._bar(self.count - 2), -1.0)
+        self.count -= 1
+
+        # Put back the bar that had left the rolling z-score window
+        if self.count >= self.zscore_window:
+            self._add('z', *self._bar(self.count - self.zscore_window), 1.0)
+
+        self.push(price1, price2)
+
+    @instrument()
+    def update(self, times: np.ndarray, arr1: np.ndarray, arr2: np.ndarray) -> bool:
+        """
+        Bring the window up to date with the latest bars: bars newer than the last one seen are pushed and a
+        bar with the same time as the last one replaces it.
+
+        :param times: A 1-D array of bar times, oldest first.
+        :param arr1: A 1-D numpy array with the matching prices of the first time-series.
+        :param arr2: A 1-D numpy array with the matching prices of the second time-series.
+        :return: A boolean value. False if the bars do not reach back to the last bar seen, in which case the
+                 window has to be seeded again from history.
+        """
+        if self.last_time is None or len(times) == 0 or times[0] > self.last_time:
+            return False
+
+        for t, price1, price2 in zip(times, arr1, arr2):
+            if t == self.last_time:
+                self.amend(price1, price2)
+            elif t > self.last_time:
+                self.push(price1, price2)
+                self.last_time = t
+        return True
+
+    def resync(self) -> float:
+        """
+        Recompute every running sum from the ring buffer, re-centring it on the current window mean.
+
+        :return: A float representing the largest relative drift found in the running sums.
+        """
+        arr1, arr2 = self.get_arrays()
+
+        drift = 0.0
+        if self.pushes_since_resync:
+            exact = self._exact_sums(arr1 - self.c1, arr2 - self.c2)
+            scale = max(exact['sxx'], exact['syy'], np.finfo(np.float64).tiny)
+            drift = max(abs(self.sums[k] - exact[k]) for k in ('sxx', 'syy', 'sxy')) / scale
+            logger.debug("Resynced running sums, drift before resync: %s", drift)
+
+        if self.count:
+            self.c1, self.c2 = arr1.mean(), arr2.mean()
+        x, y = arr1 - self.c1, arr2 - self.c2
+        self.buffer1[:self.count], self.buffer2[:self.count] = x, y
+        self.head = 0
+        self.sums = self._exact_sums(x, y)
+        self.pushes_since_resync = 0
+        return drift
+
+    def _exact_sums(self, x: np.ndarray, y: np.ndarray) -> dict:
+        zx, zy = x[-self.zscore_window:], y[-self.zscore_window:]
+        return {
+            'sx': x.sum(), 'sy': y.sum(), 'sxx': x @ x, 'syy': y @ y, 'sxy': x @ y,
+            'pxx': x[1:] @ x[:-1], 'pxy': x[1:] @ y[:-1], 'pyx': y[1:] @ x[:-1], 'pyy': y[1:] @ y[:-1],
+            'zsx': zx.sum(), 'zsy': zy.sum(), 'zsxx': zx @ zx, 'zsyy': zy @ zy, 'zsxy': zx @ zy,
+        }
+
+    def get_arrays(self) -> tuple:
+        """
+        :return: A tuple of two 1-D numpy arrays with the prices of the window, oldest first.
+        """
+        order = (self.head + np.arange(self.count)) % self.window
+        return self.buffer1[order] + self.c1, self.buffer2[order] + self.c2
+
+    def to_forex_stats(self) -> ForexStats:
+        """
+        :return: A ForexStats instance over the current window, e.g. to compare against the batch statistics.
+        """
+        return ForexStats(*self.get_arrays())
+
+    def _stats(self) -> dict:
+        sums = dict(self.sums, n=self.count, zn=self.zscore_window, c1=self.c1, c2=self.c2)
+        sums['x_first'], sums['y_first'] = self._bar(0)
+        sums['x_last'], sums['y_last'] = self._bar(self.count - 1)
+        if self.count < self.zscore_window:
+            for key in ZSCORE_SUMS:
+                sums.pop(key)
+        return stats_from_sums(sums)
+
+    def calculate_correlation(self) -> float:
+        """
+        :return: A float representing the correlation coefficient of the window, as ForexStats.calculate_correlation.
+        """
+        return float(self._stats()['correlation'])
+
+    def calculate_hedge_ratio(self) -> float:
+        """
+        :return: A float representing the hedge ratio of the window, as ForexStats.calculate_hedge_ratio.
+        """
+        return float(self._stats()['hedge_ratio'])
+
+    def calculate_spread(self) -> np.ndarray:
+        """
+        :return: A 1-D numpy array representing the spread of the window, as ForexStats.calculate_spread. O(window).
+        """
+        arr1, arr2 = self.get_arrays()
+        return arr1 - self.calculate_hedge_ratio() * arr2
+
+    def calculate_half_life(self) -> float:
+        """
+        :return: A float representing the half-life of the spread, as ForexStats.calculate_half_life.
+        """
+        return float(self._stats()['half_life'])
+
+    def calculate_zscore(self) -> float:
+        """
+        :return: A float representing the z-score of the newest bar, i.e. ForexStats.calculate_zscore()[-1].
+        """
+        return float(self._stats()['zscore'])
+
+    def calculate_zscore_rolling(self) -> float:
+        """
+        :return: A float representing the rolling z-score of the newest bar, i.e. ForexStats.calculate_zscore_rolling()[-1].
+        """
+        return float(self._stats()['zscore_rolling'])
+
+    @instrument()
+    def check_cointegration(self, threshold: float = 0.05) -> bool:
+        """
+        Check if the window is cointegrated with the Engle-Granger two-step method. This one is O(window).
+
+        :param threshold: A float representing the p-value cut-off for deciding cointegration. Default is 0.05.
+        :return: A boolean value. True if p-value is less than threshold (indicating cointegration), False otherwise.
+        """
+        try:
+            pvalue = batched_coint(*self.get_arrays())[1][0]
+            return bool(pvalue < threshold)
+        except Exception as e:
+            logger.error(f"Error checking cointegration: {str(e)}")
+            return False
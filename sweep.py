@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import logging
+import itertools
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from rolling_stats import rolling_forex_stats
+from pnl_simulator import simulate_pair
+from broker import timeframe_seconds
+from mt5_data import get_prices, get_spread, get_point
+from log_config import setup_logging
+from constants import *
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Parameters of a grid cell besides the window, in the column order of the results table
+CELL_PARAMETERS = ('min_correlation', 'max_half_life', 'entry_zscore', 'exit_zscore')
+
+# Shared memory block attached in a worker process, by name
+_attached = {}
+
+
+def grid_cells(grid: dict) -> list:
+    """
+    Expand the parameters of a grid that do not need the rolling statistics to be recomputed.
+
+    :param grid: A dictionary with a list of values for 'window' and for every CELL_PARAMETERS key.
+    :return: A list of dictionaries, one per combination, leaving out those exiting at or beyond their entry.
+    """
+    return [dict(zip(CELL_PARAMETERS, values)) for values in itertools.product(*(grid[key] for key in CELL_PARAMETERS))
+            if values[3] < values[2]]
+
+
+def _attach(spec: dict) -> np.ndarray:
+    # Map the shared price block of the current sweep into this process without copying it
+    for name in list(_attached):
+        if name != spec['closes']:
+            _attached.pop(name).close()
+    if spec['closes'] not in _attached:
+        _attached[spec['closes']] = shared_memory.SharedMemory(name=spec['closes'])
+    return np.ndarray(spec['shape'], dtype=np.float64, buffer=_attached[spec['closes']].buf)
+
+
+def _sweep_task(spec: dict, row: int, window: int, cells: list) -> list:
+    # Worker side: the rolling statistics of one pair and window are computed once and shared by every cell
+    closes = _attach(spec)[row]
+    bars = min(spec['bars'], spec['lengths'][row] - window + 1)
+    if bars <= 0:
+        return []
+    x, y = closes[-(bars + window - 1):, 0], closes[-(bars + window - 1):, 1]
+    rolling = rolling_forex_stats(x, y, window)
+    x, y = x[window - 1:], y[window - 1:]
+    cost1, cost2 = spec['costs'][row]
+
+    results = []
+    for cell in cells:
+        # Entries need the same filters as find_cointegrated_pairs, with the cell's cutoffs
+        allowed = (rolling['is_cointegrated'] & (rolling['correlation'] > cell['min_correlation'])
+                   & (rolling['half_life'] <= cell['max_half_life']))
+        simulation = simulate_pair(np.arange(bars), x, y, rolling['zscore'], rolling['hedge_ratio'],
+                                   cell['entry_zscore'], cell['exit_zscore'], STOP_ZSCORE, allowed, cost1, cost2,
+                                   COMMISSION_RATE, spec['periods_per_year'])
+        results.append({'window': window, **cell, **simulation['summary']})
+    return results
+
+
+def run_sweep(pairs: list = None, grid: dict = SWEEP_GRID, bars: int = SWEEP_BARS, workers: int = SWEEP_WORKERS,
+              timeframe: int = TIMEFRAME) -> pd.DataFrame:
+    """
+    Backtest every pair on every cell of a parameter grid. The prices are fetched once and shared with the
+    workers through shared memory, and each (pair, window) task computes its rolling statistics once for all
+    the cells of that window.
+
+    :param pairs: An optional list of pairs. Defaults to the pairs in PAIRS_CORR_FILE.
+    :param grid: A dictionary with a list of values for 'window' and for every CELL_PARAMETERS key. Default is SWEEP_GRID.
+    :param bars: An integer representing the number of bars every cell is evaluated on. Default is SWEEP_BARS.
+    :param workers: An integer representing the number of processes, 1 runs in this process. Default is SWEEP_WORKERS.
+    :param timeframe: An integer representing the MT5 timeframe. Default is TIMEFRAME.
+    :return: A pandas DataFrame with one row per pair and parameter set, ranked by Sharpe ratio within each pair.
+    """
+    if pairs is None:
+        with open(PAIRS_CORR_FILE, 'r') as file:
+            pairs = json.load(file)
+
+    # Fetch every pair once, with enough history for the longest window
+    start = time.perf_counter()
+    count = bars + max(grid['window']) - 1
+    data = [get_prices(pair, timeframe, count, 'close') for pair in pairs]
+    costs = [[get_spread(symbol) * get_point(symbol) for symbol in pair] for pair in pairs]
+    fetch_time = time.perf_counter() - start
+
+    # One block of shape (pairs, count, 2), every pair right-aligned on its latest bar
+    start = time.perf_counter()
+    shape = (len(pairs), count, 2)
+    block = shared_memory.SharedMemory(create=True, size=max(8 * shape[0] * shape[1] * shape[2], 1))
+    try:
+        closes = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+        lengths = []
+        for row, (_, prices) in enumerate(data):
+            n = min(len(prices), count)
+            closes[row, count - n:] = prices[len(prices) - n:]
+            lengths.append(n)
+
+        spec = {'closes': block.name, 'shape': shape, 'lengths': lengths, 'bars': bars, 'costs': costs,
+                'periods_per_year': 252 * 86400 / timeframe_seconds(timeframe)}
+        cells = grid_cells(grid)
+        tasks = [(row, window) for row in range(len(pairs)) for window in grid['window']]
+        rows, windows = [task[0] for task in tasks], [task[1] for task in tasks]
+
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_sweep_task, [spec] * len(tasks), rows, windows, [cells] * len(tasks)))
+        else:
+            results = list(map(_sweep_task, [spec] * len(tasks), rows, windows, [cells] * len(tasks)))
+            attached = _attached.pop(block.name, None)
+            if attached is not None:
+                attached.close()
+    finally:
+        block.close()
+        block.unlink()
+    logger.info(f"Swept {len(pairs)} pairs over {len(grid['window'])} windows and {len(cells)} cells with "
+                f"{workers} worker(s): fetch {fetch_time:.3f}s, compute {time.perf_counter() - start:.3f}s")
+
+    table = pd.DataFrame([{'pair': f'{pairs[row][0]}_{pairs[row][1]}', **result}
+                          for row, task_results in zip(rows, results) for result in task_results])
+    if table.empty:
+        return table
+    table = table.sort_values(['pair', 'sharpe'], ascending=[True, False], kind='stable')
+    table.insert(1, 'rank', table.groupby('pair').cumcount() + 1)
+    return table.reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    setup_logging(filename=None)
+    output_folder = 'output_folder'
+    os.makedirs(output_folder, exist_ok=True)
+    table = run_sweep()
+    table.to_csv(os.path.join(output_folder, 'sweep_results.csv'), index=False)
+    logger.info(f'Saved sweep results to {output_folder}/sweep_results.csv')
+    print(table[table['rank'] == 1].to_string(index=False))
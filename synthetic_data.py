@@ -0,0 +1,149 @@
+import numpy as np
+from bar_store import RATES_DTYPE
+from broker import TICKS_DTYPE
+
+
+def ornstein_uhlenbeck(n: int, half_life: float, sigma: float, rng: np.random.Generator, size: int = None) -> np.ndarray:
+    """
+    Simulate a mean-reverting AR(1) process with a given half-life, starting at 0.
+
+    :param n: An integer representing the number of bars.
+    :param half_life: A float representing the half-life of the process, in bars.
+    :param sigma: A float representing the standard deviation of the innovations.
+    :param rng: A numpy random Generator.
+    :param size: An optional integer; when given, `size` independent processes are returned as columns.
+    :return: A numpy array of shape (n,) or (n, size).
+    """
+    phi = 0.5 ** (1 / half_life)
+    shape = (n,) if size is None else (n, size)
+    innovations = rng.normal(0, sigma, shape)
+    process = np.zeros(shape)
+    for t in range(1, n):
+        process[t] = phi * process[t - 1] + innovations[t]
+    return process
+
+
+def cointegrated_pair(n: int, hedge_ratio: float = 1.3, half_life: float = 20, sigma: float = 3e-4,
+                      spread_sigma: float = 2e-4, start: float = 1.2, seed: int = 0) -> tuple:
+    """
+    Generate two price series cointegrated with a known hedge ratio and spread half-life: arr2 is a random
+    walk and arr1 = hedge_ratio * arr2 + a mean-reverting spread.
+
+    :param n: An integer representing the number of bars.
+    :param hedge_ratio: A float representing the hedge ratio of arr1 on arr2. Default is 1.3.
+    :param half_life: A float representing the half-life of the spread, in bars. Default is 20.
+    :param sigma: A float representing the standard deviation of the arr2 returns. Default is 3e-4.
+    :param spread_sigma: A float representing the standard deviation of the spread innovations. Default is 2e-4.
+    :param start: A float representing the first price of arr2. Default is 1.2.
+    :param seed: An integer seed for the random generator. Default is 0.
+    :return: A tuple of two 1-D numpy arrays (arr1, arr2).
+    """
+    rng = np.random.default_rng(seed)
+    arr2 = start + np.cumsum(rng.normal(0, sigma, n))
+    arr1 = hedge_ratio * arr2 + ornstein_uhlenbeck(n, half_life, spread_sigma, rng)
+    return arr1, arr2
+
+
+def symbol_universe(n_symbols: int, n_bars: int, n_factors: int = 8, half_life: float = 20, seed: int = 0) -> np.ndarray:
+    """
+    Generate aligned prices for a universe of symbols driven by a few common random-walk factors plus
+    mean-reverting idiosyncratic noise, so that symbols loading on the same factor are cointegrated.
+
+    :param n_symbols: An integer representing the number of symbols.
+    :param n_bars: An integer representing the number of bars.
+    :param n_factors: An integer representing the number of common factors. Default is 8.
+    :param half_life: A float representing the half-life of the idiosyncratic noise, in bars. Default is 20.
+    :param seed: An integer seed for the random generator. Default is 0.
+    :return: A 2-D numpy array of shape (n_bars, n_symbols).
+    """
+    rng = np.random.default_rng(seed)
+    factors = 1.0 + np.cumsum(rng.normal(0, 3e-4, (n_bars, n_factors)), axis=0)
+    loadings = rng.uniform(0.5, 1.5, n_symbols)
+    factor_of = rng.integers(0, n_factors, n_symbols)
+    noise = ornstein_uhlenbeck(n_bars, half_life, 2e-4, rng, size=n_symbols)
+    return factors[:, factor_of] * loadings + noise
+
+
+def cointegrated_pairs(n_pairs: int, n_bars: int, hedge_ratios: tuple = (0.5, 1.5), half_lives: tuple = (5, 30),
+                       seed: int = 0) -> tuple:
+    """
+    Generate several independent cointegrated pairs, each with its own hedge ratio and half-life drawn
+    uniformly from the given ranges.
+
+    :param n_pairs: An integer representing the number of pairs.
+    :param n_bars: An integer representing the number of bars.
+    :param hedge_ratios: A tuple (low, high) of the range of the hedge ratios. Default is (0.5, 1.5).
+    :param half_lives: A tuple (low, high) of the range of the half-lives, in bars. Default is (5, 30).
+    :param seed: An integer seed for the random generator. Default is 0.
+    :return: A tuple (prices, truth): a 2-D numpy array of shape (n_bars, 2 * n_pairs), pair k in columns
+             2k and 2k + 1, and a list of dictionaries with the 'hedge_ratio' and 'half_life' of every pair.
+    """
+    rng = np.random.default_rng(seed)
+    prices = np.empty((n_bars, 2 * n_pairs))
+    truth = []
+    for k in range(n_pairs):
+        hedge_ratio, half_life = rng.uniform(*hedge_ratios), rng.uniform(*half_lives)
+        prices[:, 2 * k], prices[:, 2 * k + 1] = cointegrated_pair(n_bars, hedge_ratio, half_life,
+                                                                   seed=int(rng.integers(2 ** 31)))
+        truth.append({'hedge_ratio': hedge_ratio, 'half_life': half_life})
+    return prices, truth
+
+
+def rates_from_prices(prices: np.ndarray, missing: float = 0.0, spread: int = 10, start: int = 1_600_000_000,
+                      period: int = 300, seed: int = 0) -> list:
+    """
+    Turn aligned prices into MT5-like rate records, each symbol missing a random fraction of the bars.
+
+    :param prices: A 2-D numpy array of shape (n_bars, n_symbols).
+    :param missing: A float representing the fraction of bars left out of every symbol. Default is 0.0.
+    :param spread: An integer representing the spread recorded with every bar, in points. Default is 10.
+    :param start: An integer representing the time of the first bar, in seconds. Default is 1_600_000_000.
+    :param period: An integer representing the length of a bar, in seconds. Default is 300.
+    :param seed: An integer seed for the random generator. Default is 0.
+    :return: A list of structured numpy arrays of RATES_DTYPE, one per symbol.
+    """
+    rng = np.random.default_rng(seed)
+    n_bars = len(prices)
+    rates = []
+    for k in range(prices.shape[1]):
+        bars = np.zeros(n_bars, dtype=RATES_DTYPE)
+        bars['time'] = start + period * np.arange(n_bars)
+        bars['open'] = bars['high'] = bars['low'] = bars['close'] = prices[:, k]
+        bars['tick_volume'] = 1
+        bars['spread'] = spread
+        rates.append(bars[rng.random(n_bars) >= missing] if missing else bars)
+    return rates
+
+
+def ticks_from_prices(prices: np.ndarray, ticks_per_bar: int = 60, spread: float = 1e-4, noise: float = 5e-5,
+                      start: int = 1_600_000_000, period: int = 300, seed: int = 0) -> list:
+    """
+    Turn aligned prices into MT5-like tick records: every bar gets ticks at random times, whose bid moves from
+    the previous close to the close of the bar with some noise, the last tick of the bar at its close.
+
+    :param prices: A 2-D numpy array of shape (n_bars, n_symbols).
+    :param ticks_per_bar: An integer representing the number of ticks of every bar. Default is 60.
+    :param spread: A float representing the difference between ask and bid. Default is 1e-4.
+    :param noise: A float representing the standard deviation of the bid around its path. Default is 5e-5.
+    :param start: An integer representing the time of the first bar, in seconds. Default is 1_600_000_000.
+    :param period: An integer representing the length of a bar, in seconds. Default is 300.
+    :param seed: An integer seed for the random generator. Default is 0.
+    :return: A list of structured numpy arrays of TICKS_DTYPE, one per symbol.
+    """
+    rng = np.random.default_rng(seed)
+    n_bars = len(prices)
+    ticks = []
+    for k in range(prices.shape[1]):
+        offsets = np.sort(rng.integers(0, period * 1000, (n_bars, ticks_per_bar)), axis=1)
+        previous = np.concatenate([prices[:1, k], prices[:-1, k]])
+        path = previous[:, None] + (prices[:, k] - previous)[:, None] * np.linspace(0, 1, ticks_per_bar + 1)[1:]
+        bid = path + rng.normal(0, noise, path.shape)
+        bid[:, -1] = prices[:, k]
+
+        records = np.zeros(n_bars * ticks_per_bar, dtype=TICKS_DTYPE)
+        records['time_msc'] = (1000 * (start + period * np.arange(n_bars))[:, None] + offsets).ravel()
+        records['time'] = records['time_msc'] // 1000
+        records['bid'] = bid.ravel()
+        records['ask'] = records['bid'] + spread
+        ticks.append(records)
+    return ticks
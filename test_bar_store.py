@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+import fake_mt5
+from broker import SimulatedBroker, TIMEFRAME_M5
+from synthetic_data import symbol_universe, rates_from_prices
+from bar_store import BarStore
+
+COUNT = 100
+
+
+@pytest.fixture
+def terminal():
+    rates = rates_from_prices(symbol_universe(1, 600), missing=0.05)[0]
+    simulated = SimulatedBroker({'EURUSD': rates}, start=rates['time'][200])
+    yield fake_mt5.install(simulated)
+    fake_mt5.uninstall()
+
+
+def assert_served_like_the_terminal(store, terminal, start_pos=0):
+    expected = terminal.copy_rates_from_pos('EURUSD', TIMEFRAME_M5, start_pos, COUNT)
+    served = store.copy_rates_from_pos('EURUSD', TIMEFRAME_M5, start_pos, COUNT)
+    np.testing.assert_array_equal(served, expected)
+    return served
+
+
+def test_bar_store_follows_the_terminal(terminal, tmp_path):
+    store = BarStore(str(tmp_path), terminal, probe=4)
+    forming = assert_served_like_the_terminal(store, terminal)[-1]
+    assert forming['tick_volume'] == 0
+    assert store.stats == {'hits': 0, 'misses': 1, 'bars_fetched': COUNT, 'bars_served': COUNT}
+
+    # Next bar: the stored forming bar is replaced by its final version
+    terminal.simulated.advance()
+    served = assert_served_like_the_terminal(store, terminal)
+    assert served[-2]['time'] == forming['time'] and served[-2]['tick_volume'] == 1
+    assert store.stats['hits'] == 1 and store.stats['bars_fetched'] == COUNT + 4
+
+    # Ten bars later, the probe doubles until it reaches back to the stored bars
+    terminal.simulated.advance(10)
+    assert_served_like_the_terminal(store, terminal)
+    assert store.stats['hits'] == 2 and store.stats['bars_fetched'] == COUNT + 4 + 4 + 8 + 16
+    assert_served_like_the_terminal(store, terminal, start_pos=5)
+    assert store.stats['hits'] == 3 and store.stats['misses'] == 1
+
+    # A gap wider than the request downloads the whole history again
+    terminal.simulated.advance(2 * COUNT)
+    assert_served_like_the_terminal(store, terminal)
+    assert store.stats['hits'] == 3 and store.stats['misses'] == 2
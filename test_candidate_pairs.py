@@ -0,0 +1,58 @@
+import json
+import numpy as np
+import pytest
+import main_cointegration
+from main_cointegration import find_candidate_pairs
+
+
+@pytest.fixture
+def pair_list(tmp_path, monkeypatch):
+    path = tmp_path / 'pairs_corr.json'
+    path.write_text(json.dumps([['EURUSD', 'GBPUSD']]))
+    monkeypatch.setattr(main_cointegration, 'PAIRS_CORR_FILE', str(path))
+    monkeypatch.setattr(main_cointegration, 'get_prices',
+                        lambda *args: (np.arange(10), np.ones((10, 3))))
+    return path
+
+
+def test_candidates_replace_the_pair_list(pair_list, monkeypatch):
+    monkeypatch.setattr(main_cointegration, 'discover_pairs',
+                        lambda symbols, prices: [{'pair': ['AUDUSD', 'NZDUSD']}])
+    find_candidate_pairs(['AUDUSD', 'NZDUSD', 'EURUSD'])
+    assert json.loads(pair_list.read_text()) == [['AUDUSD', 'NZDUSD']]
+    assert [path.name for path in pair_list.parent.iterdir()] == [pair_list.name]
+
+
+def test_no_candidates_keep_the_pair_list(pair_list, monkeypatch):
+    monkeypatch.setattr(main_cointegration, 'discover_pairs', lambda symbols, prices: [])
+    assert find_candidate_pairs(['AUDUSD', 'NZDUSD', 'EURUSD']) == []
+    assert json.loads(pair_list.read_text()) == [['EURUSD', 'GBPUSD']]
+
+
+def test_discover_subcommand_writes_the_pair_list(pair_list, monkeypatch, capsys):
+    import cli
+    from log_config import stop_logging
+    monkeypatch.setattr(main_cointegration, 'discover_pairs',
+                        lambda symbols, prices: [{'pair': ['AUDUSD', 'NZDUSD']}, {'pair': ['EURUSD', 'GBPUSD']}])
+    try:
+        assert cli.main(['discover', '--max-pairs', '1']) == 0
+    finally:
+        stop_logging()
+    assert capsys.readouterr().out.strip() == '1 candidate pairs'
+    assert json.loads(pair_list.read_text()) == [['AUDUSD', 'NZDUSD']]
+
+
+def test_baskets_subcommand_writes_the_baskets(pair_list, monkeypatch, capsys):
+    import cli
+    from log_config import stop_logging
+    path = pair_list.parent / 'cointegrated_baskets.json'
+    monkeypatch.setattr(main_cointegration, 'COINTEGRATED_BASKETS_FILE', str(path))
+    monkeypatch.setattr(main_cointegration, 'candidate_baskets', lambda symbols, sizes, shared_quote: [sizes, shared_quote])
+    monkeypatch.setattr(main_cointegration, 'discover_baskets',
+                        lambda symbols, prices, baskets: [{'symbols': symbols[:3], 'tested': baskets}])
+    try:
+        assert cli.main(['baskets', '--sizes', '3', '--shared-quote']) == 0
+    finally:
+        stop_logging()
+    assert capsys.readouterr().out.strip() == '1 cointegrated baskets'
+    assert json.loads(path.read_text())[0]['tested'] == [[3], True]
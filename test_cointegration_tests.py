@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from statsmodels.tsa.stattools import adfuller, coint
+from synthetic_data import cointegrated_pairs
+from cointegration_tests import batched_adfuller, batched_coint
+
+
+@pytest.fixture(scope='module')
+def pairs():
+    # Cointegrated pairs, then independent random walks
+    prices, _ = cointegrated_pairs(6, 300, half_lives=(2, 8), seed=3)
+    walks = 1.2 + np.cumsum(np.random.default_rng(4).normal(0, 3e-4, (300, 12)), axis=0)
+    prices = np.hstack([prices, walks])
+    return prices[:, 0::2].T, prices[:, 1::2].T
+
+
+@pytest.mark.parametrize('autolag', ['aic', None])
+def test_batched_coint_matches_statsmodels(pairs, autolag):
+    y0, y1 = pairs
+    stats, pvalues = batched_coint(y0, y1, maxlag=4 if autolag is None else None, autolag=autolag)
+    for k in range(len(y0)):
+        stat, pvalue, _ = coint(y0[k], y1[k], trend='c', maxlag=4 if autolag is None else None, autolag=autolag)
+        assert stats[k] == pytest.approx(stat, rel=1e-6)
+        assert pvalues[k] == pytest.approx(pvalue, rel=1e-6, abs=1e-9)
+    assert (pvalues[:6] < 0.05).all()
+
+
+@pytest.mark.filterwarnings('ignore::FutureWarning')
+@pytest.mark.parametrize('regression', ['c', 'n'])
+def test_batched_adfuller_matches_statsmodels(pairs, regression):
+    y0, y1 = pairs
+    spread = y0 - 0.8 * y1
+    stats, pvalues, lags = batched_adfuller(spread, regression=regression)
+    for k in range(len(spread)):
+        stat, pvalue, lag = adfuller(spread[k], regression=regression, autolag='AIC')[:3]
+        assert lags[k] == lag
+        assert stats[k] == pytest.approx(stat, rel=1e-6)
+        assert pvalues[k] == pytest.approx(pvalue, rel=1e-6, abs=1e-9)
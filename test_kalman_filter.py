@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from kalman_filter import kalman_filter, KALMAN_STATS
+from synthetic_data import cointegrated_pair
+from statistical_functions import ForexStats
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_tracks_a_drifting_hedge_ratio(seed):
+    n = 28800
+    hedge_ratio = np.linspace(0.8, 1.2, n)
+    arr1, arr2 = cointegrated_pair(n, hedge_ratio=hedge_ratio, seed=seed)
+    error = np.abs(kalman_filter(arr1, arr2)['hedge_ratio'] - hedge_ratio)
+    assert error.mean() < 0.05
+    assert error[-288:].mean() < 0.08
+
+
+def test_keeps_a_static_hedge_ratio():
+    arr1, arr2 = cointegrated_pair(28800, hedge_ratio=1.3)
+    assert np.abs(kalman_filter(arr1, arr2)['hedge_ratio'] - 1.3).mean() < 0.01
+
+
+def test_resuming_from_state_matches_a_single_pass():
+    arr1, arr2 = cointegrated_pair(2000, hedge_ratio=np.linspace(0.8, 1.2, 2000))
+    whole = kalman_filter(arr1, arr2)
+    first = kalman_filter(arr1[:1234], arr2[:1234])
+    rest = kalman_filter(arr1[1234:], arr2[1234:], state=first['state'])
+    for name in KALMAN_STATS:
+        np.testing.assert_allclose(np.r_[first[name], rest[name]], whole[name], rtol=1e-12, atol=1e-15)
+    assert rest['state'] == pytest.approx(whole['state'], rel=1e-12)
+
+
+@pytest.mark.parametrize('half_life', [5, 40])
+def test_forexstats_half_life_ignores_the_hedge_model(half_life):
+    arr1, arr2 = cointegrated_pair(288, half_life=half_life, seed=3)
+    ols, kalman = ForexStats(arr1, arr2, hedge_model='ols'), ForexStats(arr1, arr2, hedge_model='kalman')
+    assert kalman.calculate_half_life() == ols.calculate_half_life()
+    assert kalman.calculate_half_life() > 1
@@ -0,0 +1,85 @@
+import pytest
+from broker import SimulatedBroker, OrderSendResult, TRADE_RETCODE_INVALID, set_broker
+from synthetic_data import symbol_universe, rates_from_prices
+import mt5_positions
+from mt5_positions import place_pair_order
+from metrics import registry
+
+
+class FaultyBroker(SimulatedBroker):
+    """
+    Simulated backend whose orders on some symbols are rejected by the server or raise, after passing
+    order_check.
+    """
+
+    def __init__(self, *args, reject=(), fail=(), reject_closes=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reject = set(reject)
+        self.fail = set(fail)
+        self.reject_closes = set(reject_closes)
+
+    def order_send(self, request):
+        symbol, closing = request['symbol'], 'position' in request
+        if symbol in self.fail and not closing:
+            raise RuntimeError('connection lost')
+        if (symbol in self.reject and not closing) or (symbol in self.reject_closes and closing):
+            self.stats['rejected'] += 1
+            return OrderSendResult(TRADE_RETCODE_INVALID, 0, 0, 0.0, 0.0, 0.0, 0.0, 'Rejected', request)
+        return super().order_send(request)
+
+
+@pytest.fixture(params=[True, False], ids=['concurrent', 'sequential'])
+def make_broker(request, monkeypatch):
+    rates = dict(zip(('EURUSD', 'GBPUSD'), rates_from_prices(symbol_universe(2, 50))))
+    monkeypatch.setitem(mt5_positions.pair_order_stats, 'flattened', 0)
+    monkeypatch.setitem(mt5_positions.pair_order_stats, 'flatten_failed', 0)
+
+    def make(**faults):
+        simulated = FaultyBroker(rates, **faults)
+        simulated.concurrent_orders = request.param
+        previous = set_broker(simulated)
+        request.addfinalizer(lambda: set_broker(previous))
+        return simulated
+    return make
+
+
+def test_both_legs_filled(make_broker):
+    simulated = make_broker()
+    ticket_x, ticket_y = place_pair_order('EURUSD', 'buy', 0.1, 'GBPUSD', 'sell', 0.1)
+    assert ticket_x and ticket_y
+    assert sorted(simulated.positions) == sorted((ticket_x, ticket_y))
+    assert mt5_positions.pair_order_stats['flattened'] == 0
+
+
+def test_rejected_leg_is_flattened(make_broker):
+    simulated = make_broker(reject=['GBPUSD'])
+    assert place_pair_order('EURUSD', 'buy', 0.1, 'GBPUSD', 'sell', 0.1) == (0, 0)
+    assert simulated.positions == {}
+    assert mt5_positions.pair_order_stats['flattened'] == 1
+
+
+def test_raising_leg_is_flattened(make_broker):
+    simulated = make_broker(fail=['EURUSD'])
+    assert place_pair_order('EURUSD', 'buy', 0.1, 'GBPUSD', 'sell', 0.1) == (0, 0)
+    assert simulated.positions == {}
+    assert mt5_positions.pair_order_stats['flattened'] == 1
+
+
+def test_failed_flatten_returns_open_ticket(make_broker):
+    simulated = make_broker(reject=['GBPUSD'], reject_closes=['EURUSD'])
+    ticket_x, ticket_y = place_pair_order('EURUSD', 'buy', 0.1, 'GBPUSD', 'sell', 0.1)
+    assert ticket_y == 0
+    assert list(simulated.positions) == [ticket_x]
+    assert mt5_positions.pair_order_stats['flattened'] == 0
+    assert mt5_positions.pair_order_stats['flatten_failed'] == 1
+
+
+def test_skew_and_round_trip_are_exported(make_broker, monkeypatch):
+    make_broker()
+    monkeypatch.setattr(registry, 'enabled', True)
+    for name in ('histograms', 'counters', 'errors'):
+        monkeypatch.setattr(registry, name, {})
+    place_pair_order('EURUSD', 'buy', 0.1, 'GBPUSD', 'sell', 0.1)
+    assert registry.histograms['orders.leg_skew'].count == 1
+    assert registry.histograms['orders.round_trip'].count == 1
+    assert 'leg_skew' in registry.render()
@@ -0,0 +1,36 @@
+import numpy as np
+from pnl_simulator import positions_from_zscore
+
+
+def test_entries_and_exits():
+    zscore = np.array([0.0, 2.1, 1.0, -0.1, -2.5, -1.0, 0.2])
+    np.testing.assert_array_equal(positions_from_zscore(zscore, entry=2, exit=0), [0, -1, -1, 0, 1, 1, 0])
+
+
+def test_stopped_side_waits_for_exit_before_entering_again():
+    zscore = np.array([2.5, 3.1, 2.9, 3.2, 2.95, 1.0, -0.1, 2.2, -3.5, -2.5, 0.1, -2.1])
+    np.testing.assert_array_equal(positions_from_zscore(zscore, entry=2, exit=0, stop=3),
+                                  [-1, 0, 0, 0, 0, 0, 0, -1, 0, 0, 0, 1])
+
+
+def test_stop_matches_a_bar_by_bar_loop():
+    zscore = np.cumsum(np.random.default_rng(0).normal(0, 0.4, 5000))
+    zscore = 4 * np.sin(zscore)
+    position = positions_from_zscore(zscore, entry=2, exit=0.5, stop=3)
+
+    expected, held, blocked = [], 0, {1: False, -1: False}
+    for z in zscore:
+        for side in (1, -1):
+            if side * z >= -0.5:
+                blocked[side] = False
+            if side * z <= -3:
+                blocked[side] = True
+        if held and (held * z >= -0.5 or held * z <= -3):
+            held = 0
+        if not held:
+            if z <= -2 and not blocked[1]:
+                held = 1
+            elif z >= 2 and not blocked[-1]:
+                held = -1
+        expected.append(held)
+    np.testing.assert_array_equal(position, expected)
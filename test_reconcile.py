@@ -0,0 +1,41 @@
+import pytest
+from broker import SimulatedBroker, set_broker
+from synthetic_data import symbol_universe, rates_from_prices
+from position_book import PositionBook
+from mt5_positions import place_market_order, close_order_by_ticket
+import main
+
+
+@pytest.fixture
+def broken_pair(monkeypatch):
+    simulated = SimulatedBroker(dict(zip(('EURUSD', 'GBPUSD'), rates_from_prices(symbol_universe(2, 50)))))
+    previous = set_broker(simulated)
+    book = PositionBook()
+    monkeypatch.setattr(main, 'book', book)
+    ticket_x = place_market_order('EURUSD', 'buy', 0.1)
+    ticket_y = place_market_order('GBPUSD', 'sell', 0.1)
+    book.open_pair('EURUSD', 'GBPUSD', ticket_x, ticket_y)
+    close_order_by_ticket(ticket_y)
+    yield simulated, book, ticket_x
+    set_broker(previous)
+
+
+def test_broken_pair_is_flattened(broken_pair):
+    simulated, book, _ = broken_pair
+    main.reconcile_positions()
+    assert simulated.positions == {}
+    assert not book.has_pair('EURUSD', 'GBPUSD')
+
+
+def test_failed_flatten_keeps_the_pair(broken_pair, monkeypatch):
+    simulated, book, ticket_x = broken_pair
+    monkeypatch.setattr(main, 'close_order_by_ticket', lambda ticket, comment='': False)
+    main.reconcile_positions()
+    assert list(simulated.positions) == [ticket_x]
+    assert book.has_pair('EURUSD', 'GBPUSD')
+
+    # Retried on the next candle
+    monkeypatch.setattr(main, 'close_order_by_ticket', close_order_by_ticket)
+    main.reconcile_positions()
+    assert simulated.positions == {}
+    assert not book.has_pair('EURUSD', 'GBPUSD')
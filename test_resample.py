@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from broker import SimulatedBroker, TIMEFRAME_M5, timeframe_seconds
+from synthetic_data import symbol_universe, rates_from_prices
+from resample import Resampler, resample_rates
+
+# M15, H1, H4 and D1, with the number of bars asked for
+TIMEFRAMES = {15: 40, 16385: 24, 16388: 12, 16408: 3}
+
+
+@pytest.fixture
+def simulated():
+    # Two weeks of M5 bars from a Friday, without the weekends and with random gaps
+    rates = rates_from_prices(symbol_universe(1, 288 * 17), missing=0.1, start=1_700_179_200, seed=2)[0]
+    rng = np.random.default_rng(2)
+    rates['high'] += rng.uniform(0, 1e-3, len(rates))
+    rates['low'] -= rng.uniform(0, 1e-3, len(rates))
+    rates['tick_volume'] = rng.integers(1, 100, len(rates))
+    weekday = (rates['time'] // 86400 + 3) % 7
+    rates = rates[weekday < 5]
+    return SimulatedBroker({'EURUSD': rates}, start=rates['time'][288 * 4])
+
+
+def test_incremental_bars_match_a_full_rebuild(simulated):
+    resampler = Resampler(simulated, TIMEFRAME_M5)
+    while True:
+        history = simulated.copy_rates_from_pos('EURUSD', TIMEFRAME_M5, 0, len(simulated.clock))
+        for timeframe, count in TIMEFRAMES.items():
+            expected = resample_rates(history, timeframe_seconds(timeframe))[-count:]
+            bars = resampler.copy_rates_from_pos('EURUSD', timeframe, 0, count)
+            np.testing.assert_array_equal(bars, expected, err_msg=f'{timeframe} at {simulated.now}')
+        # Every few bars, sometimes across a weekend
+        if not simulated.advance(7):
+            break
+
+    # One full build per timeframe, then only the newest bars
+    assert resampler.stats['misses'] == len(TIMEFRAMES)
+    assert resampler.stats['hits'] > 100 * len(TIMEFRAMES)
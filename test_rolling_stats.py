@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+from synthetic_data import cointegrated_pair
+from statistical_functions import ForexStats
+from rolling_stats import rolling_forex_stats
+
+
+@pytest.mark.parametrize('window, zscore_window', [(40, 10), (25, 25)])
+def test_rolling_forex_stats_matches_forexstats(window, zscore_window):
+    arr1, arr2 = cointegrated_pair(120, half_life=8, seed=5)
+    rolling = rolling_forex_stats(arr1, arr2, window, zscore_window)
+    assert all(len(values) == len(arr1) - window + 1 for values in rolling.values())
+
+    for j in range(len(arr1) - window + 1):
+        stats = ForexStats(arr1[j:j + window], arr2[j:j + window], hedge_model='ols')
+        expected = {
+            'correlation': stats.calculate_correlation(),
+            'is_cointegrated': stats.check_cointegration(),
+            'spread': stats.calculate_spread()[-1],
+            'zscore': stats.calculate_zscore()[-1],
+            'zscore_rolling': stats.calculate_zscore_rolling(zscore_window)[-1],
+            'half_life': stats.calculate_half_life(),
+            'hedge_ratio': stats.calculate_hedge_ratio(),
+        }
+        for name, value in expected.items():
+            assert rolling[name][j] == pytest.approx(value, rel=1e-6, abs=1e-9), (name, j)
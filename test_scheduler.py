@@ -0,0 +1,68 @@
+import time
+import asyncio
+import threading
+import pytest
+from broker import SimulatedBroker, set_broker
+from synthetic_data import symbol_universe, rates_from_prices
+from scheduler import CandleScheduler
+
+
+@pytest.fixture
+def simulated():
+    simulated = SimulatedBroker({'EURUSD': rates_from_prices(symbol_universe(1, 50))[0]})
+    previous = set_broker(simulated)
+    yield simulated
+    set_broker(previous)
+
+
+class Stage:
+    """
+    Blocking stage recording how many of its runs, and of the stages sharing its state, overlap.
+    """
+
+    def __init__(self, seconds: float, shared: dict) -> None:
+        self.seconds = seconds
+        self.shared = shared
+        self.runs = 0
+
+    def __call__(self) -> None:
+        with self.shared['lock']:
+            self.shared['running'] += 1
+            self.shared['overlap'] = max(self.shared['overlap'], self.shared['running'])
+        self.runs += 1
+        time.sleep(self.seconds)
+        with self.shared['lock']:
+            self.shared['running'] -= 1
+
+
+def test_timed_out_stage_is_not_run_twice(simulated):
+    shared = {'lock': threading.Lock(), 'running': 0, 'overlap': 0}
+    scan, entries = Stage(0.3, shared), Stage(0.0, shared)
+    scheduler = CandleScheduler(5, 'EURUSD', confirm_retry=0)
+    scheduler.add_stage('scan', scan, 0.05)
+    scheduler.add_stage('entries', entries, 1, after='scan')
+
+    async def run():
+        # Candles follow each other at once on a replay, well within the 0.3s of the scan
+        await scheduler.run(max_candles=5)
+        await asyncio.sleep(0.4)
+    asyncio.run(run())
+
+    assert scan.runs == 1
+    assert entries.runs == 0
+    assert shared['overlap'] == 1
+    assert scheduler.missed['scan'] == 1
+    assert scheduler.skipped == {'scan': 4, 'entries': 5}
+
+
+def test_stages_run_every_candle(simulated):
+    shared = {'lock': threading.Lock(), 'running': 0, 'overlap': 0}
+    reconcile, exits = Stage(0.0, shared), Stage(0.0, shared)
+    scheduler = CandleScheduler(5, 'EURUSD', confirm_retry=0)
+    scheduler.add_stage('reconcile', reconcile, 1)
+    scheduler.add_stage('exits', exits, 1, after='reconcile')
+    asyncio.run(scheduler.run(max_candles=5))
+
+    assert reconcile.runs == exits.runs == 5
+    assert shared['overlap'] == 1
+    assert scheduler.skipped == {'reconcile': 0, 'exits': 0}
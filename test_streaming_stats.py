@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from synthetic_data import cointegrated_pair
+from statistical_functions import ForexStats
+from streaming_stats import StreamingForexStats
+
+WINDOW, ZSCORE_WINDOW = 60, 21
+
+
+def assert_matches_batch(stream, arr1, arr2):
+    batch = ForexStats(arr1, arr2, hedge_model='ols')
+    np.testing.assert_allclose(stream.get_arrays(), (arr1, arr2), rtol=0, atol=1e-12)
+    assert stream.calculate_correlation() == pytest.approx(batch.calculate_correlation(), rel=1e-7)
+    assert stream.calculate_hedge_ratio() == pytest.approx(batch.calculate_hedge_ratio(), rel=1e-7)
+    assert stream.calculate_zscore() == pytest.approx(batch.calculate_zscore()[-1], rel=1e-6, abs=1e-9)
+    assert stream.calculate_zscore_rolling() == pytest.approx(batch.calculate_zscore_rolling(ZSCORE_WINDOW)[-1],
+                                                              rel=1e-6, abs=1e-9)
+    assert stream.calculate_half_life() == pytest.approx(batch.calculate_half_life(), rel=1e-6)
+
+
+@pytest.mark.parametrize('resync_every', [None, 10_000])
+def test_push_and_amend_match_forexstats(resync_every):
+    arr1, arr2 = cointegrated_pair(400, half_life=10, seed=7)
+    stream = StreamingForexStats(WINDOW, ZSCORE_WINDOW, resync_every).seed(arr1[:WINDOW], arr2[:WINDOW])
+    assert stream.is_ready
+
+    for end in range(WINDOW + 1, len(arr1) + 1):
+        # The forming bar first has a wrong close, then the final one
+        stream.push(arr1[end - 1] * 1.001, arr2[end - 1])
+        stream.amend(arr1[end - 1], arr2[end - 1])
+        if end % 37 == 0:
+            assert_matches_batch(stream, arr1[end - WINDOW:end], arr2[end - WINDOW:end])
+
+    # Relative drift of the running sums over the whole run (or since the last scheduled resync)
+    assert stream.resync() < 1e-9
+    assert_matches_batch(stream, arr1[-WINDOW:], arr2[-WINDOW:])
+
+
+def test_update_follows_the_bars():
+    arr1, arr2 = cointegrated_pair(300, half_life=10, seed=8)
+    times = np.arange(300) * 300
+    stream = StreamingForexStats(WINDOW, ZSCORE_WINDOW).seed(arr1[:WINDOW], arr2[:WINDOW], times[:WINDOW])
+
+    for end in range(WINDOW + 3, 301, 3):
+        # Every update repeats the last bar seen, with its final close, and brings three new ones
+        assert stream.update(times[end - 4:end], arr1[end - 4:end], arr2[end - 4:end])
+        assert stream.last_time == times[end - 1]
+    assert_matches_batch(stream, arr1[-WINDOW:], arr2[-WINDOW:])
+
+    # Bars that no longer reach back to the last one seen need a new seed
+    assert not stream.update(times[-1:] + 600, arr1[-1:], arr2[-1:])
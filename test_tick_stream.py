@@ -0,0 +1,65 @@
+import numpy as np
+from broker import TICKS_DTYPE, SimulatedBroker, set_broker
+from synthetic_data import symbol_universe, rates_from_prices
+from tick_stream import TickFeed, TickStream
+
+
+def burst(start_msc: int, n_ticks: int, spacing: int) -> np.ndarray:
+    ticks = np.zeros(n_ticks, dtype=TICKS_DTYPE)
+    ticks['time_msc'] = start_msc + spacing * np.arange(n_ticks)
+    ticks['time'] = ticks['time_msc'] // 1000
+    ticks['bid'] = 1.1 + 1e-5 * np.arange(n_ticks)
+    ticks['ask'] = ticks['bid'] + 1e-4
+    return ticks
+
+
+def test_poll_pages_through_a_busy_second():
+    # 50 ticks of each symbol within one second, five times the ticks of one request, then a second as busy
+    start = 1_600_000_000_000
+    eurusd = np.concatenate([burst(start, 50, 10), burst(start + 1000, 50, 10)])
+    feed = TickFeed({'EURUSD': eurusd, 'GBPUSD': burst(start + 5, 50, 10)}, start_msc=start + 999)
+    stream = TickStream([('EURUSD', 'GBPUSD')], source=feed, poll_count=10)
+    stream.poll()
+    assert stream.stats['ticks'] == 100
+
+    feed.advance(1000)
+    stream.poll()
+    assert stream.stats['ticks'] == 150
+    assert stream.buffers['EURUSD'].last_msc == start + 1490
+
+
+def test_unseeded_poll_starts_from_now():
+    # Without history to seed from, the ticks before the clock are left alone
+    start = 1_600_000_000_000
+    feed = TickFeed({'EURUSD': burst(start, 30, 100), 'GBPUSD': burst(start, 30, 100)}, start_msc=start + 1500)
+    stream = TickStream([('EURUSD', 'GBPUSD')], source=feed, poll_count=7)
+    stream.poll()
+    assert stream.stats['ticks'] == 12
+    feed.advance(2000)
+    stream.poll()
+    stream.poll()
+    assert stream.stats['ticks'] == 40
+
+
+def test_seed_connects_through_the_session():
+    class Terminal(SimulatedBroker):
+        # The MetaTrader5 package answers None until it is initialized
+        connected = False
+
+        def initialize(self):
+            self.connected = True
+            return True
+
+        def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+            return super().copy_rates_from_pos(symbol, timeframe, start_pos, count) if self.connected else None
+
+    rates = dict(zip(('EURUSD', 'GBPUSD'), rates_from_prices(symbol_universe(2, 400))))
+    terminal = Terminal(rates, start=rates['EURUSD']['time'][-1])
+    previous = set_broker(terminal)
+    try:
+        stream = TickStream([('EURUSD', 'GBPUSD')], bars=50).seed()
+    finally:
+        set_broker(previous)
+    buffer = stream.buffers['EURUSD']
+    assert buffer.bar_count == 50
+    assert buffer.last_msc == int(rates['EURUSD']['time'][-1]) * 1000 - 1
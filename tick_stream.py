@@ -0,0 +1,472 @@
+import json
+import time
+import logging
+import numpy as np
+from collections import deque
+from broker import TICKS_DTYPE, COPY_TICKS_ALL, TIMEFRAME_M5, ticks_between, timeframe_seconds, get_broker
+from bar_store import RATES_DTYPE
+from scheduler import METRICS_HISTORY
+from streaming_stats import StreamingForexStats
+from mt5_data import align_rates, get_rates_for_symbol, get_ticks
+from metrics import registry
+from constants import (TIMEFRAME, WINDOW_LENGTH, TICK_BUFFER_SIZE, TICK_POLL_COUNT, TICK_POLL_INTERVAL,
+                       ENTRY_ZSCORE, COINTEGRATED_PAIRS_FILE)
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+
+class SymbolBuffer:
+    def __init__(self, period: int, bars: int = WINDOW_LENGTH, capacity: int = TICK_BUFFER_SIZE) -> None:
+        """
+        Ticks and bars of one symbol in fixed-size ring buffers. Ticks are aggregated into bars of `period`
+        seconds as they arrive: the bar of the latest tick stays open, as the forming bar, until a tick of a
+        later bar closes it. Bars without any tick are filled with the previous close, so the bars of every
+        symbol follow the same time grid.
+
+        Args:
+            period (int): The length of a bar, in seconds.
+            bars (int): The closed bars kept.
+            capacity (int): The ticks kept.
+        """
+        self.period = period
+        self.tick_time = np.zeros(capacity, dtype=np.int64)
+        self.tick_bid = np.zeros(capacity)
+        self.tick_ask = np.zeros(capacity)
+        self.tick_head = 0
+        self.tick_count = 0
+
+        self.bars = np.zeros(bars, dtype=RATES_DTYPE)
+        self.bar_head = 0
+        self.bar_count = 0
+        self.forming = np.zeros(1, dtype=RATES_DTYPE)
+        self.has_forming = False
+
+        # A bar open time, the grid every bar is aligned on
+        self.origin = 0
+
+        # Time of the newest tick seen, and how many ticks of that millisecond were seen
+        self.last_msc = None
+        self.seen_at_last = 0
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Returns:
+            int: The memory held by the buffers, in bytes. It does not grow with the ticks received.
+        """
+        return self.tick_time.nbytes + self.tick_bid.nbytes + self.tick_ask.nbytes + self.bars.nbytes + self.forming.nbytes
+
+    @property
+    def forming_time(self) -> int:
+        """
+        Returns:
+            int: The open time of the forming bar, or None.
+        """
+        return int(self.forming['time'][0]) if self.has_forming else None
+
+    def seed(self, rates: np.ndarray, forming_time: int = None) -> None:
+        """
+        Fill the bars from history.
+
+        Args:
+            rates (np.ndarray): Closed bars, a structured array of RATES_DTYPE, oldest first.
+            forming_time (int): The open time of the forming bar, whose ticks are still to come. Defaults to the
+                bar after the last closed one.
+        """
+        self.bar_head = self.bar_count = 0
+        self.has_forming = False
+        self._push(np.asarray(rates).astype(RATES_DTYPE))
+        if forming_time is None and len(rates):
+            forming_time = int(rates['time'][-1]) + self.period
+        if forming_time is not None:
+            self.origin = forming_time
+            self.roll_to(forming_time)
+            self.last_msc, self.seen_at_last = forming_time * 1000 - 1, 0
+
+    def _push(self, records: np.ndarray) -> None:
+        # Append closed bars to the ring, keeping the newest ones
+        size = len(self.bars)
+        records = records[-size:]
+        positions = (self.bar_head + self.bar_count + np.arange(len(records))) % size
+        self.bars[positions] = records
+        overflow = max(0, self.bar_count + len(records) - size)
+        self.bar_head = (self.bar_head + overflow) % size
+        self.bar_count = min(size, self.bar_count + len(records))
+
+    def roll_to(self, bar_time: int) -> None:
+        """
+        Close the forming bar and open the bar of bar_time, filling the bars in between with the last close.
+        Nothing happens if the forming bar is not older than bar_time.
+
+        Args:
+            bar_time (int): The open time of the new forming bar, in seconds.
+        """
+        if self.has_forming and self.forming['time'][0] >= bar_time:
+            return
+        if self.has_forming:
+            close = self.forming['close'][0]
+            self._push(self.forming.copy())
+            # Only the newest bars fit in the ring, whatever the length of the gap
+            start = max(int(self.forming['time'][0]) + self.period, bar_time - len(self.bars) * self.period)
+            flat = np.zeros(max(0, (bar_time - start) // self.period), dtype=RATES_DTYPE)
+            flat['time'] = start + self.period * np.arange(len(flat))
+            flat['open'] = flat['high'] = flat['low'] = flat['close'] = close
+            self._push(flat)
+        elif self.bar_count:
+            close = self.bars['close'][(self.bar_head + self.bar_count - 1) % len(self.bars)]
+        else:
+            close = np.nan
+        self.forming[:] = (bar_time, close, close, close, close, 0, 0, 0)
+        self.has_forming = True
+
+    def ingest(self, ticks: np.ndarray) -> int:
+        """
+        Add polled ticks, skipping the ones already seen, and update the bars.
+
+        Args:
+            ticks (np.ndarray): Ticks sorted by time, a structured array of TICKS_DTYPE.
+
+        Returns:
+            int: The number of new ticks.
+        """
+        time_msc = ticks['time_msc']
+        if self.last_msc is not None and len(ticks):
+            new = time_msc > self.last_msc
+            new[np.flatnonzero(time_msc == self.last_msc)[self.seen_at_last:]] = True
+            ticks, time_msc = ticks[new], time_msc[new]
+        n = len(ticks)
+        if not n:
+            return 0
+
+        last = int(time_msc[-1])
+        at_last = int(np.count_nonzero(time_msc == last))
+        self.seen_at_last = at_last + (self.seen_at_last if last == self.last_msc else 0)
+        self.last_msc = last
+
+        # Tick ring, only the newest ticks are kept
+        capacity = len(self.tick_time)
+        kept = slice(max(0, n - capacity), n)
+        positions = (self.tick_head + np.arange(kept.start, n)) % capacity
+        self.tick_time[positions] = time_msc[kept]
+        self.tick_bid[positions] = ticks['bid'][kept]
+        self.tick_ask[positions] = ticks['ask'][kept]
+        self.tick_head = (self.tick_head + n) % capacity
+        self.tick_count = min(capacity, self.tick_count + n)
+
+        # Bars are built from the bid, as the terminal builds them; late ticks count in the forming bar
+        bid = ticks['bid']
+        bar_times = self.origin + (time_msc // 1000 - self.origin) // self.period * self.period
+        if self.has_forming:
+            bar_times = np.maximum(bar_times, self.forming['time'][0])
+        starts = np.flatnonzero(np.r_[True, bar_times[1:] != bar_times[:-1]])
+        ends = np.r_[starts[1:], n]
+        highs, lows = np.maximum.reduceat(bid, starts), np.minimum.reduceat(bid, starts)
+        for start, end, high, low in zip(starts.tolist(), ends.tolist(), highs.tolist(), lows.tolist()):
+            self.roll_to(int(bar_times[start]))
+            forming = self.forming[0]
+            if forming['tick_volume'] == 0:
+                forming['open'] = forming['high'] = forming['low'] = bid[start]
+            forming['high'] = max(forming['high'], high)
+            forming['low'] = min(forming['low'], low)
+            forming['close'] = bid[end - 1]
+            forming['tick_volume'] += end - start
+        return n
+
+    def get_ticks(self) -> tuple:
+        """
+        Returns:
+            tuple: The times in milliseconds, bids and asks of the kept ticks, oldest first.
+        """
+        order = (self.tick_head - self.tick_count + np.arange(self.tick_count)) % len(self.tick_time)
+        return self.tick_time[order], self.tick_bid[order], self.tick_ask[order]
+
+    def get_bars(self, forming: bool = True, since: int = None) -> np.ndarray:
+        """
+        Args:
+            forming (bool): Whether the forming bar is appended to the closed bars.
+            since (int): Only return the bars opened at or after this time, in seconds. Reading the few newest
+                bars this way costs the same whatever the size of the ring.
+
+        Returns:
+            np.ndarray: The bars, a structured array of RATES_DTYPE, oldest first.
+        """
+        count = self.bar_count
+        if since is not None and count:
+            # Bars are at least a period apart, so no more than this many can be that recent
+            newest = int(self.bars['time'][(self.bar_head + count - 1) % len(self.bars)])
+            count = min(count, max(0, (newest - since) // self.period + 1))
+        order = (self.bar_head + self.bar_count - count + np.arange(count)) % len(self.bars)
+        bars = self.bars[order]
+        if since is not None:
+            bars = bars[bars['time'] >= since]
+        if forming and self.has_forming:
+            bars = np.concatenate([bars, self.forming])
+        return bars
+
+
+class TickFeed:
+    def __init__(self, ticks: dict, rates: dict = None, timeframe: int = TIMEFRAME_M5, start_msc: int = None) -> None:
+        """
+        Simulated tick feed replaying recorded ticks on a clock in milliseconds that only moves when advance is
+        called, with the copy_ticks_from and copy_rates_from_pos functions of the terminal, so a TickStream can
+        read from it instead of polling the terminal.
+
+        Args:
+            ticks (dict): Recorded ticks of every symbol, structured arrays of TICKS_DTYPE sorted by time.
+            rates (dict): Optional recorded bars of every symbol, structured arrays of RATES_DTYPE, to seed from.
+            timeframe (int): The MT5 timeframe of the recorded bars.
+            start_msc (int): The first time of the clock, in milliseconds. Defaults to the first recorded tick.
+        """
+        # Contiguous copies, searching a field of a structured array would copy it on every call
+        self.ticks = {symbol: tuple(np.ascontiguousarray(records[field]) for field in ('time_msc', 'bid', 'ask'))
+                      for symbol, records in ticks.items()}
+        self.rates = rates or {}
+        self.timeframe = timeframe
+        if start_msc is None:
+            start_msc = min((int(records[0][0]) for records in self.ticks.values() if len(records[0])), default=0)
+        self.now_msc = start_msc
+
+    def advance(self, milliseconds: int) -> bool:
+        """
+        Move the clock forward.
+
+        Returns:
+            bool: False once every recorded tick was replayed.
+        """
+        self.now_msc += milliseconds
+        return any(len(records[0]) and records[0][-1] > self.now_msc for records in self.ticks.values())
+
+    @property
+    def now(self) -> int:
+        """
+        Returns:
+            int: The time of the clock, in seconds.
+        """
+        return self.now_msc // 1000
+
+    def copy_ticks_from(self, symbol, date_from, count, flags=COPY_TICKS_ALL):
+        if symbol not in self.ticks:
+            return None
+        return ticks_between(*self.ticks[symbol], date_from, self.now_msc, count)
+
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        if symbol not in self.rates or timeframe != self.timeframe:
+            return None
+        bars = self.rates[symbol]
+        end = np.searchsorted(bars['time'], self.now_msc // 1000, side='right') - start_pos
+        return bars[max(0, end - count):max(0, end)].copy()
+
+
+class TickStream:
+    def __init__(self, pairs: list, timeframe: int = TIMEFRAME, bars: int = WINDOW_LENGTH,
+                 capacity: int = TICK_BUFFER_SIZE, poll_count: int = TICK_POLL_COUNT, source=None) -> None:
+        """
+        Intra-candle signals of a set of pairs. Every poll fetches the ticks of every symbol since the last
+        one, aggregates them into bars on the fly, and feeds the forming bar into the streaming statistics of
+        every pair, so the z-score follows the market between candle closes. Memory is bounded by the ring
+        buffers whatever the number of ticks received.
+
+        Args:
+            pairs (list): The pairs, lists of two symbols.
+            timeframe (int): The MT5 timeframe of the bars.
+            bars (int): The closed bars kept per symbol, the window of the statistics.
+            capacity (int): The ticks kept per symbol.
+            poll_count (int): The most ticks fetched per symbol and request, more when a single second holds
+                more ticks than that.
+            source: An object with the copy_ticks_from and copy_rates_from_pos functions of the terminal, e.g. a
+                TickFeed. Defaults to the backend in use, through the MT5 session.
+        """
+        self.pairs = [tuple(pair) for pair in pairs]
+        self.symbols = list(dict.fromkeys(symbol for pair in self.pairs for symbol in pair))
+        self.timeframe = timeframe
+        self.period = timeframe_seconds(timeframe)
+        self.window = bars
+        self.poll_count = poll_count
+        self.source = source
+        self.buffers = {symbol: SymbolBuffer(self.period, bars, capacity) for symbol in self.symbols}
+        self.streams = {}
+        self.stats = {'polls': 0, 'ticks': 0, 'latency': deque(maxlen=METRICS_HISTORY)}
+
+    def _fetch_rates(self, symbol: str, count: int) -> np.ndarray:
+        if self.source is None:
+            return get_rates_for_symbol(symbol, self.timeframe, count)
+        return self.source.copy_rates_from_pos(symbol, self.timeframe, 0, count)
+
+    def _fetch_ticks(self, symbol: str, date_from: int, count: int) -> np.ndarray:
+        if self.source is None:
+            return get_ticks(symbol, date_from, count)
+        ticks = self.source.copy_ticks_from(symbol, date_from, count, COPY_TICKS_ALL)
+        return np.empty(0, dtype=TICKS_DTYPE) if ticks is None else ticks
+
+    def now(self) -> int:
+        """
+        Returns:
+            int: The current time in seconds, on the clock of the source when it replays a recording.
+        """
+        source = self.source if self.source is not None else get_broker()
+        return int(getattr(source, 'now', time.time()))
+
+    def seed(self) -> 'TickStream':
+        """
+        Fill the bars of every symbol from history. The newest bar returned is still forming, so it is left out
+        and rebuilt from its ticks by the next poll.
+
+        Returns:
+            TickStream: The instance.
+        """
+        for symbol, buffer in self.buffers.items():
+            rates = self._fetch_rates(symbol, self.window + 1)
+            if rates is None or not len(rates):
+                logger.error(f"No history to seed the ticks of {symbol} from")
+                continue
+            buffer.seed(rates[:-1], int(rates['time'][-1]))
+        self.streams.clear()
+        return self
+
+    def poll(self) -> dict:
+        """
+        Fetch the new ticks of every symbol and update the signals of the pairs they move.
+
+        Returns:
+            dict: The signal of every updated pair, see signal.
+        """
+        updated = set()
+        received_at = None
+        for symbol, buffer in self.buffers.items():
+            # A symbol without history to seed from starts from now rather than from the oldest ticks kept
+            if buffer.last_msc is None:
+                buffer.last_msc, buffer.seen_at_last = self.now() * 1000 - 1, 0
+            # Whole seconds before the last tick seen, the ticks already seen are skipped by ingest
+            date_from = buffer.last_msc // 1000
+            count = self.poll_count
+            while True:
+                ticks = self._fetch_ticks(symbol, date_from, count)
+                new = buffer.ingest(ticks)
+                if new and received_at is None:
+                    received_at = time.perf_counter()
+                self.stats['ticks'] += new
+                if new:
+                    updated.add(symbol)
+                # A shorter answer holds every tick up to now, a full one may have more behind it
+                if len(ticks) < count:
+                    break
+                # Requests start on a whole second, so when the last tick is still in the second the request
+                # started on, the next one must reach past every tick of that second already fetched
+                next_from = buffer.last_msc // 1000
+                count = len(ticks) + self.poll_count if next_from == date_from else self.poll_count
+                date_from = next_from
+        self.stats['polls'] += 1
+
+        signals = {pair: self.signal(pair) for pair in self.pairs if updated.intersection(pair)}
+        if received_at is not None:
+            latency = time.perf_counter() - received_at
+            self.stats['latency'].append(latency)
+            registry.observe('tick_stream.tick_to_signal', latency)
+        return signals
+
+    def prices(self, pair: tuple, since: int = None) -> tuple:
+        """
+        Get the aligned closes of a pair, the forming bar last. The symbol whose forming bar is older is rolled
+        forward first, so both end on the same bar.
+
+        Args:
+            pair (tuple): The two symbols.
+            since (int): Only return the bars opened at or after this time, in seconds.
+
+        Returns:
+            tuple: A 1-D int64 array of bar times in seconds and a 2-D float array with one column per symbol.
+        """
+        buffers = [self.buffers[symbol] for symbol in pair]
+        newest = max((buffer.forming_time for buffer in buffers if buffer.has_forming), default=None)
+        if newest is not None:
+            for buffer in buffers:
+                buffer.roll_to(newest)
+        bars = [buffer.get_bars(since=since) for buffer in buffers]
+        return align_rates([b['time'] for b in bars], [b['close'] for b in bars])
+
+    def signal(self, pair: tuple) -> dict:
+        """
+        Update the streaming statistics of a pair with its latest bars, the forming one included.
+
+        Returns:
+            dict: The time of the forming bar, the hedge ratio, the z-score and the rolling z-score of the pair.
+        """
+        stream = self.streams.get(pair)
+        if stream is not None:
+            # Only the bars from the last one the statistics saw on, usually the forming bar alone
+            times, prices = self.prices(pair, since=stream.last_time)
+            if not stream.update(times, prices[:, 0], prices[:, 1]):
+                stream = None
+        if stream is None:
+            times, prices = self.prices(pair)
+            stream = StreamingForexStats(self.window).seed(prices[:, 0], prices[:, 1], times)
+            self.streams[pair] = stream
+        return {
+            'time': int(times[-1]) if len(times) else None,
+            'hedge_ratio': stream.calculate_hedge_ratio(),
+            'zscore': stream.calculate_zscore(),
+            'zscore_rolling': stream.calculate_zscore_rolling(),
+        }
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Returns:
+            int: The memory held by the tick and bar buffers and the pair statistics, in bytes.
+        """
+        streams = sum(stream.buffer1.nbytes + stream.buffer2.nbytes for stream in self.streams.values())
+        return sum(buffer.nbytes for buffer in self.buffers.values()) + streams
+
+    def summary(self) -> dict:
+        """
+        Returns:
+            dict: The number of polls and ticks, the mean and max tick-to-signal latency in seconds over the
+                last polls, and the memory held in bytes.
+        """
+        latency = self.stats['latency']
+        return {
+            'polls': self.stats['polls'],
+            'ticks': self.stats['ticks'],
+            'latency_mean': sum(latency) / len(latency) if latency else None,
+            'latency_max': max(latency) if latency else None,
+            'nbytes': self.nbytes,
+        }
+
+
+def run_tick_stream(pairs: list = None, interval: float = TICK_POLL_INTERVAL, max_polls: int = None,
+                    entry_zscore: float = ENTRY_ZSCORE) -> TickStream:
+    """
+    Poll the ticks of the cointegrated pairs and log every pair whose z-score crosses the entry threshold
+    inside the candle.
+
+    Args:
+        pairs (list): The pairs to follow. Defaults to the pairs of COINTEGRATED_PAIRS_FILE.
+        interval (float): Seconds between the start of two polls.
+        max_polls (int): Stop after this many polls. None polls until stopped.
+        entry_zscore (float): The absolute z-score from which a pair is reported.
+
+    Returns:
+        TickStream: The stream, e.g. for its summary.
+    """
+    if pairs is None:
+        try:
+            with open(COINTEGRATED_PAIRS_FILE, 'r') as file:
+                pairs = [entry['pair'] if isinstance(entry, dict) else entry for entry in json.load(file)]
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            logger.error(f"Error reading {COINTEGRATED_PAIRS_FILE}: {str(e)}")
+            pairs = []
+
+    stream = TickStream(pairs).seed()
+    polls = 0
+    while max_polls is None or polls < max_polls:
+        started = time.perf_counter()
+        for pair, signal in stream.poll().items():
+            if abs(signal['zscore']) >= entry_zscore:
+                logger.info("Intra-candle entry signal for %s: z-score %.2f, hedge ratio %.4f",
+                            pair, signal['zscore'], signal['hedge_ratio'])
+        polls += 1
+        time.sleep(max(0.0, interval - (time.perf_counter() - started)))
+
+    logger.info(f"Tick stream summary: {stream.summary()}")
+    return stream